@@ -3,7 +3,7 @@ import pandas as pd
 import json
 import tempfile
 import os
-from upi_search_batch import UPISearchBatch
+from upi_search_batch import UPISearchBatch, FLAT_UPI_SLOTS, PAIR_KEY_SLOT
 
 class TestBidirectionalCurrencyMatching(unittest.TestCase):
     def setUp(self):
@@ -170,6 +170,93 @@ class TestBidirectionalCurrencyMatching(unittest.TestCase):
         # Different currencies should not match
         self.assertFalse(self.processor.match_currencies_bidirectional(trade_attrs, upi_different))
     
+    def test_canonical_currency_pair_index(self):
+        """Test that loaded UPIs are indexed by an order-independent currency pair key"""
+        # USD/EUR and EUR/USD UPIs share one canonical key
+        self.assertEqual(self.processor.currency_pair_key('USD', 'EUR'), ('EUR', 'USD'))
+        self.assertEqual(self.processor.currency_pair_key('eur', 'usd'), ('EUR', 'USD'))
+        self.assertIsNone(self.processor.currency_pair_key('USD', ''))
+
+        indexed_codes = [upi['upiCode'] for upi in self.processor.get_upis_for_currency_pair(('EUR', 'USD'))]
+        self.assertEqual(indexed_codes, ['USD_EUR_FWD_001', 'EUR_USD_FWD_001'])
+        self.assertEqual(len(self.processor.get_upis_for_currency_pair(('CNY', 'USD'))), 1)
+        self.assertEqual(len(self.processor.get_upis_for_currency_pair(('GBP', 'USD'))), 0)
+
+    def test_negative_lookup_for_trades_with_no_possible_upi(self):
+        """Test that trades sharing no attribute value with any UPI are detected up front"""
+        unknown = {'Asset Class': 'Commodity', 'TradeNotionalCurrency': 'XAU', 'TradeOtherNotionalCurrency': 'XAG'}
+        unknown_key = self.processor.get_trade_currency_pair_key(unknown)
+        self.assertFalse(self.processor.can_match_any_upi(unknown, 'FX', unknown_key))
+        self.assertTrue(all(
+            self.processor.calculate_match_score(unknown, upi, 'FX') == 0
+            for upi in self.sample_upi_data['upis']
+        ))
+
+        # A known currency pair in either order, or one known attribute, can still score
+        known_pair = {'TradeNotionalCurrency': 'USD', 'TradeOtherNotionalCurrency': 'GBP'}
+        self.assertFalse(self.processor.can_match_any_upi(known_pair, 'FX', self.processor.get_trade_currency_pair_key(known_pair)))
+        known_pair['TradeOtherNotionalCurrency'] = 'EUR'
+        self.assertTrue(self.processor.can_match_any_upi(known_pair, 'FX', self.processor.get_trade_currency_pair_key(known_pair)))
+        unknown['Delivery Type'] = 'cash'
+        self.assertTrue(self.processor.can_match_any_upi(unknown, 'FX', unknown_key))
+    
+    def test_flat_upi_records(self):
+        """Test that UPIs are flattened once into upper-cased slots with a currency-pair key"""
+        upis = self.processor.upi_data['upis']
+        self.assertEqual(len(self.processor.flat_upis), len(upis))
+
+        flat = self.processor.flat_upis[0]
+        self.assertEqual(flat[FLAT_UPI_SLOTS['Instrument Type']], 'FORWARD')
+        self.assertEqual(flat[PAIR_KEY_SLOT], ('EUR', 'USD'))
+        self.assertIsNone(flat[FLAT_UPI_SLOTS['Reference Rate']])
+
+        # Raw records and flat records score the same
+        trade_attrs = {'Instrument Type': 'forward', 'TradeNotionalCurrency': 'EUR', 'TradeOtherNotionalCurrency': 'USD'}
+        for upi, flat in zip(upis, self.processor.flat_upis):
+            self.assertEqual(
+                self.processor.calculate_match_score(trade_attrs, dict(upi), 'FX'),
+                self.processor.calculate_match_score(trade_attrs, flat, 'FX')
+            )
+    
+    def test_planned_lookups_match_full_scan(self):
+        """Test that scoring only the planned lookups finds the same best UPI as scoring every UPI"""
+        selectivity = self.processor.selectivity
+        self.assertEqual(selectivity.record_count, 4)
+        self.assertEqual(len(selectivity.lookup(PAIR_KEY_SLOT, ('EUR', 'USD'))), 2)
+        self.assertEqual(selectivity.distinct_count(FLAT_UPI_SLOTS['Delivery Type']), 2)
+
+        trades = [
+            {'Instrument Type': 'FORWARD', 'TradeNotionalCurrency': 'USD', 'TradeOtherNotionalCurrency': 'EUR'},
+            {'Instrument Type': 'FORWARD', 'Delivery Type': 'Cash', 'TradeNotionalCurrency': 'USD', 'TradeOtherNotionalCurrency': 'CNY'},
+            {'Delivery Type': 'Physical', 'TradeNotionalCurrency': 'XAU', 'TradeOtherNotionalCurrency': 'XAG'},
+            {'Asset Class': 'Commodity'},
+        ]
+        for trade_attrs in trades:
+            trade_pair_key = self.processor.get_trade_currency_pair_key(trade_attrs)
+            plan = self.processor.build_scoring_plan(trade_attrs, 'FX')
+            full_scan = self.processor.search_all_upis(plan, trade_pair_key)
+            planned = self.processor.search_planned_lookups(plan, trade_pair_key)
+            if planned is not None:
+                self.assertEqual(planned[:2], full_scan[:2], trade_attrs)
+
+        # A trade matching its product's UPI well enough is resolved within that product
+        trade_attrs = {'Product Type': 'Non_Standard', 'Delivery Type': 'Cash', 'Settlement Currency': 'CNY',
+                       'TradeNotionalCurrency': 'USD', 'TradeOtherNotionalCurrency': 'CNY'}
+        trade_pair_key = self.processor.get_trade_currency_pair_key(trade_attrs)
+        plan = self.processor.build_scoring_plan(trade_attrs, 'FX')
+        self.assertEqual(self.processor.get_trade_product_stats(plan).record_count, 1)
+        best_match, best_score, candidates, lookup_plan = self.processor.search_planned_lookups(plan, trade_pair_key)
+        self.assertEqual((best_match, best_score), self.processor.search_all_upis(plan, trade_pair_key)[:2])
+        self.assertEqual(candidates, 1)
+        self.assertTrue(lookup_plan.endswith(" in product"))
+
+        # The rare currency pair is looked up before the instrument type every UPI shares
+        trade_attrs = trades[1]
+        plan = self.processor.build_scoring_plan(trade_attrs, 'FX')
+        lookups = self.processor.plan_candidate_lookups(plan, self.processor.get_trade_currency_pair_key(trade_attrs))
+        names = [name for name, _, _, _ in lookups]
+        self.assertLess(names.index('Currency Pair'), names.index('Instrument Type'))
+    
     def test_cnh_currency_normalization_in_bidirectional_matching(self):
         """Test that CNH is properly normalized to CNY in bidirectional matching"""
         self.processor.apply_cnh_handling()
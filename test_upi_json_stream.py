@@ -0,0 +1,62 @@
+import unittest
+import json
+import tempfile
+import os
+import io
+import contextlib
+from upi_json_stream import iter_json_array, JSONRecordList
+from upi_search_batch import UPISearchBatch, FLAT_UPI_SLOTS
+
+class TestJSONStream(unittest.TestCase):
+    def setUp(self):
+        """Create a UPI document with other top-level keys around the array"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.document = {
+            "meta": {"note": "not [the] upis", "upis": [{"upiCode": "NESTED"}]},
+            "upis": [
+                {"upiCode": "UPI_1", "assetClass": "ForeignExchange", "underlying": {"currencyPair": "EUR/USD"}},
+                {"upiCode": "UPI_2 é", "instrumentType": "Forward", "notional": 1234567.25e-3},
+                {"upiCode": "UPI_3", "underlying": {"currencyPair": "USD/EUR"}},
+            ],
+            "count": 3,
+        }
+
+    def tearDown(self):
+        """Remove temporary files"""
+        self.temp_dir.cleanup()
+
+    def test_items_split_across_chunks(self):
+        """Test that array items are decoded the same whatever the read chunk size"""
+        for indent in [None, 2]:
+            text = json.dumps(self.document, indent=indent, ensure_ascii=False)
+            for chunk_size in [1, 3, 17, 1 << 20]:
+                items = list(iter_json_array(io.StringIO(text), "upis", chunk_size))
+                self.assertEqual([value for _, value in items], self.document["upis"])
+                self.assertEqual([json.loads(item_text) for item_text, _ in items], self.document["upis"])
+
+        self.assertEqual(list(iter_json_array(io.StringIO('{"other": [1, 2]}'), "upis")), [])
+        for invalid in ['[1]', '{"upis": [1, 2', '{"upis": [{"a": 1} {"b": 2}]}']:
+            with self.assertRaises(ValueError):
+                list(iter_json_array(io.StringIO(invalid), "upis", 4))
+
+    def test_batch_load_keeps_records_as_text(self):
+        """Test that the batch loader indexes streamed UPIs and decodes details on access"""
+        path = os.path.join(self.temp_dir.name, "upis.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.document, f, indent=2)
+
+        processor = UPISearchBatch()
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(processor.load_upi_data(path))
+        upis = processor.upi_data['upis']
+        self.assertIsInstance(upis, JSONRecordList)
+        self.assertEqual(list(upis), self.document["upis"])
+        self.assertEqual(upis[1], self.document["upis"][1])
+        # Kept without the file's indentation
+        self.assertEqual(upis.texts[1], json.dumps(self.document["upis"][1], separators=(',', ':'), ensure_ascii=False))
+        self.assertEqual(len(processor.flat_upis), 3)
+        self.assertEqual([upi['upiCode'] for upi in processor.get_upis_for_currency_pair(('EUR', 'USD'))], ['UPI_1', 'UPI_3'])
+        self.assertTrue(processor.selectivity.lookup(FLAT_UPI_SLOTS['Instrument Type'], 'FORWARD'))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+import json
+import tempfile
+import os
+import gzip
+import bz2
+import lzma
+import zipfile
+import threading
+from upi_records import is_valid_upi_record, split_file_ranges, ingest_records, open_input_file, LoadCancelled
+
+def make_record(upi, asset_class="Foreign_Exchange", use_case="Forward", status="New"):
+    """Build a minimal DSB RECORDS entry"""
+    return {
+        "TemplateVersion": 1,
+        "Header": {"AssetClass": asset_class, "InstrumentType": "Forward", "UseCase": use_case, "Level": "UPI"},
+        "Identifier": {"UPI": upi, "Status": status, "LastUpdateDateTime": "2024-01-01T00:00:00"},
+        "Derived": {"ShortName": upi},
+        "Attributes": {"NotionalCurrency": "USD", "OtherNotionalCurrency": "EUR"}
+    }
+
+class TestRecordsIngest(unittest.TestCase):
+    def setUp(self):
+        """Write two RECORDS files, the second updating one UPI from the first"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+        self.day1_path = os.path.join(self.temp_dir.name, "day1.RECORDS")
+        with open(self.day1_path, 'w', encoding='utf-8') as f:
+            for i in range(200):
+                f.write(json.dumps(make_record(f"QZ{i:010d}")) + "\n")
+            f.write(json.dumps(make_record("QZRATES00001", asset_class="Rates", use_case="Basis")) + "\n")
+            f.write("{broken json\n")
+            f.write(json.dumps({"Header": {}}) + "\n")
+
+        self.day2_path = os.path.join(self.temp_dir.name, "day2.RECORDS")
+        with open(self.day2_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(make_record("QZ0000000005", status="Updated")) + "\n")
+
+    def tearDown(self):
+        """Remove temporary files"""
+        self.temp_dir.cleanup()
+
+    def test_is_valid_upi_record(self):
+        """Test structural validation of RECORDS entries"""
+        self.assertTrue(is_valid_upi_record(make_record("QZ0000000001")))
+        self.assertFalse(is_valid_upi_record({"Header": {}}))
+        self.assertFalse(is_valid_upi_record(make_record("")))
+
+    def test_split_file_ranges_aligned_to_lines(self):
+        """Test that byte ranges cover the file and start on line boundaries"""
+        ranges = split_file_ranges(self.day1_path, chunk_size=1000)
+        self.assertGreater(len(ranges), 1)
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], os.path.getsize(self.day1_path))
+
+        with open(self.day1_path, 'rb') as f:
+            data = f.read()
+        for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, next_start)
+            self.assertEqual(data[start - 1:start] if start else b"\n", b"\n")
+
+    def test_chunked_ingest_matches_single_chunk(self):
+        """Test that splitting a file into ranges yields the same dataset"""
+        whole, whole_stats = ingest_records(self.day1_path, workers=1)
+        chunked, chunked_stats = ingest_records(self.day1_path, workers=2, chunk_size=1000)
+
+        self.assertEqual(whole, chunked)
+        self.assertEqual(len(whole), 201)
+        self.assertEqual(whole_stats["rejected"], 2)
+        self.assertEqual(chunked_stats["rejected"], 2)
+        self.assertGreater(chunked_stats["chunks"], 1)
+
+    def test_ingest_progress_and_cancel(self):
+        """Test progress reports during an ingest and stopping it through the cancel event"""
+        reports = []
+        ingest_records(self.day1_path, workers=2, chunk_size=1000, progress=reports.append)
+        self.assertGreater(len(reports), 1)
+        self.assertEqual(reports[-1]["bytes"], os.path.getsize(self.day1_path))
+        self.assertEqual(reports[-1]["total_bytes"], os.path.getsize(self.day1_path))
+        self.assertEqual((reports[-1]["parsed"], reports[-1]["rejected"]), (201, 2))
+
+        cancel_event = threading.Event()
+        cancel_event.set()
+        with self.assertRaises(LoadCancelled):
+            ingest_records(self.day1_path, workers=1, chunk_size=1000, cancel_event=cancel_event)
+
+    def test_directory_ingest_deduplicates_by_upi(self):
+        """Test that a directory of files merges into one dataset keyed by UPI"""
+        records, stats = ingest_records(self.temp_dir.name, asset_class_filter="Foreign_Exchange", workers=1)
+
+        self.assertEqual(stats["files"], 2)
+        self.assertEqual(stats["duplicates"], 1)
+        self.assertEqual(len(records), 200)
+
+        updated = next(r for r in records if r["Identifier"]["UPI"] == "QZ0000000005")
+        self.assertEqual(updated["Identifier"]["Status"], "Updated")
+
+class TestCompressedInput(unittest.TestCase):
+    def setUp(self):
+        """Write the same RECORDS content plain and in every supported compression format"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.content = "".join(json.dumps(make_record(f"QZ{i:010d}")) + "\n" for i in range(500)).encode('utf-8')
+
+        self.plain_path = os.path.join(self.temp_dir.name, "upi.RECORDS")
+        with open(self.plain_path, 'wb') as f:
+            f.write(self.content)
+
+        self.compressed_paths = []
+        for suffix, opener in [(".gz", gzip.open), (".bz2", bz2.open), (".xz", lzma.open)]:
+            path = self.plain_path + suffix
+            with opener(path, 'wb') as f:
+                f.write(self.content)
+            self.compressed_paths.append(path)
+
+        zip_path = self.plain_path + ".zip"
+        with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("upi.RECORDS", self.content)
+        self.compressed_paths.append(zip_path)
+
+    def tearDown(self):
+        """Remove temporary files"""
+        self.temp_dir.cleanup()
+
+    def test_open_input_file_streams_decompressed_content(self):
+        """Test that every compression format reads back the original bytes"""
+        for path in self.compressed_paths:
+            with open_input_file(path, 'rb') as f:
+                # Small reads exercise the block hand-over from the reader thread
+                chunks = []
+                while True:
+                    chunk = f.read(4096)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+            self.assertEqual(b"".join(chunks), self.content, path)
+
+    def test_ingest_compressed_matches_plain(self):
+        """Test that compressed RECORDS files ingest to the same dataset as the plain file"""
+        expected, _ = ingest_records(self.plain_path, workers=1)
+        for path in self.compressed_paths:
+            records, stats = ingest_records(path, workers=1)
+            self.assertEqual(records, expected, path)
+            self.assertEqual(stats["rejected"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import os
+import io
+import time
+import tempfile
+import contextlib
+from upi_reload import UPIDataset, UPISourceWatcher, source_signature
+
+class TestUPISourceWatcher(unittest.TestCase):
+    def setUp(self):
+        """Write a RECORDS file to watch"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "upis.RECORDS")
+        self.write("first\n")
+        self.builds = []
+
+    def tearDown(self):
+        """Remove temporary files"""
+        self.temp_dir.cleanup()
+
+    def write(self, text):
+        with open(self.path, 'w') as f:
+            f.write(text)
+
+    def build(self, version, cancel_event):
+        """Build a dataset holding the file content, failing on "bad" content"""
+        with open(self.path) as f:
+            content = f.read()
+        if content.startswith("bad"):
+            raise ValueError("No valid UPI records found")
+        self.builds.append(version)
+        return UPIDataset(self.path, content, None, None, None)
+
+    def wait_for_reload(self, watcher, timeout=5.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            dataset = watcher.take_reload()
+            if dataset is not None:
+                return dataset
+            time.sleep(0.01)
+        return None
+
+    def test_rebuilds_changed_source_in_background(self):
+        """Test that a change is rebuilt as the next version and an invalid file keeps the old data"""
+        watcher = UPISourceWatcher(self.path, source_signature(self.path), self.build, interval=0.02)
+        watcher.start()
+        try:
+            # Nothing is rebuilt while the file is unchanged
+            time.sleep(0.1)
+            self.assertIsNone(watcher.take_reload())
+
+            self.write("second version\n")
+            dataset = self.wait_for_reload(watcher)
+            self.assertEqual(dataset.upi_data, "second version\n")
+            self.assertEqual(dataset.version, 2)
+            self.assertEqual(dataset.signature, source_signature(self.path))
+            self.assertTrue(dataset.label().startswith("2 (loaded "))
+
+            # A file that fails to load is reported and skipped until it changes again
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                self.write("bad file\n")
+                time.sleep(0.2)
+            self.assertIsNone(watcher.take_reload())
+            self.assertIn("No valid UPI records found", output.getvalue())
+            self.assertEqual(watcher.error, "No valid UPI records found")
+
+            self.write("third version, longer\n")
+            dataset = self.wait_for_reload(watcher)
+            self.assertEqual(dataset.upi_data, "third version, longer\n")
+            self.assertEqual(dataset.version, 3)
+            self.assertIsNone(watcher.error)
+        finally:
+            watcher.stop()
+        self.assertEqual(self.builds, [2, 3])
+
+        # A missing source has no signature
+        self.assertIsNone(source_signature(os.path.join(self.temp_dir.name, "missing.RECORDS")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+import json
+import copy
+import tempfile
+import os
+from upi_schema import compile_schema, get_record_validator, DEFAULT_SCHEMA_DIR
+from upi_records import ingest_records
+from upi_search_store import UPIRecordStore
+
+def make_forward(upi):
+    """Build a DSB RECORDS entry that satisfies the FX Forward template"""
+    return {
+        "TemplateVersion": 1,
+        "Header": {"AssetClass": "Foreign_Exchange", "InstrumentType": "Forward", "UseCase": "Forward", "Level": "UPI"},
+        "Identifier": {"UPI": upi, "Status": "New", "LastUpdateDateTime": "2024-01-01T00:00:00"},
+        "Derived": {"ClassificationType": "JFTXFP", "ShortName": "NA/Fwd USD EUR", "UnderlierName": "USD EUR",
+                    "UnderlyingAssetType": "Forward", "ReturnorPayoutTrigger": "Forward price of underlying instrument",
+                    "CFIDeliveryType": "Physical"},
+        "Attributes": {"NotionalCurrency": "USD", "OtherNotionalCurrency": "EUR", "DeliveryType": "PHYS"}
+    }
+
+class TestRecordSchemas(unittest.TestCase):
+    def setUp(self):
+        """Write a RECORDS file with valid records and records breaking the template in different ways"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.records_path = os.path.join(self.temp_dir.name, "day1.RECORDS")
+
+        invalid = []
+        for field, value in [("DeliveryType", "SOMETIMES"), ("Unexpected", "x")]:
+            record = make_forward(f"QZBAD{len(invalid):07d}")
+            record["Attributes"][field] = value
+            invalid.append(record)
+        record = make_forward("QZBAD0000002")
+        del record["Derived"]["ShortName"]
+        invalid.append(record)
+
+        with open(self.records_path, 'w', encoding='utf-8') as f:
+            for i in range(20):
+                f.write(json.dumps(make_forward(f"QZ{i:010d}")) + "\n")
+            for record in invalid:
+                f.write(json.dumps(record) + "\n")
+            f.write("{broken json\n")
+
+    def tearDown(self):
+        """Remove temporary files"""
+        self.temp_dir.cleanup()
+
+    def test_compiled_checks(self):
+        """Test the compiled keywords: type, enum, range, not, required, closed objects and dependencies"""
+        check = compile_schema({
+            "type": "object",
+            "properties": {
+                "Term": {"type": "integer", "not": {"type": "integer", "enum": [0]}, "minimum": -9, "maximum": 9},
+                "Unit": {"type": "string", "enum": ["DAYS", "MNTH"]},
+                "Version": {"type": ["string", "integer"]},
+            },
+            "required": ["Unit"],
+            "additionalProperties": False,
+            "dependencies": {"Term": ["Unit"]},
+        })
+        self.assertIsNone(check({"Unit": "DAYS", "Term": 3, "Version": "1"}))
+        self.assertEqual(check({"Term": 3}), "record: missing Unit")
+        self.assertEqual(check({"Unit": "YEAR"}), "Unit: value not allowed")
+        self.assertEqual(check({"Unit": "DAYS", "Term": 0}), "Term: value not allowed")
+        self.assertEqual(check({"Unit": "DAYS", "Term": 10}), "Term: above maximum")
+        self.assertEqual(check({"Unit": "DAYS", "Term": True}), "Term: expected integer")
+        self.assertEqual(check({"Unit": "DAYS", "Version": 1.5}), "Version: expected string or integer")
+        self.assertEqual(check({"Unit": "DAYS", "Other": 1}), "record: unexpected field Other")
+
+    def test_bundled_templates(self):
+        """Test that every bundled template compiles and checks records of its product"""
+        validator = get_record_validator()
+        self.assertEqual(len(validator.templates), 13)
+        self.assertIsNone(validator.check(make_forward("QZ0000000001")))
+
+        record = make_forward("QZ0000000001")
+        record["Identifier"]["Status"] = "Unknown"
+        self.assertEqual(validator.check(record), "Identifier.Status: value not allowed")
+
+        # Products without a bundled template are not checked
+        record = copy.deepcopy(record)
+        record["Header"]["UseCase"] = "Exotic"
+        self.assertIsNone(validator.check(record))
+
+    def test_ingest_counts_and_samples_rejects(self):
+        """Test validated ingest in memory and into the store, with rejects counted by reason"""
+        records, stats = ingest_records(self.records_path, workers=1, schema_dir=DEFAULT_SCHEMA_DIR)
+        self.assertEqual(len(records), 20)
+        self.assertEqual(stats["rejected"], 4)
+        self.assertEqual(stats["rejects"].reasons, {
+            "Attributes.DeliveryType: value not allowed": 1,
+            "Attributes: unexpected field Unexpected": 1,
+            "Derived: missing ShortName": 1,
+            "invalid JSON": 1,
+        })
+        self.assertEqual(len(stats["rejects"].samples), 4)
+        self.assertTrue(stats["rejects"].samples[0].startswith("day1.RECORDS byte "))
+
+        # Without the templates only the basic structure is checked
+        records, stats = ingest_records(self.records_path, workers=1)
+        self.assertEqual((len(records), stats["rejected"]), (23, 1))
+
+        store = UPIRecordStore(os.path.join(self.temp_dir.name, "day1.upi.sqlite"))
+        try:
+            self.assertEqual(store.ingest_records_file(self.records_path, schema_dir=DEFAULT_SCHEMA_DIR), (20, 4))
+            self.assertEqual(store.rejects.reasons["invalid JSON"], 1)
+            # The store remembers whether its records were validated
+            self.assertTrue(store.is_current(self.records_path, DEFAULT_SCHEMA_DIR))
+            self.assertFalse(store.is_current(self.records_path))
+        finally:
+            store.close()
+
+if __name__ == "__main__":
+    unittest.main()
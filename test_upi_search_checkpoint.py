@@ -0,0 +1,132 @@
+import unittest
+import pandas as pd
+import json
+import tempfile
+import os
+import io
+import contextlib
+from upi_search_batch import UPISearchBatch
+
+class TestSearchCheckpoint(unittest.TestCase):
+    def setUp(self):
+        """Write UPI and trade files and a checkpoint directory"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.checkpoint_dir = os.path.join(self.temp_dir.name, "checkpoint")
+
+        pairs = ["EUR/USD", "GBP/JPY", "USD/HKD", "AUD/USD"]
+        upis = [
+            {"upiCode": f"UPI_{i}", "assetClass": "ForeignExchange", "instrumentType": "Forward",
+             "underlying": {"currencyPair": pair}, "deliveryType": "Physical" if i % 2 else "Cash"}
+            for i, pair in enumerate(pairs)
+        ]
+        self.upi_path = os.path.join(self.temp_dir.name, "upis.json")
+        with open(self.upi_path, 'w') as f:
+            json.dump({"upis": upis}, f)
+
+        trades = pd.DataFrame([
+            {"TradeID": f"T{i:03d}", "AssetClass": "ForeignExchange", "InstrumentType": "Forward",
+             "CcyPair": pairs[(i * 3) % len(pairs)], "DeliveryType": "Physical" if i % 3 else "Cash"}
+            for i in range(23)
+        ])
+        self.trade_path = os.path.join(self.temp_dir.name, "trades.xlsx")
+        trades.to_excel(self.trade_path, index=False)
+
+    def tearDown(self):
+        """Remove temporary files"""
+        self.temp_dir.cleanup()
+
+    def make_processor(self, resume=False):
+        """Load inputs into a processor that checkpoints every 5 trades"""
+        processor = UPISearchBatch()
+        processor.checkpoint_dir = self.checkpoint_dir
+        processor.checkpoint_every = 5
+        processor.resume = resume
+        with contextlib.redirect_stdout(io.StringIO()):
+            processor.load_upi_data(self.upi_path)
+            processor.load_trade_data(self.trade_path)
+            processor.apply_cnh_handling()
+            processor.auto_map_columns('FX')
+        return processor
+
+    def search(self, processor):
+        """Run a search and return comparable result rows"""
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = processor.search_upis('FX')
+        return [(r['Trade_Index'], r['Best_UPI'], r['Match_Score'], r['Original_TradeID']) for r in results]
+
+    def test_resume_after_interruption_matches_full_run(self):
+        """Test that a run killed part-way resumes from its checkpoint to the same results"""
+        expected = self.search(self.make_processor())
+
+        # Fail on the 13th trade - two chunks of 5 are checkpointed by then
+        processor = self.make_processor()
+        extract = processor.extract_trade_attributes
+        calls = []
+        def failing_extract(trade):
+            calls.append(trade)
+            if len(calls) == 13:
+                raise RuntimeError("interrupted")
+            return extract(trade)
+        processor.extract_trade_attributes = failing_extract
+        with self.assertRaises(RuntimeError):
+            self.search(processor)
+
+        resumed = self.make_processor(resume=True)
+        searched = []
+        extract = resumed.extract_trade_attributes
+        resumed.extract_trade_attributes = lambda trade: searched.append(trade) or extract(trade)
+        with contextlib.redirect_stdout(io.StringIO()):
+            resumed.search_upis('FX')
+
+        # Only trades after the two checkpointed chunks were searched again
+        self.assertEqual(len(searched), 23 - 10)
+        self.assertEqual(self.search(resumed), expected)
+
+        resumed.clear_checkpoint()
+        self.assertFalse(os.path.exists(self.checkpoint_dir))
+
+    def test_resume_restores_summary_and_latency(self):
+        """Test that negative lookups and latencies of checkpointed trades are counted after a resume"""
+        def without_gbp_jpy(processor):
+            # Treat GBP/JPY trades as unmatchable so the run has negative lookups
+            can_match = processor.can_match_any_upi
+            processor.can_match_any_upi = lambda attrs, asset_class, pair_key: pair_key != ('GBP', 'JPY') and can_match(attrs, asset_class, pair_key)
+            return processor
+
+        full = without_gbp_jpy(self.make_processor())
+        self.search(full)
+        self.assertGreater(full.summary["negative_lookups"], 0)
+
+        processor = without_gbp_jpy(self.make_processor())
+        extract = processor.extract_trade_attributes
+        calls = []
+        def failing_extract(trade):
+            calls.append(trade)
+            if len(calls) == 13:
+                raise RuntimeError("interrupted")
+            return extract(trade)
+        processor.extract_trade_attributes = failing_extract
+        with self.assertRaises(RuntimeError):
+            self.search(processor)
+
+        resumed = without_gbp_jpy(self.make_processor(resume=True))
+        self.search(resumed)
+        self.assertEqual(resumed.summary, full.summary)
+        self.assertEqual(resumed.latency.overall()[0].count, 23)
+        self.assertEqual(resumed.latency.plan_counts(), full.latency.plan_counts())
+
+        resumed.clear_checkpoint()
+        self.assertFalse(os.path.exists(self.checkpoint_dir))
+
+    def test_changed_mapping_discards_checkpoint(self):
+        """Test that a checkpoint is not reused when the column mapping differs"""
+        self.search(self.make_processor())
+
+        processor = self.make_processor(resume=True)
+        processor.column_mappings['Delivery Type'] = 'TradeID'
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            processor.search_upis('FX')
+        self.assertIn("different inputs or mapping", output.getvalue())
+
+if __name__ == "__main__":
+    unittest.main()
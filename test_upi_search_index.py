@@ -0,0 +1,181 @@
+import unittest
+from upi_search_index import ReferenceRateIndex, UPIPartitionIndex, AttributeValueSets, ExactMatchIndex, SelectivityStats, BucketedSelectivityStats
+
+class TestReferenceRateIndex(unittest.TestCase):
+    def setUp(self):
+        """Index a set of reference-rate spellings"""
+        self.values = ["USD-SOFR", "USD-SOFR-COMPOUND", "SOFR", "EUR-EURIBOR-Reuters", "GBP-SONIA", "3", "MNTH"]
+        self.index = ReferenceRateIndex(self.values)
+
+    def assert_matches_brute_force(self, trade_str):
+        """Compare index results with the substring rule applied to every value"""
+        normalized = [value.strip().upper() for value in self.values]
+        expected = {value for value in normalized if trade_str in value or value in trade_str}
+        self.assertEqual(set(self.index.matches(trade_str)), expected, trade_str)
+
+    def test_matches_containment_in_both_directions(self):
+        """Test that values containing and contained in the trade string are returned"""
+        self.assertEqual(
+            set(self.index.matches("USD-SOFR")),
+            {"USD-SOFR", "USD-SOFR-COMPOUND", "SOFR"}
+        )
+        self.assertEqual(set(self.index.matches("EURIBOR")), {"EUR-EURIBOR-REUTERS"})
+
+    def test_matches_agree_with_substring_rule(self):
+        """Test long, short and unmatched trade strings against the brute-force rule"""
+        for trade_str in ["USD-SOFR-COMPOUND-3M", "SO", "S", "3M", "JPY-TONA", "MNTH", ""]:
+            self.assert_matches_brute_force(trade_str)
+
+    def test_contains_match_falls_back_for_unindexed_values(self):
+        """Test that values outside the index still use the direct substring test"""
+        self.assertTrue(self.index.contains_match("USD-SOFR", "SOFR"))
+        self.assertFalse(self.index.contains_match("GBP-SONIA", "SOFR"))
+        self.assertTrue(self.index.contains_match("JPY-TONA-OIS", "TONA"))
+
+class TestUPIPartitionIndex(unittest.TestCase):
+    def setUp(self):
+        """Bucket records from two asset classes"""
+        def record(upi, asset_class, instrument_type, use_case):
+            return {"Header": {"AssetClass": asset_class, "InstrumentType": instrument_type, "UseCase": use_case},
+                    "Identifier": {"UPI": upi}}
+
+        self.records = [
+            record("FX1", "Foreign_Exchange", "Forward", "Forward"),
+            record("FX2", "Foreign_Exchange", "Forward", "Non_Standard"),
+            record("FX3", "Foreign_Exchange", "Option", "Non_Standard"),
+            record("FX4", "Foreign_Exchange", "Forward", "Non_Standard"),
+            record("IR1", "Rates", "Swap", "Basis"),
+        ]
+        self.partitions = UPIPartitionIndex(self.records)
+
+    def codes(self, records):
+        """UPI codes of a record sequence"""
+        return [r["Identifier"]["UPI"] for r in records]
+
+    def test_bucket_lookups_keep_record_order(self):
+        """Test (AssetClass, UseCase[, InstrumentType]) lookups"""
+        self.assertEqual(self.codes(self.partitions.iter_records("Foreign_Exchange", "Non_Standard")), ["FX2", "FX3", "FX4"])
+        self.assertEqual(self.codes(self.partitions.iter_records("Foreign_Exchange", "Non_Standard", "Forward")), ["FX2", "FX4"])
+        self.assertEqual(self.codes(self.partitions.iter_records("Foreign_Exchange", "Non_Standard", "Swap")), [])
+
+    def test_counts_and_use_cases_per_asset_class(self):
+        """Test product discovery for each asset class from one parse"""
+        self.assertEqual(self.partitions.count("Foreign_Exchange"), 4)
+        self.assertEqual(self.partitions.count("Rates"), 1)
+        self.assertTrue(self.partitions.has_records("Foreign_Exchange", "Non_Standard", "Option"))
+        self.assertFalse(self.partitions.has_records("Rates", "Non_Standard"))
+        self.assertEqual(self.partitions.get_use_cases("Foreign_Exchange"), ["Forward", "Non_Standard"])
+        self.assertEqual(self.partitions.get_use_cases("Rates"), ["Basis"])
+
+    def test_ranked_records_put_looked_up_values_first(self):
+        """Test that records holding the looked-up values come first, then the rest in order"""
+        for record, currency in zip(self.records, ["USD", "cny ", None, "CNY", "USD"]):
+            record["Attributes"] = {"OtherNotionalCurrency": currency, "DeliveryType": "CASH"}
+        self.records[2]["Attributes"]["DeliveryType"] = "PHYS"
+        partitions = UPIPartitionIndex(self.records)
+
+        ranked = list(partitions.iter_ranked_records("Foreign_Exchange", "Non_Standard", None,
+                                                     [("OtherNotionalCurrency", "CNY"), ("DeliveryType", "PHYS")]))
+        self.assertEqual(self.codes(record for _, record in ranked), ["FX2", "FX4", "FX3"])
+        self.assertEqual([position for position, _ in ranked], [0, 2, 1])
+        ranked = partitions.iter_ranked_records("Foreign_Exchange", "Non_Standard", None,
+                                                [("DeliveryType", "PHYS"), ("OtherNotionalCurrency", "EUR")])
+        self.assertEqual(self.codes(record for _, record in ranked), ["FX3", "FX2", "FX4"])
+
+class TestAttributeValueSets(unittest.TestCase):
+    def test_distinct_normalized_values_per_attribute(self):
+        """Test that attribute values are collected once, stripped and upper-cased"""
+        records = [
+            {"Attributes": {"NotionalCurrency": "usd ", "DeliveryType": "CASH", "PlaceofSettlement": None}},
+            {"Attributes": {"NotionalCurrency": "USD", "DeliveryType": "PHYS"}},
+            {"Attributes": {"NotionalCurrency": "EUR"}},
+        ]
+        value_sets = AttributeValueSets(iter(records))
+
+        self.assertEqual(value_sets.record_count, 3)
+        self.assertEqual(value_sets.get_values("NotionalCurrency"), {"USD", "EUR"})
+        self.assertEqual(value_sets.get_values("DeliveryType"), {"CASH", "PHYS"})
+        self.assertFalse(value_sets.get_values("PlaceofSettlement"))
+
+class TestSelectivityStats(unittest.TestCase):
+    def test_frequencies_and_positions_per_field(self):
+        """Test that each value keeps the positions holding it, and the summary lists the most frequent"""
+        stats = SelectivityStats([0, 2])
+        for position, values in enumerate([("SWAP", "x", ("EUR", "USD")), ("SWAP", "y", None), ("FORWARD", "z", ("EUR", "USD"))]):
+            stats.add(position, values)
+
+        self.assertEqual(list(stats.lookup(0, "SWAP")), [0, 1])
+        self.assertEqual(list(stats.lookup(2, ("EUR", "USD"))), [0, 2])
+        self.assertFalse(stats.lookup(0, "OPTION"))
+        self.assertFalse(stats.lookup(1, "x"))
+        self.assertEqual(stats.distinct_count(0), 2)
+
+        summary = stats.summary({0: "Instrument Type", 2: "Currency Pair"}, top=1)
+        self.assertEqual(summary["records"], 3)
+        self.assertEqual(summary["fields"]["Instrument Type"], {"distinct": 2, "records": 3, "top": [["SWAP", 2]]})
+        self.assertEqual(summary["fields"]["Currency Pair"]["top"], [["EUR/USD", 2]])
+
+class TestBucketedSelectivityStats(unittest.TestCase):
+    def test_positions_per_bucket_and_merged(self):
+        """Test that each bucket counts its own records and whole-set lookups merge them in position order"""
+        stats = BucketedSelectivityStats([0, 1], 1)
+        for position, values in enumerate([("USD", "NDF"), ("USD", "BASIS"), ("EUR", "BASIS"), ("USD", "NDF"), ("USD", None)]):
+            stats.add(position, values)
+
+        self.assertEqual(stats.record_count, 5)
+        self.assertEqual(stats.get_bucket("NDF").count(0, "USD"), 2)
+        self.assertEqual(list(stats.get_bucket("BASIS").lookup(0, "USD")), [1])
+        self.assertIsNone(stats.get_bucket("OPTION"))
+        self.assertEqual(list(stats.lookup(0, "USD")), [0, 1, 3, 4])
+        self.assertEqual(stats.count(0, "USD"), 4)
+        self.assertFalse(stats.lookup(0, "GBP"))
+        self.assertEqual(stats.distinct_count(0), 2)
+
+        summary = stats.summary({0: "Currency", 1: "Product Type"}, top=1)
+        self.assertEqual(summary["bucket_field"], "Product Type")
+        self.assertEqual(list(summary["buckets"]), ["BASIS", "NDF", ""])
+        self.assertEqual(summary["buckets"]["NDF"]["fields"]["Currency"]["top"], [["USD", 2]])
+
+class TestExactMatchIndex(unittest.TestCase):
+    def test_exact_lookup_and_ambiguous_keys(self):
+        """Test that normalized values resolve to the one record equal on every field"""
+        records = [
+            {"Identifier": {"UPI": "QZ01"}, "Attributes": {"NotionalCurrency": "usd ", "DeliveryType": "CASH"}},
+            {"Identifier": {"UPI": "QZ02"}, "Attributes": {"NotionalCurrency": "USD", "DeliveryType": "PHYS"}},
+            {"Identifier": {"UPI": "QZ03"}, "Attributes": {"NotionalCurrency": "EUR", "DeliveryType": "PHYS", "Extra": "A"}},
+            {"Identifier": {"UPI": "QZ04"}, "Attributes": {"NotionalCurrency": "EUR", "DeliveryType": "PHYS", "Extra": "B"}},
+        ]
+        index = ExactMatchIndex(iter(records), ("NotionalCurrency", "DeliveryType"))
+
+        self.assertEqual(index.lookup(("USD", "CASH"))["Identifier"]["UPI"], "QZ01")
+        self.assertEqual(index.lookup(("USD", "PHYS"))["Identifier"]["UPI"], "QZ02")
+        self.assertIsNone(index.lookup(("EUR", "PHYS")))  # Shared by two records
+        self.assertIsNone(index.lookup(("GBP", "CASH")))
+
+    def test_record_missing_a_field_disables_index(self):
+        """Test that a record lacking a field (which could also score 100) makes every lookup miss"""
+        records = [
+            {"Attributes": {"NotionalCurrency": "USD", "DeliveryType": "CASH"}},
+            {"Attributes": {"NotionalCurrency": "USD"}},
+        ]
+        index = ExactMatchIndex(records, ("NotionalCurrency", "DeliveryType"))
+        self.assertFalse(index.usable)
+        self.assertIsNone(index.lookup(("USD", "CASH")))
+
+    def test_fields_no_record_has_are_left_out_of_the_key(self):
+        """Test that a mapped field absent from every record (e.g. a Header field) does not disable the index"""
+        records = [
+            {"Header": {"InstrumentType": "Forward"}, "Attributes": {"NotionalCurrency": "USD", "DeliveryType": "CASH"}},
+            {"Header": {"InstrumentType": "Forward"}, "Attributes": {"NotionalCurrency": "EUR", "DeliveryType": "CASH"}},
+        ]
+        index = ExactMatchIndex(records, ("InstrumentType", "NotionalCurrency", "DeliveryType"))
+        self.assertTrue(index.usable)
+        self.assertIs(index.lookup(("FORWARD", "EUR", "CASH")), records[1])
+        self.assertIs(index.lookup(("SWAP", "EUR", "CASH")), records[1])
+        self.assertIsNone(index.lookup(("FORWARD", "EUR", "PHYS")))
+
+        # No record has any of the fields - nothing can score 100
+        self.assertFalse(ExactMatchIndex(records, ("InstrumentType",)).usable)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import json
+import os
+import pickle
+import tempfile
+from upi_search_metrics import Histogram, LatencyRecorder
+
+class TestLatencyRecorder(unittest.TestCase):
+    def setUp(self):
+        """Create a slow-trade log location"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.slow_log = os.path.join(self.temp_dir.name, "slow.jsonl")
+
+    def tearDown(self):
+        """Remove temporary files"""
+        self.temp_dir.cleanup()
+
+    def test_histogram_percentiles(self):
+        """Test that log-bucketed percentiles are close to the exact ones and never understated"""
+        histogram = Histogram()
+        for value in range(1, 1001):
+            histogram.add(value / 10)
+        for percent, exact in [(50, 50.0), (90, 90.0), (99, 99.0)]:
+            self.assertGreaterEqual(histogram.percentile(percent), exact)
+            self.assertLessEqual(histogram.percentile(percent), exact * 1.021)
+        self.assertEqual(histogram.max, 100.0)
+        self.assertEqual(Histogram().percentile(99), 0)
+
+        candidates = Histogram(exact=True)
+        for value in [0, 3, 3, 3, 5000]:
+            candidates.add(value)
+        self.assertEqual(candidates.to_dict(digits=1)["p50"], 3)
+        self.assertEqual(candidates.percentile(99), 5000)
+
+    def test_groups_slow_log_and_merge(self):
+        """Test grouping by product and path, the slow-trade log and merging shard recorders"""
+        recorder = LatencyRecorder(slow_trade_ms=100, slow_log_path=self.slow_log)
+        recorder.record(0.002, 40, "Non_Standard", "cnh", trade=1, signature={"NotionalCurrency": "CNY"})
+        recorder.record(0.250, 4000, "Basis", "regular", trade=2, signature={"ReferenceRate": "SOFR"}, partial=True)
+        recorder.record(0.001, 0, None, "regular", trade=3, plan="Currency Pair")
+        recorder.close()
+
+        summary = recorder.summary()
+        self.assertEqual(summary["trades"], 3)
+        self.assertEqual([(g["product"], g["path"]) for g in summary["groups"]],
+                         [("Basis", "regular"), ("Non_Standard", "cnh"), ("Unknown", "regular")])
+        self.assertEqual(summary["slow_trades"]["count"], 1)
+        self.assertEqual(summary["plans"], [{"plan": "Currency Pair", "trades": 1}])
+        self.assertEqual(summary["deadline_hits"], 1)
+
+        with open(self.slow_log, encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]["trade"], 2)
+        self.assertEqual(entries[0]["signature"], {"ReferenceRate": "SOFR"})
+        self.assertTrue(entries[0]["partial"])
+
+        # Recorders travel in shard partial files and are merged there
+        merged = LatencyRecorder(slow_trade_ms=100)
+        merged.merge(pickle.loads(pickle.dumps(recorder)))
+        merged.merge(recorder)
+        self.assertEqual(merged.summary()["trades"], 6)
+        self.assertEqual(merged.slow_count, 2)
+        self.assertEqual(merged.summary()["candidates"]["max"], 4000)
+        self.assertEqual(merged.plans, {"Currency Pair": 2})
+        self.assertEqual(merged.deadline_hits, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import pandas as pd
+import json
+import tempfile
+import os
+import io
+import contextlib
+from upi_search_batch import UPISearchBatch
+from upi_search_pipeline import SearchPipeline
+
+class TestSearchPipeline(unittest.TestCase):
+    def setUp(self):
+        """Write UPI and trade files, some trades in CNH"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+        pairs = ["EUR/USD", "GBP/JPY", "USD/CNY", "AUD/USD"]
+        upis = [
+            {"upiCode": f"UPI_{i}", "assetClass": "ForeignExchange", "instrumentType": "Forward",
+             "underlying": {"currencyPair": pair}, "deliveryType": "Physical" if i % 2 else "Cash"}
+            for i, pair in enumerate(pairs)
+        ]
+        self.upi_path = os.path.join(self.temp_dir.name, "upis.json")
+        with open(self.upi_path, 'w') as f:
+            json.dump({"upis": upis}, f)
+
+        trades = pd.DataFrame([
+            {"TradeID": f"T{i:03d}", "AssetClass": "ForeignExchange", "InstrumentType": "Forward",
+             "CcyPair": ["EUR/USD", "GBP/JPY", "USD/CNH", "AUD/USD"][i % 4], "SettlementCcy": "CNH" if i % 4 == 2 else "USD",
+             "DeliveryType": "Physical" if i % 3 else "Cash"}
+            for i in range(23)
+        ])
+        self.trade_path = os.path.join(self.temp_dir.name, "trades.xlsx")
+        trades.to_excel(self.trade_path, index=False)
+
+    def tearDown(self):
+        """Remove temporary files"""
+        self.temp_dir.cleanup()
+
+    def test_pipeline_matches_sequential_run(self):
+        """Test that the pipelined run writes the same report and summary as the sequential one"""
+        sequential = UPISearchBatch()
+        sequential_output = os.path.join(self.temp_dir.name, "sequential.xlsx")
+        with contextlib.redirect_stdout(io.StringIO()):
+            sequential.load_upi_data(self.upi_path)
+            sequential.load_trade_data(self.trade_path)
+            sequential.apply_cnh_handling()
+            sequential.auto_map_columns('FX')
+            sequential.search_upis('FX')
+            self.assertTrue(sequential.export_results(sequential_output))
+
+        pipelined = UPISearchBatch()
+        pipeline_output = os.path.join(self.temp_dir.name, "pipelined.xlsx")
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(SearchPipeline(pipelined, 'FX', chunk_size=5).run(self.upi_path, self.trade_path, pipeline_output))
+
+        pd.testing.assert_frame_equal(pd.read_excel(pipeline_output), pd.read_excel(sequential_output))
+        self.assertEqual(pipelined.summary, sequential.summary)
+        self.assertEqual(pipelined.column_mappings, sequential.column_mappings)
+
+    def test_failed_stage_stops_pipeline(self):
+        """Test that a failing stage stops the run without writing a report"""
+        output = os.path.join(self.temp_dir.name, "failed.xlsx")
+        with contextlib.redirect_stdout(io.StringIO()) as log:
+            self.assertFalse(SearchPipeline(UPISearchBatch(), 'FX').run(
+                self.upi_path, os.path.join(self.temp_dir.name, "missing.xlsx"), output))
+        self.assertIn("read stage", log.getvalue())
+        self.assertFalse(os.path.exists(output))
+
+if __name__ == "__main__":
+    unittest.main()
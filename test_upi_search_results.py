@@ -0,0 +1,42 @@
+import unittest
+from upi_search_results import CompactResults
+
+class TestCompactResults(unittest.TestCase):
+    def setUp(self):
+        """Store a few results with repeated UPIs and messages"""
+        self.results = CompactResults(top_k=2)
+        self.results.append(0, "QZ01", 90, "Match found", [("QZ01", 90), ("QZ02", 70), ("QZ03", 60)])
+        self.results.append(1, None, 0, "No match", [])
+        self.results.append(2, "QZ02", 85, "Match found", [("QZ02", 85)], candidate_count=4, partial=True)
+
+    def test_columns_and_interning(self):
+        """Test that each result is kept as integer columns with interned keys"""
+        self.assertEqual(len(self.results), 3)
+        self.assertEqual(list(self.results.scores), [90, 0, 85])
+        self.assertEqual(self.results.upi_keys, ["QZ01", "QZ02"])
+        self.assertEqual(self.results.messages, ["Match found", "No match"])
+        self.assertEqual(self.results.matched_count(), 2)
+
+    def test_top_k_candidates_and_total_count(self):
+        """Test that only top_k candidates are kept while the total count is preserved"""
+        self.assertEqual(self.results.candidates(0), [("QZ01", 90), ("QZ02", 70)])
+        self.assertEqual(self.results.candidate_count(0), 3)
+        self.assertEqual(self.results.candidates(1), [])
+        self.assertEqual(self.results.candidate_count(2), 4)
+
+    def test_partial_flag(self):
+        """Test that results cut short by the time limit are flagged"""
+        self.assertEqual([self.results.partial(index) for index in range(3)], [False, False, True])
+        self.assertTrue(self.results[2]["Partial"])
+
+    def test_materializer_joins_details_on_access(self):
+        """Test that indexing and iteration go through the materializer"""
+        self.assertEqual(self.results[-1]["BestUPI"], "QZ02")
+
+        self.results.materializer = lambda results, index: {"Row": results.trade_row(index), "UPI": results.best_upi(index)}
+        self.assertEqual([r["UPI"] for r in self.results], ["QZ01", None, "QZ02"])
+        with self.assertRaises(IndexError):
+            self.results[3]
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import pandas as pd
+import json
+import tempfile
+import os
+import io
+import contextlib
+from upi_search_batch import UPISearchBatch
+from upi_search_shard import parse_shard, shard_of
+
+class TestShardAndMerge(unittest.TestCase):
+    def setUp(self):
+        """Write UPI and trade files"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+        pairs = ["EUR/USD", "GBP/JPY", "USD/HKD", "AUD/USD", "USD/CNH"]
+        upis = [
+            {"upiCode": f"UPI_{i}", "assetClass": "ForeignExchange", "instrumentType": "Forward",
+             "underlying": {"currencyPair": pair}, "deliveryType": "Physical" if i % 2 else "Cash"}
+            for i, pair in enumerate(pairs)
+        ]
+        self.upi_path = os.path.join(self.temp_dir.name, "upis.json")
+        with open(self.upi_path, 'w') as f:
+            json.dump({"upis": upis}, f)
+
+        trades = pd.DataFrame([
+            {"TradeID": f"T{i:03d}", "AssetClass": "ForeignExchange", "InstrumentType": "Forward",
+             "CcyPair": pairs[(i * 3) % len(pairs)] if i % 7 else "", "DeliveryType": "Physical" if i % 3 else "Cash"}
+            for i in range(31)
+        ])
+        self.trade_path = os.path.join(self.temp_dir.name, "trades.xlsx")
+        trades.to_excel(self.trade_path, index=False)
+
+    def tearDown(self):
+        """Remove temporary files"""
+        self.temp_dir.cleanup()
+
+    def make_processor(self, shard=None, shard_by="pair"):
+        """Load inputs into a processor for one shard (or the whole file)"""
+        processor = UPISearchBatch()
+        processor.shard = shard
+        processor.shard_by = shard_by
+        with contextlib.redirect_stdout(io.StringIO()):
+            processor.load_upi_data(self.upi_path)
+            processor.load_trade_data(self.trade_path)
+            processor.apply_cnh_handling()
+            processor.auto_map_columns('FX')
+        return processor
+
+    def rows(self, results):
+        """Comparable result rows"""
+        return [(r['Trade_Index'], r['Best_UPI'], r['Match_Score'], r['Original_TradeID']) for r in results]
+
+    def test_parse_shard(self):
+        """Test shard spec parsing and the stable shard hash"""
+        self.assertEqual(parse_shard("2/4"), (2, 4))
+        self.assertEqual(parse_shard(" 1 / 1 "), (1, 1))
+        for value in ["0/4", "5/4", "1/0", "two/4"]:
+            with self.assertRaises(ValueError):
+                parse_shard(value)
+        self.assertEqual(shard_of("EUR/USD", 4), shard_of("EUR/USD", 4))
+        self.assertTrue(1 <= shard_of("row:12", 3) <= 3)
+
+    def test_merged_shards_match_single_run(self):
+        """Test that merging every shard gives the same results and summary as one full run"""
+        single = self.make_processor()
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = self.rows(single.search_upis('FX'))
+
+        for shard_by in ["pair", "row"]:
+            partial_files = []
+            searched = 0
+            for number in range(1, 4):
+                processor = self.make_processor((number, 3), shard_by)
+                path = os.path.join(self.temp_dir.name, f"{shard_by}_{number}.pkl")
+                with contextlib.redirect_stdout(io.StringIO()):
+                    searched += len(processor.search_upis('FX'))
+                    self.assertTrue(processor.write_partial_results(path, 'FX'))
+                partial_files.append(path)
+            self.assertEqual(searched, len(expected))
+
+            merger = self.make_processor()
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertTrue(merger.merge_partial_results(partial_files, 'FX'))
+            self.assertEqual(self.rows(merger.results), expected)
+            self.assertEqual(merger.summary, single.summary)
+
+            # A missing shard is refused
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                self.assertFalse(merger.merge_partial_results(partial_files[:2], 'FX'))
+            self.assertIn("missing: [3]", output.getvalue())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import os
+from upi_search_results import CompactResults
+from upi_search_spill import ResultSpill, parse_memory_size
+
+class TestResultSpill(unittest.TestCase):
+    def setUp(self):
+        """Create a spill with a budget every process is over"""
+        self.materializer = lambda results, index: (results.trade_row(index), results.best_upi(index), results.score(index))
+        self.spill = ResultSpill(lambda: CompactResults(top_k=0, materializer=self.materializer), max_memory=1, min_chunk=4)
+
+    def tearDown(self):
+        """Remove spill files"""
+        self.spill.cleanup()
+
+    def test_parse_memory_size(self):
+        """Test memory budget parsing"""
+        self.assertEqual(parse_memory_size("512M"), 512 * 1024 ** 2)
+        self.assertEqual(parse_memory_size("2g"), 2 * 1024 ** 3)
+        self.assertEqual(parse_memory_size("1.5GB"), int(1.5 * 1024 ** 3))
+        self.assertEqual(parse_memory_size("4096"), 4096)
+        with self.assertRaises(ValueError):
+            parse_memory_size("lots")
+
+    def test_spilled_chunks_merge_in_order(self):
+        """Test that results read back from spill files in order, followed by the live chunk"""
+        expected = []
+        for row in range(10):
+            upi = f"QZ{row % 3}" if row % 4 else None
+            self.spill.append(row, upi, row * 10)
+            expected.append((row, upi, row * 10))
+            if row % 4 == 3:
+                self.assertTrue(self.spill.check_memory())
+
+        self.assertEqual(len(self.spill.chunk_paths), 2)
+        self.assertTrue(all(os.path.exists(path) for path in self.spill.chunk_paths))
+        self.assertEqual(len(self.spill), 10)
+        self.assertEqual(list(self.spill), expected)
+
+        temp_dir = self.spill.temp_dir
+        self.spill.cleanup()
+        self.assertFalse(os.path.exists(temp_dir))
+
+    def test_small_chunk_is_not_spilled(self):
+        """Test that a chunk below the minimum size stays live even over the budget"""
+        for row in range(3):
+            self.spill.append(row, None, 0)
+            self.assertFalse(self.spill.check_memory())
+
+        self.assertEqual(self.spill.chunk_paths, [])
+        self.spill.append(3, None, 0)
+        self.assertTrue(self.spill.check_memory())
+        self.assertEqual(len(self.spill.chunk_paths), 1)
+        self.assertEqual(len(self.spill.current), 0)
+
+if __name__ == "__main__":
+    unittest.main()
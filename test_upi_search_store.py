@@ -0,0 +1,82 @@
+import unittest
+import json
+import tempfile
+import os
+from upi_search_store import UPIRecordStore
+
+def make_record(upi, asset_class, instrument_type, use_case, attributes):
+    """Build a minimal DSB RECORDS entry"""
+    return {
+        "TemplateVersion": 1,
+        "Header": {"AssetClass": asset_class, "InstrumentType": instrument_type, "UseCase": use_case, "Level": "UPI"},
+        "Identifier": {"UPI": upi, "Status": "New", "LastUpdateDateTime": "2024-01-01T00:00:00"},
+        "Derived": {"ShortName": upi},
+        "Attributes": attributes
+    }
+
+class TestUPIRecordStore(unittest.TestCase):
+    def setUp(self):
+        """Write a small RECORDS file and ingest it into a temporary store"""
+        self.records = [
+            make_record("QZ0000000001", "Foreign_Exchange", "Forward", "Forward",
+                        {"NotionalCurrency": "USD", "OtherNotionalCurrency": "EUR"}),
+            make_record("QZ0000000002", "Foreign_Exchange", "Forward", "Non_Standard",
+                        {"NotionalCurrency": "USD", "OtherNotionalCurrency": "CNY"}),
+            make_record("QZ0000000003", "Foreign_Exchange", "Option", "Non_Standard",
+                        {"NotionalCurrency": "USD", "OtherNotionalCurrency": "CNY"}),
+            make_record("QZ0000000004", "Rates", "Swap", "Basis",
+                        {"NotionalCurrency": "USD", "ReferenceRate": "USD-SOFR"}),
+        ]
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.records_path = os.path.join(self.temp_dir.name, "upi.RECORDS")
+        with open(self.records_path, 'w', encoding='utf-8') as f:
+            for record in self.records:
+                f.write(json.dumps(record) + "\n")
+            f.write("# comment line\n")
+            f.write("{not valid json\n")
+            f.write(json.dumps({"Header": {}}) + "\n")
+
+        self.store = UPIRecordStore(os.path.join(self.temp_dir.name, "upi.sqlite"))
+        self.stored, self.rejected = self.store.ingest_records_file(
+            self.records_path, validator=lambda r: bool(r.get("Identifier", {}).get("UPI"))
+        )
+
+    def tearDown(self):
+        """Close the store and remove temporary files"""
+        self.store.close()
+        self.temp_dir.cleanup()
+
+    def test_ingest_counts_and_rejects(self):
+        """Test that valid records are stored and invalid lines are rejected"""
+        self.assertEqual(self.stored, 4)
+        self.assertEqual(self.rejected, 2)
+        self.assertTrue(self.store.is_current(self.records_path))
+
+    def test_partition_queries(self):
+        """Test indexed partition lookups by asset class, use case and instrument type"""
+        self.assertEqual(self.store.count("Foreign_Exchange"), 3)
+        self.assertEqual(self.store.count("Foreign_Exchange", "Non_Standard"), 2)
+        self.assertTrue(self.store.has_records("Foreign_Exchange", "Non_Standard", "Option"))
+        self.assertFalse(self.store.has_records("Foreign_Exchange", "Non_Standard", "Swap"))
+        self.assertEqual(self.store.get_use_cases("Foreign_Exchange"), ["Forward", "Non_Standard"])
+
+    def test_iter_records_returns_raw_records(self):
+        """Test that streamed records round-trip the original JSON"""
+        records = list(self.store.iter_records("Foreign_Exchange", "Non_Standard", "Forward", batch_size=1))
+        self.assertEqual(records, [self.records[1]])
+
+    def test_ranked_records_put_looked_up_values_first(self):
+        """Test that records holding the looked-up values come first, each record once"""
+        codes = lambda ranked: [record["Identifier"]["UPI"] for _, record in ranked]
+        ranked = list(self.store.iter_ranked_records("Foreign_Exchange", None, None, [("OtherNotionalCurrency", "CNY")]))
+        self.assertEqual(codes(ranked), ["QZ0000000002", "QZ0000000003", "QZ0000000001"])
+        # Row ids keep the stored order, whatever order the records are ranked in
+        self.assertEqual(sorted(ranked, key=lambda item: item[0]), [ranked[2], ranked[0], ranked[1]])
+
+        lookups = [("OptionType", "CALL"), ("OtherNotionalCurrency", "EUR"), ("NotionalCurrency", "USD"), ("UnknownField", "X")]
+        ranked = self.store.iter_ranked_records("Foreign_Exchange", "Non_Standard", None, lookups, batch_size=1)
+        self.assertEqual(codes(ranked), ["QZ0000000002", "QZ0000000003"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,373 @@
+import unittest
+from unittest import mock
+import pandas as pd
+import upi_search_tool
+from upi_search_tool import UPISearchTool
+from upi_search_index import UPIPartitionIndex
+
+class Var:
+    """Stand-in for a Tk variable, so the tool can be built without a display"""
+    def __init__(self, master=None, value=None):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+def make_upi(code, asset_class, instrument_type, use_case, status="New", **attributes):
+    """Build a DSB-style UPI record"""
+    return {
+        "Header": {"AssetClass": asset_class, "InstrumentType": instrument_type, "UseCase": use_case, "Level": "UPI"},
+        "Identifier": {"UPI": code, "Status": status},
+        "Derived": {"ShortName": code},
+        "Attributes": attributes,
+    }
+
+UPI_RECORDS = [
+    make_upi("QZFWD0000001", "Foreign_Exchange", "Forward", "Forward",
+             NotionalCurrency="USD", OtherNotionalCurrency="EUR", DeliveryType="PHYS"),
+    make_upi("QZFWD0000002", "Foreign_Exchange", "Forward", "Forward",
+             NotionalCurrency="USD", OtherNotionalCurrency="JPY", DeliveryType="CASH"),
+    make_upi("QZNDF0000001", "Foreign_Exchange", "Forward", "NDF",
+             NotionalCurrency="USD", OtherNotionalCurrency="KRW", SettlementCurrency="USD"),
+    make_upi("QZNDF0000002", "Foreign_Exchange", "Forward", "NDF",
+             NotionalCurrency="USD", OtherNotionalCurrency="INR", SettlementCurrency="USD"),
+    make_upi("QZOPT0000001", "Foreign_Exchange", "Option", "Vanilla_Option",
+             NotionalCurrency="USD", OtherNotionalCurrency="EUR", OptionType="CALL"),
+    make_upi("QZIRS0000001", "Rates", "Swap", "Basis",
+             NotionalCurrency="USD", ReferenceRate="USD-SOFR", ReferenceRateTermValue=3,
+             ReferenceRateTermUnit="MNTH", NotionalSchedule="Constant", DeliveryType="CASH",
+             OtherLegReferenceRate="USD-LIBOR-BBA", OtherLegReferenceRateTermValue=3,
+             OtherLegReferenceRateTermUnit="MNTH"),
+]
+
+class ToolTestCase(unittest.TestCase):
+    """Builds a UPISearchTool without its Tk window over UPI_RECORDS"""
+
+    def make_tool(self, records=UPI_RECORDS, asset_class="FX", product="Forward"):
+        """Create the tool with plain variables and no UI, with records loaded in memory"""
+        with mock.patch.multiple(upi_search_tool.tk, StringVar=Var, BooleanVar=Var), \
+                mock.patch.object(UPISearchTool, "create_ui"):
+            tool = UPISearchTool(mock.MagicMock())
+        tool.asset_class.set(asset_class)
+        tool.product_type.set(product)
+        tool.upi_data = records
+        tool.upi_partitions = UPIPartitionIndex(records)
+        tool.build_reference_rate_index()
+        return tool
+
+    def column_mapping(self, **columns):
+        """Mapping of UPI fields to trade columns"""
+        return {field_name: {"method": "column", "value": column} for field_name, column in columns.items()}
+
+    def upi_code(self, record):
+        return record["Identifier"]["UPI"] if record else None
+
+class TestRouteTrade(ToolTestCase):
+    def setUp(self):
+        """Create a tool routing on Product and Asset columns"""
+        self.tool = self.make_tool()
+        self.tool.auto_route.set(True)
+        self.tool.route_product_column.set("Product")
+        self.tool.route_asset_class_column.set("Asset")
+
+    def route(self, **trade):
+        return self.tool.route_trade(pd.Series(trade))
+
+    def test_asset_column_is_normalised(self):
+        """Test that asset class spellings, case and separators are recognised"""
+        self.assertEqual(self.route(Asset="Foreign Exchange", Product="Forward"), ("FX", "Forward"))
+        self.assertEqual(self.route(Asset="fx", Product="Forward"), ("FX", "Forward"))
+        self.assertEqual(self.route(Asset="Interest_Rates", Product="Basis"), ("IR", "Basis"))
+        self.assertEqual(self.route(Asset="rates", Product="basis"), ("IR", "Basis"))
+
+    def test_unknown_asset_class_is_not_routed(self):
+        """Test that an asset class value outside FX and IR leaves the trade unrouted"""
+        self.assertEqual(self.route(Asset="Credit", Product="Forward"), ("FX", None))
+
+    def test_missing_asset_value_uses_selected_asset_class(self):
+        """Test that a blank asset class cell falls back to the asset class selected in the UI"""
+        self.assertEqual(self.route(Asset=None, Product="NDF"), ("FX", "NDF"))
+        self.tool.route_asset_class_column.set("N/A")
+        self.assertEqual(self.route(Product="Vanilla Option"), ("FX", "Vanilla_Option"))
+
+    def test_longest_contained_product_is_used(self):
+        """Test that a product value containing UPI product names routes to the longest one"""
+        # "FX Forward NDF" contains both FORWARD and NDF - the longer name wins
+        self.assertEqual(self.route(Asset="FX", Product="FX Forward NDF"), ("FX", "Forward"))
+        self.assertEqual(self.route(Asset="FX", Product="Vanilla_Option_EUR"), ("FX", "Vanilla_Option"))
+        self.assertEqual(self.route(Asset="FX", Product="Swaption"), ("FX", None))
+        self.assertEqual(self.route(Asset="FX", Product=None), ("FX", None))
+
+    def test_routes_are_cached_per_asset_class_and_value(self):
+        """Test that each normalised product value is looked up in the UPI data once"""
+        source = self.tool.get_upi_source()
+        with mock.patch.object(source, "get_use_cases", wraps=source.get_use_cases) as get_use_cases:
+            for product in ["ndf", "NDF", "N_D_F", "Forward"]:
+                self.route(Asset="FX", Product=product)
+        self.assertEqual(get_use_cases.call_count, 2)
+        self.assertEqual(self.tool.route_cache[("FX", "NDF")], ("FX", "NDF"))
+
+    def test_route_mapping_keeps_the_product_fields(self):
+        """Test that a route's mapping is the full mapping restricted to its product's fields"""
+        mapping = self.column_mapping(InstrumentType="Instr", NotionalCurrency="Ccy1", OtherNotionalCurrency="Ccy2",
+                                      DeliveryType="Delivery", SettlementCurrency="Settle", ReferenceRate="Rate")
+        self.assertEqual(set(self.tool.get_route_mapping(("FX", "Forward"), mapping)),
+                         {"InstrumentType", "NotionalCurrency", "OtherNotionalCurrency", "DeliveryType"})
+        self.assertEqual(set(self.tool.get_route_mapping(("FX", "NDF"), mapping)),
+                         {"InstrumentType", "NotionalCurrency", "OtherNotionalCurrency", "SettlementCurrency"})
+        self.assertEqual(set(self.tool.get_route_mapping(("IR", "Basis"), mapping)),
+                         {"NotionalCurrency", "DeliveryType", "ReferenceRate"})
+        self.assertIn(("IR", "Basis"), self.tool.route_mapping_fields)
+
+class TestMixedSearch(ToolTestCase):
+    def setUp(self):
+        """Create a routing tool over a mixed FX/IR trade file, with stand-ins for the search widgets"""
+        self.trades = pd.DataFrame([
+            {"Asset": "FX", "Product": "FX Forward", "Instr": "Forward", "Ccy1": "USD", "Ccy2": "EUR", "Delivery": "PHYS"},
+            {"Asset": "Rates", "Product": "Basis Swap", "Ccy1": "USD", "Rate": "USD-SOFR", "TermValue": 3, "TermUnit": "MNTH",
+             "Schedule": "Constant", "Delivery": "CASH", "OtherRate": "USD-LIBOR-BBA", "OtherTermValue": 3, "OtherTermUnit": "MNTH"},
+            {"Asset": "Foreign Exchange", "Product": "ndf", "Instr": "Forward", "Ccy1": "USD", "Ccy2": "KRW", "Settle": "USD"},
+            {"Asset": "FX", "Product": "Swaption", "Ccy1": "USD", "Ccy2": "EUR"},
+        ])
+        self.mapping = self.column_mapping(
+            InstrumentType="Instr", NotionalCurrency="Ccy1", OtherNotionalCurrency="Ccy2", DeliveryType="Delivery",
+            SettlementCurrency="Settle", ReferenceRate="Rate", ReferenceRateTermValue="TermValue",
+            ReferenceRateTermUnit="TermUnit", NotionalSchedule="Schedule", OtherLegReferenceRate="OtherRate",
+            OtherLegReferenceRateTermValue="OtherTermValue", OtherLegReferenceRateTermUnit="OtherTermUnit")
+
+        tool = self.tool = self.make_tool()
+        tool.trade_data = self.trades
+        tool.auto_route.set(True)
+        tool.route_product_column.set("Product")
+        tool.route_asset_class_column.set("Asset")
+        tool.mapping_vars = {field_name: {"method": Var(value=info["method"]), "value": Var(value=info["value"])}
+                             for field_name, info in self.mapping.items()}
+        for name in ["status_mapping", "results_summary", "results_page_label"]:
+            setattr(tool, name, Var(value=""))
+        tool.results_sort = Var(value="Trade Order")
+        tool.results_status_filter = Var(value="All")
+        tool.results_min_score = Var(value="0")
+        for name in ["results_tree", "results_text", "progress_frame", "progress_bar", "progress_label",
+                     "export_button", "tab1", "tab4"]:
+            setattr(tool, name, mock.MagicMock())
+
+        # Slices scheduled with after() are queued here instead of on a Tk event loop
+        self.scheduled = []
+        tool.root.after.side_effect = lambda delay, callback, *args: self.scheduled.append((callback, args))
+
+    def run_search(self):
+        """Start the search and run its scheduled slices until it ends"""
+        with mock.patch.object(upi_search_tool.messagebox, "showerror") as showerror:
+            self.tool.search_upis()
+            while self.scheduled:
+                callback, args = self.scheduled.pop(0)
+                callback(*args)
+        showerror.assert_not_called()
+        self.assertFalse(self.tool.search_running)
+
+    def test_mixed_fx_and_ir_trades_in_one_pass(self):
+        """Test that one search scores FX and IR trades against their own product, like separate runs"""
+        tool = self.tool
+        self.run_search()
+
+        self.assertEqual(tool.result_routes, [("FX", "Forward"), ("IR", "Basis"), ("FX", "NDF"), ("FX", None)])
+        self.assertEqual(tool.unrouted_count, 1)
+        results = list(tool.results)
+        self.assertEqual([self.upi_code(result["MatchedUPI"]) for result in results],
+                         ["QZFWD0000001", "QZIRS0000001", "QZNDF0000001", None])
+        self.assertEqual([(result["AssetClass"], result["ProductType"]) for result in results],
+                         [("FX", "Forward"), ("IR", "Basis"), ("FX", "NDF"), ("FX", "")])
+        self.assertTrue(results[3]["Message"].startswith("Trade could not be routed"))
+        self.assertTrue(tool.status_mapping.get().startswith("UPI search completed. 3/4 trades matched."))
+
+        # Each routed trade gets the result of a run with its product selected
+        for position, (asset_class, product) in enumerate(tool.result_routes[:3]):
+            single = self.make_tool(asset_class=asset_class, product=product)
+            fields = [field_name for _, field_name, _ in single.get_mapping_fields()]
+            expected = single.find_matching_upi(self.trades.iloc[position],
+                                                {field_name: self.mapping[field_name] for field_name in fields})
+            self.assertEqual((results[position]["Score"], results[position]["Message"]),
+                             (expected["Score"], expected["Message"]))
+
+    def test_search_returns_to_the_event_loop_between_slices(self):
+        """Test that trades are searched in slices scheduled with after(), with results readable in between"""
+        tool = self.tool
+        with mock.patch.object(upi_search_tool, "SEARCH_SLICE_MS", 0):
+            tool.search_upis()
+            # One trade per slice - the rest wait for the event loop
+            self.assertTrue(tool.search_running)
+            self.assertEqual(len(tool.results), 1)
+            self.assertEqual(tool.status_mapping.get(), "Searching UPIs... 1/4")
+            self.assertEqual(len(self.scheduled), 1)
+
+            # A second search is not started while one runs
+            tool.search_upis()
+            self.assertEqual(len(tool.results), 1)
+            self.run_search()
+
+        self.assertEqual(len(tool.results), 4)
+        self.assertEqual(tool.results_view, [0, 1, 2, 3])
+
+class TestExactMatch(ToolTestCase):
+    def setUp(self):
+        """Create a tool mapped with the FX Forward fields of the mapping tab"""
+        self.tool = self.make_tool()
+        columns = {"InstrumentType": "Instr", "NotionalCurrency": "Ccy1", "OtherNotionalCurrency": "Ccy2",
+                   "DeliveryType": "Delivery"}
+        self.mapping = self.column_mapping(**{field_name: columns[field_name]
+                                              for _, field_name, _ in self.tool.get_fx_mapping_fields("Forward")})
+        self.partition = ("Foreign_Exchange", "Forward", None)
+
+    def test_fx_mapping_resolves_exact_match(self):
+        """Test that a trade equal to a UPI on its attributes is resolved although InstrumentType is a Header field"""
+        trade = pd.Series({"Instr": "Forward", "Ccy1": "usd", "Ccy2": "EUR", "Delivery": "PHYS"})
+        record = self.tool.find_exact_match(trade, self.mapping, self.partition)
+        self.assertEqual(self.upi_code(record), "QZFWD0000001")
+        self.assertEqual(self.tool.calculate_upi_score(trade, self.mapping, record), 100)
+
+        result = self.tool.find_matching_upi(trade, self.mapping)
+        self.assertEqual(self.tool.exact_match_count, 1)
+        self.assertEqual((self.upi_code(result["MatchedUPI"]), result["Score"]), ("QZFWD0000001", 100))
+        self.assertIn("exact match", result["Message"])
+
+    def test_partial_agreement_is_scored(self):
+        """Test that a trade differing on one attribute falls through to scoring"""
+        trade = pd.Series({"Instr": "Forward", "Ccy1": "USD", "Ccy2": "EUR", "Delivery": "CASH"})
+        self.assertIsNone(self.tool.find_exact_match(trade, self.mapping, self.partition))
+
+        result = self.tool.find_matching_upi(trade, self.mapping)
+        self.assertEqual(self.tool.exact_match_count, 0)
+        self.assertLess(result["Score"], 100)
+
+    def test_blank_and_padded_values_agree_across_paths(self):
+        """Test that the negative lookup, exact match and score skip and normalize the same trade values"""
+        trade = pd.Series({"Instr": "Forward", "Ccy1": " usd ", "Ccy2": "eur ", "Delivery": float("nan")})
+        self.assertTrue(self.tool.can_match_partition(trade, self.mapping, self.partition))
+        record = self.tool.find_exact_match(trade, self.mapping, self.partition)
+        self.assertEqual(self.upi_code(record), "QZFWD0000001")
+        self.assertEqual(self.tool.calculate_upi_score(trade, self.mapping, record), 100)
+
+        trade = pd.Series({"Instr": float("nan"), "Ccy1": "GBP", "Ccy2": "", "Delivery": ""})
+        self.assertFalse(self.tool.can_match_partition(trade, self.mapping, self.partition))
+        self.assertIsNone(self.tool.find_exact_match(trade, self.mapping, self.partition))
+
+class TestExistingUPI(ToolTestCase):
+    def setUp(self):
+        """Create a tool validating the UPI column of FX Forward trades"""
+        records = UPI_RECORDS + [
+            make_upi("QZFWD0000003", "Foreign_Exchange", "Forward", "Forward", status="Expired",
+                     NotionalCurrency="USD", OtherNotionalCurrency="GBP", DeliveryType="CASH"),
+        ]
+        self.tool = self.make_tool(records)
+        self.tool.existing_upi_column = "UPI"
+        self.mapping = self.column_mapping(NotionalCurrency="Ccy1", OtherNotionalCurrency="Ccy2", DeliveryType="Delivery")
+
+    def search(self, upi, ccy2, delivery):
+        trade = pd.Series({"UPI": upi, "Ccy1": "USD", "Ccy2": ccy2, "Delivery": delivery})
+        return self.tool.find_matching_upi(trade, self.mapping)
+
+    def test_active_matching_upi_is_confirmed(self):
+        """Test that an active UPI agreeing with the trade is confirmed without a search"""
+        with mock.patch.object(self.tool, "find_exact_match") as find_exact_match:
+            result = self.search("QZFWD0000002", "JPY", "CASH")
+        find_exact_match.assert_not_called()
+        self.assertEqual((self.upi_code(result["MatchedUPI"]), result["Score"]), ("QZFWD0000002", 100))
+        self.assertTrue(result["Message"].startswith("Existing UPI confirmed"))
+        self.assertEqual((self.tool.confirmed_upi_count, self.tool.rejected_upi_count), (1, 0))
+
+    def test_inactive_upi_is_searched(self):
+        """Test that a UPI with an inactive status is rejected and the trade searched"""
+        record, score, problem = self.tool.check_existing_upi(
+            pd.Series({"Ccy1": "USD", "Ccy2": "GBP", "Delivery": "CASH"}), self.mapping, "QZFWD0000003",
+            ("Foreign_Exchange", "Forward", None))
+        self.assertEqual((self.upi_code(record), score, problem), ("QZFWD0000003", 0, "is not active (status Expired)"))
+
+        result = self.search("QZFWD0000003", "JPY", "CASH")
+        self.assertEqual(self.upi_code(result["MatchedUPI"]), "QZFWD0000002")
+        self.assertTrue(result["Message"].startswith("Existing UPI QZFWD0000003 is not active"))
+        self.assertEqual(self.tool.rejected_upi_count, 1)
+
+    def test_attribute_mismatch_falls_back_to_search(self):
+        """Test that a UPI disagreeing on a mapped field is rejected and the best UPI found by search"""
+        result = self.search("QZFWD0000002", "EUR", "PHYS")
+        self.assertEqual((self.upi_code(result["MatchedUPI"]), result["Score"]), ("QZFWD0000001", 100))
+        self.assertIn("Existing UPI QZFWD0000002 disagrees on OtherNotionalCurrency (EUR vs JPY); searched instead.",
+                      result["Message"])
+        self.assertEqual((self.tool.confirmed_upi_count, self.tool.rejected_upi_count), (0, 1))
+
+    def test_unknown_upi_is_searched(self):
+        """Test that a UPI missing from the data is reported and the trade searched"""
+        result = self.search("QZUNKNOWN000", "EUR", "PHYS")
+        self.assertEqual(self.upi_code(result["MatchedUPI"]), "QZFWD0000001")
+        self.assertTrue(result["Message"].startswith("Existing UPI QZUNKNOWN000 not found in the UPI data; searched instead."))
+
+    def test_other_product_upi_is_searched(self):
+        """Test that an active UPI of another product is rejected"""
+        result = self.search("QZNDF0000001", "EUR", "PHYS")
+        self.assertEqual(self.upi_code(result["MatchedUPI"]), "QZFWD0000001")
+        self.assertIn("is a NDF Forward, not a Forward", result["Message"])
+
+    def test_validation_is_off_by_default(self):
+        """Test that no existing-UPI column is used unless one is picked"""
+        tool = self.make_tool()
+        self.assertEqual(tool.validate_upi_column.get(), "N/A")
+        self.assertIsNone(tool.get_existing_upi(pd.Series({"UPI": "QZFWD0000002"})))
+
+class TestTradeTimeLimit(ToolTestCase):
+    def setUp(self):
+        """Create a tool with a per-trade time limit, mapped on currencies and delivery type"""
+        self.tool = self.make_tool()
+        self.tool.trade_time_limit_ms = 5
+        self.mapping = self.column_mapping(NotionalCurrency="Ccy1", OtherNotionalCurrency="Ccy2", DeliveryType="Delivery")
+
+    def test_deadline_returns_best_so_far(self):
+        """Test that scoring stops at the deadline with the ranked-first candidate as a partial result"""
+        # The clock reads 0 when the trade starts and 1 s at every later check
+        clock = iter([0.0] + [1.0] * 10)
+        trade = pd.Series({"Ccy1": "GBP", "Ccy2": "JPY", "Delivery": "CASH"})
+        with mock.patch.object(upi_search_tool.time, "perf_counter", lambda: next(clock)):
+            result = self.tool.find_matching_upi(trade, self.mapping)
+
+        # QZFWD0000002 holds the JPY lookup, so it is scored first although it comes second in the file
+        self.assertTrue(result["Partial"])
+        self.assertEqual((self.upi_code(result["MatchedUPI"]), result["Score"]), ("QZFWD0000002", 58))
+        self.assertTrue(result["Message"].startswith("Partial result: time limit of 5 ms reached after scoring 1 candidates."))
+        self.assertEqual(self.tool.deadline_hit_count, 1)
+        self.assertEqual(self.tool.latency.deadline_hits, 1)
+
+        # The flag is kept with the stored result and comes back when it is materialized
+        self.tool.results = upi_search_tool.CompactResults(top_k=5, materializer=self.tool.materialize_result)
+        self.tool.trade_data = pd.DataFrame([trade])
+        self.tool.result_routes = [("FX", "Forward")]
+        self.tool.store_result(0, result)
+        self.assertTrue(self.tool.results.partial(0))
+        self.assertTrue(self.tool.results[0]["Partial"])
+
+    def test_ranked_scoring_breaks_ties_by_file_position(self):
+        """Test that a limit that is never hit gives the result of an unlimited search, ties included"""
+        records = [
+            make_upi("QZOPT0000001", "Foreign_Exchange", "Option", "Vanilla_Option", OptionType="CALL", DeliveryType="CASH"),
+            make_upi("QZOPT0000002", "Foreign_Exchange", "Option", "Vanilla_Option", OptionType="PUT", DeliveryType="PHYS"),
+        ]
+        mapping = self.column_mapping(OptionType="Option", DeliveryType="Delivery")
+        trade = pd.Series({"Option": "PUT", "Delivery": "CASH"})
+
+        unlimited = self.make_tool(records, product="Vanilla_Option")
+        limited = self.make_tool(records, product="Vanilla_Option")
+        limited.trade_time_limit_ms = 60000
+        expected = unlimited.find_matching_upi(trade, mapping)
+        result = limited.find_matching_upi(trade, mapping)
+
+        # The PUT record is ranked first, but the tie at 50 goes to the record earlier in the file
+        self.assertEqual([match["score"] for match in expected["AllMatches"]], [50, 50])
+        self.assertFalse(result["Partial"])
+        self.assertEqual(self.upi_code(result["MatchedUPI"]), "QZOPT0000001")
+        self.assertEqual([self.upi_code(match["upi"]) for match in result["AllMatches"]],
+                         [self.upi_code(match["upi"]) for match in expected["AllMatches"]])
+        self.assertEqual(result["Message"], expected["Message"])
+
+if __name__ == "__main__":
+    unittest.main()
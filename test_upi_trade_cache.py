@@ -0,0 +1,82 @@
+import unittest
+import pandas as pd
+import tempfile
+import os
+import io
+import contextlib
+from unittest import mock
+from upi_trade_cache import read_trade_workbook, iter_trade_workbook, trade_cache_paths
+
+try:
+    import pyarrow  # noqa: F401
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+class TestTradeCache(unittest.TestCase):
+    def setUp(self):
+        """Write a trade workbook with text, numbers, dates and empty cells"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.workbook = os.path.join(self.temp_dir.name, "trades.xlsx")
+        self.write_workbook(["EUR/USD", None, "USD/CNH"])
+
+    def tearDown(self):
+        """Remove temporary files"""
+        self.temp_dir.cleanup()
+
+    def write_workbook(self, pairs):
+        pd.DataFrame({
+            "TradeID": [f"T{i:03d}" for i in range(len(pairs))],
+            "CcyPair": pairs,
+            "Notional": [1000000.5 * (i + 1) for i in range(len(pairs))],
+            "TradeDate": pd.to_datetime(["2024-01-31"] * len(pairs)),
+        }).to_excel(self.workbook, index=False)
+
+    def load(self):
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            df = read_trade_workbook(self.workbook)
+        return df, output.getvalue()
+
+    def check_cache_round_trip(self, sidecar):
+        expected = pd.read_excel(self.workbook)
+
+        first, output = self.load()
+        self.assertNotIn("from cache", output)
+        self.assertTrue(os.path.exists(sidecar))
+        pd.testing.assert_frame_equal(first, expected)
+
+        second, output = self.load()
+        self.assertIn("from cache", output)
+        pd.testing.assert_frame_equal(second, expected)
+
+        # A changed workbook is read again, not served from the stale sidecar
+        self.write_workbook(["GBP/JPY"])
+        third, output = self.load()
+        self.assertNotIn("from cache", output)
+        self.assertEqual(list(third["CcyPair"]), ["GBP/JPY"])
+
+    def test_pickle_sidecar_without_pyarrow(self):
+        """Test the pickle sidecar used when pyarrow is not installed"""
+        with mock.patch("upi_trade_cache._write_arrow_sidecar", side_effect=ImportError):
+            self.check_cache_round_trip(trade_cache_paths(self.workbook)[1])
+
+    @unittest.skipUnless(HAVE_PYARROW, "pyarrow not installed")
+    def test_arrow_sidecar(self):
+        """Test the memory-mapped Arrow IPC sidecar"""
+        self.check_cache_round_trip(trade_cache_paths(self.workbook)[0])
+        self.assertFalse(os.path.exists(trade_cache_paths(self.workbook)[1]))
+
+    def test_streamed_chunks(self):
+        """Test that a workbook streamed in chunks reads as read_excel does, then comes from its sidecar"""
+        expected = pd.read_excel(self.workbook)
+        with mock.patch("upi_trade_cache._write_arrow_sidecar", side_effect=ImportError):
+            for attempt in range(2):
+                with contextlib.redirect_stdout(io.StringIO()) as output:
+                    chunks = list(iter_trade_workbook(self.workbook, 2))
+                self.assertEqual([list(chunk.index) for chunk in chunks], [[0, 1], [2]])
+                pd.testing.assert_frame_equal(pd.concat(chunks), expected)
+                self.assertEqual("from cache" in output.getvalue(), attempt == 1)
+                self.assertTrue(os.path.exists(trade_cache_paths(self.workbook)[1]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import re
+import json
+
+# Characters read from the input per step of the streaming parser
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_SCALAR_END = re.compile(r'[,\]} \t\n\r]')
+_decoder = json.JSONDecoder()
+
+class _JSONStream:
+    """Text buffer over a file that the parser consumes from the front"""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Read the next chunk, dropping the consumed part of the buffer; False at end of file"""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character ("" at end of file), without consuming it"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, characters):
+        character = self.peek()
+        if not character or character not in characters:
+            found = repr(character) if character else "end of file"
+            raise ValueError(f"Invalid JSON: expected {' or '.join(map(repr, characters))}, found {found}")
+        self.pos += 1
+        return character
+
+    def value(self):
+        """Decode the next JSON value; returns (its source text, the decoded value)"""
+        if self.peek() not in '{["':
+            # A number may continue in the next chunk - read on until the character after it
+            while _SCALAR_END.search(self.buffer, self.pos) is None and self.fill():
+                pass
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+                break
+            except json.JSONDecodeError:
+                # Incomplete in this chunk, or invalid at the end of the file
+                if not self.fill():
+                    raise
+        start, self.pos = self.pos, end
+        return self.buffer[start:end], value
+
+def iter_json_array(f, key, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield (text, value) for each item of the array under a top-level key of a JSON object
+
+    The file is read in chunks and each item is decoded as soon as it is
+    complete, so only one item is in memory at a time rather than the whole
+    document. Other top-level values are decoded and skipped. Nothing is
+    yielded when the key is missing.
+    """
+    stream = _JSONStream(f, chunk_size)
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+
+    while True:
+        name = stream.value()[1]
+        if not isinstance(name, str):
+            raise ValueError("Invalid JSON: object keys must be strings")
+        stream.expect(":")
+
+        if name == key and stream.peek() == "[":
+            stream.expect("[")
+            if stream.peek() != "]":
+                while True:
+                    yield stream.value()
+                    if stream.expect(",]") == "]":
+                        break
+            else:
+                stream.expect("]")
+        else:
+            stream.value()
+
+        if stream.expect(",}") == "}":
+            return
+
+class JSONRecordList:
+    """List of JSON records kept as their compact source text, decoded on access
+
+    Each record costs about its size in the file instead of a tree of
+    Python objects; a fresh dict is decoded every time an item is read.
+    """
+
+    def __init__(self):
+        self.texts = []
+
+    def append(self, text):
+        self.texts.append(text)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [json.loads(text) for text in self.texts[position]]
+        return json.loads(self.texts[position])
+
+    def __iter__(self):
+        for text in self.texts:
+            yield json.loads(text)
+
+class JSONRecordSubset:
+    """Records of a JSONRecordList (or plain list) picked by position, in the order they were added"""
+
+    def __init__(self, records, positions=None):
+        self.records = records
+        self.positions = [] if positions is None else positions
+
+    def append(self, position):
+        self.positions.append(position)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __iter__(self):
+        for position in self.positions:
+            yield self.records[position]
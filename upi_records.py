@@ -0,0 +1,424 @@
+import json
+import os
+import sys
+import io
+import glob
+import gzip
+import bz2
+import lzma
+import zipfile
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from upi_schema import get_record_validator
+
+# Files smaller than this are decoded in-process - a pool costs more than it saves
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Compressed inputs are streamed through a decompression thread
+COMPRESSED_EXTENSIONS = (".gz", ".bz2", ".xz", ".zip")
+DECOMPRESS_BLOCK_SIZE = 1024 * 1024
+DECOMPRESS_QUEUE_BLOCKS = 16
+
+# Lines decoded between two progress reports (and cancellation checks)
+PROGRESS_LINES = 5000
+
+# Rejected lines kept as examples in the ingest statistics
+REJECT_SAMPLES = 5
+
+class LoadCancelled(Exception):
+    """Raised when a load is stopped through its cancel event"""
+
+class RejectLog:
+    """Rejected RECORDS lines counted by reason, with the first few kept as samples"""
+
+    def __init__(self):
+        self.count = 0
+        self.reasons = {}
+        self.samples = []
+
+    def add(self, reason, file_path, location):
+        self.count += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        if len(self.samples) < REJECT_SAMPLES:
+            self.samples.append(f"{os.path.basename(file_path)} {location}: {reason}")
+
+    def merge(self, other):
+        """Add the rejects of another log (e.g. another chunk)"""
+        self.count += other.count
+        for reason, count in other.reasons.items():
+            self.reasons[reason] = self.reasons.get(reason, 0) + count
+        self.samples.extend(other.samples[:REJECT_SAMPLES - len(self.samples)])
+
+    def format_lines(self):
+        """Summary lines: the most frequent reasons, then the samples"""
+        if not self.count:
+            return []
+        lines = [f"{self.count} lines rejected:"]
+        for reason, count in sorted(self.reasons.items(), key=lambda item: -item[1])[:10]:
+            lines.append(f"  {count:>8}  {reason}")
+        lines.append("  e.g. " + "\n       ".join(self.samples))
+        return lines
+
+def is_compressed_file(file_path):
+    """Check whether a path names a compressed input by its extension"""
+    return file_path.lower().endswith(COMPRESSED_EXTENSIONS)
+
+def _open_compressed_binary(file_path):
+    """Open the decompressed byte stream of a .gz, .bz2, .xz or .zip file"""
+    lower_path = file_path.lower()
+    if lower_path.endswith(".gz"):
+        return gzip.open(file_path, 'rb')
+    if lower_path.endswith(".bz2"):
+        return bz2.open(file_path, 'rb')
+    if lower_path.endswith(".xz"):
+        return lzma.open(file_path, 'rb')
+
+    # Zip archives: stream the first file member (DSB archives hold a single file)
+    archive = zipfile.ZipFile(file_path)
+    members = [info for info in archive.infolist() if not info.is_dir()]
+    if not members:
+        archive.close()
+        raise ValueError(f"Zip archive is empty: {file_path}")
+    stream = archive.open(members[0])
+
+    # Close the archive together with the member stream
+    member_close = stream.close
+    def close():
+        member_close()
+        archive.close()
+    stream.close = close
+    return stream
+
+class PipelinedReader(io.RawIOBase):
+    """Binary stream fed by a background thread that reads from another stream
+
+    The decompressors release the GIL while they work, so the reader thread
+    decompresses the next blocks while the caller is still decoding JSON.
+    """
+
+    def __init__(self, source, block_size=DECOMPRESS_BLOCK_SIZE, max_blocks=DECOMPRESS_QUEUE_BLOCKS):
+        super().__init__()
+        self.source = source
+        self.block_size = block_size
+        self.blocks = queue.Queue(maxsize=max_blocks)
+        self.stopped = threading.Event()
+        self.pending = b""
+        self.finished = False
+        self.thread = threading.Thread(target=self._produce, daemon=True)
+        self.thread.start()
+
+    def _produce(self):
+        """Reader thread: push decompressed blocks until EOF, error or close"""
+        try:
+            while not self.stopped.is_set():
+                block = self.source.read(self.block_size)
+                if not block:
+                    break
+                self._put(block)
+            self._put(None)
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item):
+        """Queue an item, giving up if the consumer has closed the stream"""
+        while not self.stopped.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.pending and not self.finished:
+            item = self.blocks.get()
+            if item is None:
+                self.finished = True
+            elif isinstance(item, Exception):
+                self.finished = True
+                raise item
+            else:
+                self.pending = item
+
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.stopped.set()
+            self.thread.join()
+            self.source.close()
+        super().close()
+
+def open_input_file(file_path, mode='r', encoding='utf-8'):
+    """Open a plain or compressed input file for reading
+
+    Compressed files (.gz, .bz2, .xz, .zip) are decompressed on the fly in a
+    pipelined reader thread instead of being unpacked to disk first.
+    """
+    if not is_compressed_file(file_path):
+        if 'b' in mode:
+            return open(file_path, 'rb')
+        return open(file_path, 'r', encoding=encoding)
+
+    stream = io.BufferedReader(PipelinedReader(_open_compressed_binary(file_path)), DECOMPRESS_BLOCK_SIZE)
+    if 'b' in mode:
+        return stream
+    return io.TextIOWrapper(stream, encoding=encoding)
+
+def is_valid_upi_record(record):
+    """Validate that the record has the expected UPI structure"""
+    return record_problem(record) is None
+
+def record_problem(record):
+    """Why a decoded line is not a usable UPI record, or None when it is"""
+    try:
+        # Check for required top-level keys
+        required_keys = ["Header", "Identifier", "Derived", "Attributes"]
+        for key in required_keys:
+            if key not in record:
+                return f"record: missing {key}"
+
+        # Check Header structure
+        header = record.get("Header", {})
+        for key in ["AssetClass", "InstrumentType", "UseCase", "Level"]:
+            if key not in header:
+                return f"Header: missing {key}"
+
+        # Check Identifier structure
+        identifier = record.get("Identifier", {})
+        if not identifier.get("UPI"):
+            return "Identifier: missing UPI"
+
+        return None
+
+    except Exception:
+        return "record: expected object"
+
+def resolve_records_paths(source):
+    """Expand a RECORDS file, a directory of RECORDS files or a glob pattern into file paths"""
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+        paths = [path for path in paths if os.path.isfile(path)]
+    elif os.path.isfile(source):
+        paths = [source]
+    else:
+        paths = [path for path in glob.glob(source) if os.path.isfile(path)]
+
+    if not paths:
+        raise FileNotFoundError(f"No RECORDS files found for: {source}")
+
+    # Sorted so DSB daily files are merged oldest first and later updates win
+    return sorted(paths)
+
+def split_file_ranges(file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Split a file into (start, end) byte ranges that begin and end on line boundaries
+
+    Compressed files cannot be entered mid-stream and are returned as a single
+    range with an open end.
+    """
+    if is_compressed_file(file_path):
+        return [(0, None)]
+
+    file_size = os.path.getsize(file_path)
+    if file_size <= chunk_size:
+        return [(0, file_size)]
+
+    boundaries = [0]
+    with open(file_path, 'rb') as f:
+        position = chunk_size
+        while position < file_size:
+            # Step back one byte so a range that already starts a line is kept as-is
+            f.seek(position - 1)
+            f.readline()
+            aligned = f.tell()
+            if aligned >= file_size:
+                break
+            if aligned > boundaries[-1]:
+                boundaries.append(aligned)
+            position = aligned + chunk_size
+    boundaries.append(file_size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def parse_records_range(file_path, start, end, asset_class_filter=None, schema_dir=None,
+                        progress=None, cancel_event=None):
+    """Decode and validate the RECORDS lines in one byte range of a file
+
+    An end of None reads the whole (compressed) file. With a schema_dir, records
+    are also checked against the compiled record templates in that directory.
+    progress, if given, is called every PROGRESS_LINES lines with (bytes of the
+    range consumed, records so far, rejected so far); bytes stay 0 for
+    compressed files. Setting cancel_event stops decoding with LoadCancelled.
+    Returns a tuple of (records, RejectLog).
+    """
+    validator = get_record_validator(schema_dir) if schema_dir else None
+
+    if end is None:
+        # Whole compressed file, streamed line by line
+        with open_input_file(file_path, 'rb') as f:
+            located_lines = ((f"line {line_num}", line, 0) for line_num, line in enumerate(f, 1))
+            return _decode_records_lines(file_path, located_lines, asset_class_filter, validator, progress, cancel_event)
+
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    def located_lines():
+        offset = start
+        for line in data.split(b"\n"):
+            yield f"byte {offset}", line, len(line) + 1
+            offset += len(line) + 1
+
+    return _decode_records_lines(file_path, located_lines(), asset_class_filter, validator, progress, cancel_event)
+
+def _decode_records_lines(file_path, located_lines, asset_class_filter, validator=None, progress=None, cancel_event=None):
+    """Decode and validate (location, line, size) triples into UPI records"""
+    records = []
+    rejects = RejectLog()
+    consumed = 0
+
+    for line_count, (location, line, size) in enumerate(located_lines, 1):
+        consumed += size
+        if line_count % PROGRESS_LINES == 0:
+            if cancel_event is not None and cancel_event.is_set():
+                raise LoadCancelled("Load cancelled")
+            if progress is not None:
+                progress(consumed, len(records), rejects.count)
+
+        line = line.strip()
+
+        # Skip empty lines and comments
+        if not line or line.startswith(b'#'):
+            continue
+
+        try:
+            record = json.loads(line)
+        except ValueError:
+            rejects.add("invalid JSON", file_path, location)
+            continue
+
+        problem = record_problem(record)
+        if problem is None and validator is not None:
+            problem = validator.check(record)
+        if problem is not None:
+            rejects.add(problem, file_path, location)
+            continue
+
+        if asset_class_filter and record["Header"].get("AssetClass") != asset_class_filter:
+            continue
+
+        records.append(record)
+
+    return records, rejects
+
+def shutdown_executor(executor, wait=True, cancel_pending=False):
+    """Shut down a pool, dropping work not yet started when cancel_pending is set
+
+    Queued work can only be dropped from Python 3.9 on; before that it still
+    runs to completion (the results are discarded).
+    """
+    if cancel_pending and sys.version_info >= (3, 9):
+        executor.shutdown(wait=wait, cancel_futures=True)
+    else:
+        executor.shutdown(wait=wait)
+
+def _parse_records_task(task):
+    """Process pool entry point for parse_records_range"""
+    return parse_records_range(*task)
+
+def _task_size(task):
+    """Bytes a parse task covers on disk (a whole compressed file for open-ended tasks)"""
+    path, start, end = task[:3]
+    return os.path.getsize(path) if end is None else end - start
+
+def ingest_records(source, asset_class_filter=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                   progress=None, cancel_event=None, schema_dir=None):
+    """Ingest one or many RECORDS files across a process pool
+
+    The source may be a file, a directory or a glob pattern. Large files are
+    split into newline-aligned byte ranges so a single multi-GB file is decoded
+    on every core. Records are merged into one dataset deduplicated by
+    Identifier.UPI, with the last occurrence (in file order) winning.
+
+    With a schema_dir (e.g. upi_schema.DEFAULT_SCHEMA_DIR), records are also
+    validated against the DSB record templates there, compiled once per worker.
+    Rejected lines are counted by reason in stats["rejects"] (a RejectLog).
+
+    Decoded records travel back from the workers pickled, and the parent
+    unpickles every one, so the pool's gain is bounded by that transfer (about
+    half the cost of decoding; see upi_records_benchmark.py).
+
+    progress, if given, is called with a dict of bytes, total_bytes, parsed and
+    rejected - per finished chunk, and every PROGRESS_LINES lines when decoding
+    in-process. Setting cancel_event stops the ingest with LoadCancelled.
+
+    Returns a tuple of (records, stats).
+    """
+    paths = resolve_records_paths(source)
+
+    tasks = []
+    for path in paths:
+        for start, end in split_file_ranges(path, chunk_size):
+            tasks.append((path, start, end, asset_class_filter, schema_dir))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(tasks)))
+
+    total_bytes = sum(_task_size(task) for task in tasks)
+    done_bytes = 0
+    merged = {}
+    parsed = 0
+    rejects = RejectLog()
+
+    def report(chunk_bytes=0, chunk_parsed=0, chunk_rejected=0):
+        if progress is not None:
+            progress({"bytes": done_bytes + chunk_bytes, "total_bytes": total_bytes,
+                      "parsed": parsed + chunk_parsed, "rejected": rejects.count + chunk_rejected})
+
+    # Tasks decoded in-process report their progress line by line
+    def parse_in_process(task):
+        return parse_records_range(*task, progress=report, cancel_event=cancel_event)
+
+    # map() keeps task order, so the merge below is deterministic
+    if workers == 1:
+        chunk_results = map(parse_in_process, tasks)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        chunk_results = executor.map(_parse_records_task, tasks)
+
+    cancelled = False
+    try:
+        for task, (records, chunk_rejects) in zip(tasks, chunk_results):
+            parsed += len(records)
+            rejects.merge(chunk_rejects)
+            for record in records:
+                merged[record["Identifier"]["UPI"]] = record
+
+            done_bytes += _task_size(task)
+            report()
+            if cancel_event is not None and cancel_event.is_set():
+                cancelled = True
+                raise LoadCancelled("Load cancelled")
+    finally:
+        if workers > 1:
+            # On cancel, drop queued chunks instead of waiting for them
+            shutdown_executor(executor, wait=not cancelled, cancel_pending=cancelled)
+
+    stats = {
+        "files": len(paths),
+        "chunks": len(tasks),
+        "workers": workers,
+        "parsed": parsed,
+        "rejected": rejects.count,
+        "rejects": rejects,
+        "duplicates": parsed - len(merged),
+    }
+
+    return list(merged.values()), stats
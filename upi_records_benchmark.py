@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+import json
+import pickle
+import random
+import argparse
+import tempfile
+from upi_records import ingest_records
+
+# Synthetic RECORDS values
+CURRENCIES = ["USD", "EUR", "GBP", "JPY", "HKD", "CNY", "AUD", "CHF"]
+USE_CASES = ["Forward", "NDF", "Non_Standard"]
+DELIVERY_TYPES = ["PHYS", "CASH"]
+
+def write_records_file(path, count, rng):
+    """Write count FX Forward RECORDS lines"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            ccy1, ccy2 = rng.sample(CURRENCIES, 2)
+            record = {
+                "TemplateVersion": 1,
+                "Header": {"AssetClass": "Foreign_Exchange", "InstrumentType": "Forward",
+                           "UseCase": rng.choice(USE_CASES), "Level": "UPI"},
+                "Identifier": {"UPI": f"QZ{i:010d}", "Status": "New", "LastUpdateDateTime": "2024-01-01T00:00:00"},
+                "Derived": {"ShortName": f"NA/Fwd {ccy1} {ccy2}", "ClassificationType": "JFTXFC"},
+                "Attributes": {"NotionalCurrency": ccy1, "OtherNotionalCurrency": ccy2, "SettlementCurrency": ccy1,
+                               "DeliveryType": rng.choice(DELIVERY_TYPES)},
+            }
+            f.write(json.dumps(record) + "\n")
+
+def time_ingest(path, workers, chunk_size):
+    """Seconds to ingest the file with a number of workers, and the records"""
+    start = time.perf_counter()
+    records, stats = ingest_records(path, workers=workers, chunk_size=chunk_size)
+    return time.perf_counter() - start, records, stats
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parallel RECORDS ingest')
+    parser.add_argument('--records', type=int, default=200000, help='Number of synthetic RECORDS lines')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Pool size to compare with one process')
+    parser.add_argument('--chunk-mb', type=float, default=8, help='Chunk size in MB')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "bench.RECORDS")
+            write_records_file(path, args.records, random.Random(args.seed))
+            chunk_size = int(args.chunk_mb * 1024 * 1024)
+
+            single_seconds, records, _ = time_ingest(path, 1, chunk_size)
+            pool_seconds, pool_records, stats = time_ingest(path, args.workers, chunk_size)
+            if pool_records != records:
+                raise Exception("Error in benchmark: pooled and in-process records differ")
+
+            # Pool workers send their decoded records back pickled; the parent unpickles
+            # every one of them, which no number of workers speeds up
+            payload = pickle.dumps(records, protocol=pickle.HIGHEST_PROTOCOL)
+            start = time.perf_counter()
+            pickle.loads(payload)
+            transfer_seconds = time.perf_counter() - start
+    except Exception as e:
+        print(f"Benchmark failed: {str(e)}")
+        sys.exit(1)
+
+    print(f"Ingested {len(records)} records in {stats['chunks']} chunks")
+    print(f"One process:          {single_seconds:.3f}s")
+    print(f"{stats['workers']} workers:            {pool_seconds:.3f}s (speed-up {single_seconds / pool_seconds:.2f}x)")
+    print(f"Parent unpickling:    {transfer_seconds:.3f}s (speed-up is at most {single_seconds / transfer_seconds:.1f}x)")
+
+if __name__ == "__main__":
+    main()
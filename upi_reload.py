@@ -0,0 +1,131 @@
+import os
+import threading
+from datetime import datetime
+from upi_records import resolve_records_paths, LoadCancelled
+
+# Seconds between checks of a watched UPI source for changes
+RELOAD_CHECK_SECONDS = 5.0
+
+def source_signature(source):
+    """Path, size and modification time of every file of a UPI source (a file, folder or pattern)
+
+    Returns None while the source cannot be read, e.g. while it is being replaced.
+    """
+    try:
+        signature = []
+        for path in resolve_records_paths(source):
+            stat = os.stat(path)
+            signature.append((os.path.abspath(path), stat.st_size, stat.st_mtime_ns))
+        return tuple(signature)
+    except OSError:
+        return None
+
+class UPIDataset:
+    """One loaded version of the UPI data with its lookup indexes
+
+    Matching reads a single dataset; a reload builds a new one and swaps it in
+    as a whole, so a trade is never matched against a mix of two versions.
+    """
+
+    def __init__(self, source, upi_data, upi_partitions, upi_store, reference_rate_index, signature=None):
+        self.source = source
+        self.upi_data = upi_data
+        self.upi_partitions = upi_partitions
+        self.upi_store = upi_store
+        self.reference_rate_index = reference_rate_index
+        self.signature = signature
+        self.loaded_at = datetime.now()
+        self.version = 1
+        # Set for stores built by a reload in the temp directory - deleted on close
+        self.temporary_store = False
+
+    def get_upi_source(self):
+        """The on-disk store or the in-memory partitions"""
+        if self.upi_store is not None:
+            return self.upi_store
+        return self.upi_partitions
+
+    def label(self):
+        """Version stamp shown with results, e.g. "2 (loaded 2024-05-02 09:15:04)" """
+        return f"{self.version} (loaded {self.loaded_at:%Y-%m-%d %H:%M:%S})"
+
+    def close(self):
+        """Release the dataset's on-disk store"""
+        if self.upi_store is None:
+            return
+        self.upi_store.close()
+        if self.temporary_store:
+            try:
+                os.remove(self.upi_store.db_path)
+            except OSError:
+                pass
+
+class UPISourceWatcher:
+    """Watch a UPI source and rebuild its dataset on a background thread when it changes
+
+    build(version, cancel_event) returns the new UPIDataset. A finished build
+    waits in pending until the owner takes it with take_reload(), so the owner
+    decides when to swap (e.g. between two trades). The old dataset keeps
+    serving matches while the new one is built.
+    """
+
+    def __init__(self, source, signature, build, interval=RELOAD_CHECK_SECONDS, first_version=2):
+        self.source = source
+        self.signature = signature
+        self.build = build
+        self.interval = interval
+        self.next_version = first_version
+        self.pending = None
+        self.error = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        """Stop watching; a build in progress is cancelled and a pending dataset released"""
+        self.stopped.set()
+        dataset = self.take_reload()
+        if dataset is not None:
+            dataset.close()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            signature = source_signature(self.source)
+            if signature is None or signature == self.signature:
+                continue
+
+            # Only rebuild once the file has stopped changing (the DSB download is complete)
+            if self.stopped.wait(self.interval) or source_signature(self.source) != signature:
+                continue
+
+            try:
+                dataset = self.build(self.next_version, self.stopped)
+                dataset.version = self.next_version
+                dataset.signature = signature
+            except LoadCancelled:
+                return
+            except Exception as e:
+                # The old dataset stays in use; the source is rebuilt after its next change
+                self.error = str(e)
+                self.signature = signature
+                print(f"Error reloading UPI data: {str(e)}")
+                continue
+
+            self.signature = signature
+            self.next_version += 1
+            self.error = None
+            with self.lock:
+                replaced, self.pending = self.pending, dataset
+            if replaced is not None:
+                replaced.close()  # Superseded before it was ever used
+            if self.stopped.is_set():
+                self.stop()
+
+    def take_reload(self):
+        """The newest rebuilt dataset not yet taken, or None"""
+        with self.lock:
+            dataset, self.pending = self.pending, None
+        return dataset
@@ -0,0 +1,182 @@
+import os
+import glob
+import json
+
+# The DSB record templates (*.UPI.V1.json) are bundled next to this module
+DEFAULT_SCHEMA_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_PATTERN = "*.UPI.V1.json"
+
+# JSON-Schema type name -> check on the decoded JSON value (bool is not an integer in JSON)
+_TYPE_CHECKS = {
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "null": lambda value: value is None,
+}
+
+# Compiled validators per schema directory - each process compiles the templates once
+_validators = {}
+
+def _join(path, key):
+    return f"{path}.{key}" if path else key
+
+def _chain(checks):
+    """Combine checks into one function returning the first problem found (or None)"""
+    if not checks:
+        return None
+    if len(checks) == 1:
+        return checks[0]
+
+    def check(value):
+        for part in checks:
+            problem = part(value)
+            if problem:
+                return problem
+        return None
+    return check
+
+def _compile_type(types, path):
+    if isinstance(types, str):
+        types = [types]
+    tests = [_TYPE_CHECKS[name] for name in types if name in _TYPE_CHECKS]
+    if len(tests) != len(types):
+        return None  # Unknown type name - not checked
+    problem = f"{path or 'record'}: expected {' or '.join(types)}"
+
+    if len(tests) == 1:
+        test = tests[0]
+        return lambda value: None if test(value) else problem
+    return lambda value: None if any(test(value) for test in tests) else problem
+
+def _compile_enum(allowed, path):
+    allowed = frozenset(value for value in allowed if not isinstance(value, (dict, list)))
+    problem = f"{path}: value not allowed"
+
+    def check(value):
+        try:
+            return None if value in allowed else problem
+        except TypeError:
+            return problem  # Unhashable value such as an object
+    return check
+
+def _compile_range(minimum, maximum, path):
+    def check(value):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        if minimum is not None and value < minimum:
+            return f"{path}: below minimum"
+        if maximum is not None and value > maximum:
+            return f"{path}: above maximum"
+        return None
+    return check
+
+def _compile_object(schema, path):
+    required = frozenset(schema.get("required", ()))
+    properties = {}
+    for name, property_schema in schema.get("properties", {}).items():
+        check = compile_schema(property_schema, _join(path, name))
+        if check is not None:
+            properties[name] = check
+    known = frozenset(schema.get("properties", {}))
+    closed = schema.get("additionalProperties") is False
+    dependencies = {name: tuple(needed) for name, needed in schema.get("dependencies", {}).items()
+                    if isinstance(needed, list)}
+
+    def check(value):
+        if not isinstance(value, dict):
+            return None
+        # Key-set comparisons run in C; the offending field is only looked for on failure
+        keys = value.keys()
+        if not keys >= required:
+            return f"{path or 'record'}: missing {min(required - keys)}"
+        if closed and not keys <= known:
+            return f"{path or 'record'}: unexpected field {min(keys - known)}"
+        for name, field_value in value.items():
+            field_check = properties.get(name)
+            if field_check is not None:
+                problem = field_check(field_value)
+                if problem:
+                    return problem
+        for name, needed in dependencies.items():
+            if name in value:
+                for other in needed:
+                    if other not in value:
+                        return f"{path or 'record'}: {name} requires {other}"
+        return None
+    return check
+
+def compile_schema(schema, path=""):
+    """Compile a JSON-Schema (draft-04 subset used by the DSB templates) into a check function
+
+    The function takes a decoded JSON value and returns None when it is valid,
+    or a short problem such as "Attributes.DeliveryType: value not allowed".
+    Supported keywords: type, enum, minimum, maximum, not, properties, required,
+    additionalProperties (false) and dependencies (lists of fields). $ref points
+    at codeset files that are not bundled, so referenced values are not checked.
+    Returns None for a schema that accepts any value.
+    """
+    if not isinstance(schema, dict) or "$ref" in schema:
+        return None
+
+    checks = []
+    # An enum whose values all have the schema's type already implies the type check
+    type_check = _compile_type(schema["type"], path) if "type" in schema else None
+    if type_check is not None and not ("enum" in schema and all(type_check(v) is None for v in schema["enum"])):
+        checks.append(type_check)
+    if "enum" in schema:
+        checks.append(_compile_enum(schema["enum"], path))
+    if "minimum" in schema or "maximum" in schema:
+        checks.append(_compile_range(schema.get("minimum"), schema.get("maximum"), path))
+    if "not" in schema:
+        excluded = compile_schema(schema["not"], path)
+        if excluded is not None:
+            problem = f"{path}: value not allowed"
+            checks.append(lambda value: problem if excluded(value) is None else None)
+    if any(key in schema for key in ("properties", "required", "additionalProperties", "dependencies")):
+        checks.append(_compile_object(schema, path))
+
+    return _chain([check for check in checks if check is not None])
+
+class RecordValidator:
+    """Compiled DSB record templates, one per product (AssetClass, InstrumentType, UseCase)"""
+
+    def __init__(self, schema_dir=DEFAULT_SCHEMA_DIR):
+        self.schema_dir = schema_dir
+        self.templates = {}
+
+        for path in sorted(glob.glob(os.path.join(schema_dir, SCHEMA_PATTERN))):
+            with open(path, 'r', encoding='utf-8') as f:
+                schema = json.load(f)
+            header = schema.get("properties", {}).get("Header", {}).get("properties", {})
+            try:
+                key = tuple(header[field]["enum"][0] for field in ("AssetClass", "InstrumentType", "UseCase"))
+            except (KeyError, IndexError):
+                print(f"Skipping UPI schema without a fixed product header: {os.path.basename(path)}")
+                continue
+            self.templates[key] = compile_schema(schema)
+
+    def check(self, record):
+        """Problem with a record (a dict with a Header), or None when it is valid
+
+        Records of a product without a bundled template are not checked.
+        """
+        header = record.get("Header")
+        if not isinstance(header, dict):
+            return "Header: expected object"
+        template = self.templates.get((header.get("AssetClass"), header.get("InstrumentType"), header.get("UseCase")))
+        if template is None:
+            return None
+        return template(record)
+
+    def is_valid(self, record):
+        return self.check(record) is None
+
+def get_record_validator(schema_dir=DEFAULT_SCHEMA_DIR):
+    """Validator for the templates in a directory, compiled on first use in this process"""
+    validator = _validators.get(schema_dir)
+    if validator is None:
+        validator = _validators[schema_dir] = RecordValidator(schema_dir)
+    return validator
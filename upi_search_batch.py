@@ -4,6 +4,83 @@ import json
 from datetime import datetime
 import sys
 import os
+import heapq
+import gc
+import time
+from upi_records import open_input_file
+from upi_json_stream import iter_json_array, JSONRecordList, JSONRecordSubset
+from upi_trade_cache import read_trade_workbook
+from upi_search_index import BucketedSelectivityStats
+from upi_search_metrics import LatencyRecorder, DEFAULT_SLOW_TRADE_MS
+from upi_search_results import CompactResults
+from upi_search_spill import ResultSpill, MEMORY_CHECK_INTERVAL, parse_memory_size, get_resident_memory
+from upi_search_checkpoint import SearchCheckpoint, DEFAULT_CHECKPOINT_INTERVAL, fingerprint_inputs
+from upi_search_shard import SHARD_KEYS, parse_shard, shard_of, write_partial, read_partial, check_partials
+from upi_search_pipeline import SearchPipeline, PIPELINE_CHUNK_SIZE
+
+# Marks a trade currency-pair key that has not been computed yet
+_KEY_NOT_COMPUTED = object()
+
+# Scoring attributes of a flattened UPI record, in slot order. A flat record is a
+# tuple of these values (upper-cased, None when empty) followed by the canonical
+# currency-pair key.
+FLAT_UPI_ATTRIBUTES = [
+    'Asset Class', 'Instrument Type', 'Product Type',
+    'Notional Currency', 'Other Notional Currency', 'Settlement Currency',
+    'Option Type', 'Option Style', 'Delivery Type', 'Place of Settlement',
+    'Reference Rate', 'Currency', 'Term',
+    'Other Leg Reference Rate', 'Other Leg Currency', 'Other Leg Term',
+]
+FLAT_UPI_SLOTS = {attribute: slot for slot, attribute in enumerate(FLAT_UPI_ATTRIBUTES)}
+PAIR_KEY_SLOT = len(FLAT_UPI_ATTRIBUTES)
+PRODUCT_SLOT = FLAT_UPI_SLOTS['Product Type']
+
+# Share of all UPIs a trade's lookups may return before scoring every UPI is cheaper
+LOOKUP_SCAN_FRACTION = 0.5
+
+def to_excel_value(value):
+    """Convert a pandas/numpy value to one openpyxl can write"""
+    if value is None:
+        return None
+    if isinstance(value, (list, dict, tuple)):
+        return str(value)
+    if pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+def write_excel_rows(output_file, rows):
+    """Write export rows (dicts sharing one set of keys) to an Excel file in write-only mode
+    
+    The header is taken from the first row and styled like DataFrame.to_excel.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Border, Font, Side
+    
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    header_written = False
+    
+    for row in rows:
+        if not header_written:
+            thin = Side(style='thin')
+            header = []
+            for column in row:
+                cell = WriteOnlyCell(sheet, value=column)
+                cell.font = Font(bold=True)
+                cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+                cell.alignment = Alignment(horizontal='center', vertical='top')
+                header.append(cell)
+            sheet.append(header)
+            header_written = True
+        
+        sheet.append([to_excel_value(value) for value in row.values()])
+    
+    workbook.save(output_file)
 
 class UPISearchBatch:
     def __init__(self):
@@ -11,22 +88,57 @@ class UPISearchBatch:
         self.trade_data = None
         self.results = None
         self.column_mappings = {}
+        self.flat_upis = []
+        self.selectivity = None
+        # Score only the UPIs returned by planned attribute lookups (False scores every UPI)
+        self.plan_lookups = True
+        self.loaded_upis = None
+        self.negative_lookup_count = 0
+        self.max_memory = None
+        self.spill_dir = None
+        self.upi_file_path = None
+        self.trade_file_path = None
+        self.checkpoint_dir = None
+        self.checkpoint_every = DEFAULT_CHECKPOINT_INTERVAL
+        self.resume = False
+        self.checkpoint = None
+        self.shard = None
+        self.shard_by = "pair"
+        self.summary = {}
+        self.use_trade_cache = False
+        self.slow_trade_ms = DEFAULT_SLOW_TRADE_MS
+        self.slow_trade_log = None
+        self.latency = LatencyRecorder()
     
     def load_upi_data(self, upi_file_path):
-        """Load UPI data from JSON file"""
+        """Load UPI data from JSON file (plain or .gz/.bz2/.xz/.zip compressed)
+        
+        The "upis" array is parsed incrementally and each UPI is flattened and
+        indexed as soon as it is read; only its JSON text, re-serialized without
+        the file's whitespace, is kept for the result details, not the decoded tree.
+        """
         try:
-            with open(upi_file_path, 'r') as f:
-                self.upi_data = json.load(f)
-            print(f"Loaded {len(self.upi_data.get('upis', []))} UPI records")
+            records = JSONRecordList()
+            self.start_upi_index(records)
+            with open_input_file(upi_file_path) as f:
+                for _, upi in iter_json_array(f, 'upis'):
+                    if not isinstance(upi, dict):
+                        raise ValueError(f"UPI record {len(records) + 1} is not a JSON object")
+                    self.index_upi(len(records), upi)
+                    records.append(json.dumps(upi, separators=(',', ':'), ensure_ascii=False))
+            self.upi_data = {'upis': records}
+            self.upi_file_path = upi_file_path
+            print(f"Loaded {len(records)} UPI records")
             return True
         except Exception as e:
             print(f"Error loading UPI data: {str(e)}")
             return False
     
     def load_trade_data(self, trade_file_path):
-        """Load trade data from Excel file"""
+        """Load trade data from Excel file (or its sidecar cache when enabled and current)"""
         try:
-            self.trade_data = pd.read_excel(trade_file_path)
+            self.trade_data = read_trade_workbook(trade_file_path, self.use_trade_cache)
+            self.trade_file_path = trade_file_path
             print(f"Loaded {len(self.trade_data)} trade records")
             return True
         except Exception as e:
@@ -37,46 +149,58 @@ class UPISearchBatch:
         """Apply CNH-specific handling logic to trade data"""
         print("Applying CNH handling logic...")
         
+        cnh_trades_count = self.normalize_cnh_trades(self.trade_data)
+        self.print_cnh_summary(cnh_trades_count)
+    
+    def normalize_cnh_trades(self, trade_data):
+        """Add the Processed* CNH columns to a trade frame (the whole file or a chunk of it) in place
+        
+        Returns the number of CNH trades.
+        """
         # Create new columns for CNH handling if they don't exist
-        if 'ProcessedUseCase' not in self.trade_data.columns:
-            self.trade_data['ProcessedUseCase'] = ''
-        if 'ProcessedPlaceofSettlement' not in self.trade_data.columns:
-            self.trade_data['ProcessedPlaceofSettlement'] = ''
-        if 'ProcessedCurrency' not in self.trade_data.columns:
-            self.trade_data['ProcessedCurrency'] = ''
+        if 'ProcessedUseCase' not in trade_data.columns:
+            trade_data['ProcessedUseCase'] = ''
+        if 'ProcessedPlaceofSettlement' not in trade_data.columns:
+            trade_data['ProcessedPlaceofSettlement'] = ''
+        if 'ProcessedCurrency' not in trade_data.columns:
+            trade_data['ProcessedCurrency'] = ''
         
         cnh_trades_count = 0
         
-        for idx, row in self.trade_data.iterrows():
+        for idx, row in trade_data.iterrows():
             # Check for CNH in any currency-related columns
             is_cnh_trade = False
             
             # Check all columns for CNH currency
-            for col in self.trade_data.columns:
+            for col in trade_data.columns:
                 if pd.notna(row[col]) and str(row[col]).upper() in ['CNH', 'CNY']:
                     is_cnh_trade = True
                     # Normalize CNH to CNY for UPI matching
                     if str(row[col]).upper() == 'CNH':
-                        self.trade_data.at[idx, 'ProcessedCurrency'] = 'CNY'
+                        trade_data.at[idx, 'ProcessedCurrency'] = 'CNY'
                     else:
-                        self.trade_data.at[idx, 'ProcessedCurrency'] = str(row[col]).upper()
+                        trade_data.at[idx, 'ProcessedCurrency'] = str(row[col]).upper()
                     break
             
             if is_cnh_trade:
                 cnh_trades_count += 1
                 
                 # Set PlaceofSettlement to Hong Kong for CNH trades
-                self.trade_data.at[idx, 'ProcessedPlaceofSettlement'] = 'Hong Kong'
+                trade_data.at[idx, 'ProcessedPlaceofSettlement'] = 'Hong Kong'
                 
                 # Determine UseCase based on InstrumentType
                 instrument_type = self.get_instrument_type_from_row(row)
                 
                 if instrument_type:
                     if instrument_type.upper() == 'SWAP':
-                        self.trade_data.at[idx, 'ProcessedUseCase'] = 'Non_Deliverable_FX_Swap'
+                        trade_data.at[idx, 'ProcessedUseCase'] = 'Non_Deliverable_FX_Swap'
                     elif instrument_type.upper() in ['FORWARD', 'OPTION']:
-                        self.trade_data.at[idx, 'ProcessedUseCase'] = 'Non_Standard'
+                        trade_data.at[idx, 'ProcessedUseCase'] = 'Non_Standard'
         
+        return cnh_trades_count
+    
+    def print_cnh_summary(self, cnh_trades_count):
+        """Report how many trades the CNH handling applied to"""
         if cnh_trades_count > 0:
             print(f"Applied CNH handling to {cnh_trades_count} trades")
             print("CNH trades will use:")
@@ -100,9 +224,14 @@ class UPISearchBatch:
         
         return None
     
-    def auto_map_columns(self, asset_class):
-        """Automatically map columns based on common naming patterns"""
-        trade_columns = list(self.trade_data.columns)
+    def auto_map_columns(self, asset_class, trade_columns=None):
+        """Automatically map columns based on common naming patterns
+        
+        The columns default to those of the loaded trade data.
+        """
+        if trade_columns is None:
+            trade_columns = self.trade_data.columns
+        trade_columns = list(trade_columns)
         
         if asset_class == "FX":
             upi_attributes = [
@@ -150,55 +279,481 @@ class UPISearchBatch:
         for attr, col in self.column_mappings.items():
             print(f"  {attr} -> {col}")
     
+    def prepare_upi_data(self):
+        """Build the flat records and lookup structures for UPIs already in self.upi_data (e.g. built in memory)"""
+        upis = self.upi_data.get('upis', [])
+        self.start_upi_index(upis)
+        for position, upi in enumerate(upis):
+            self.index_upi(position, upi)
+    
+    def start_upi_index(self, records):
+        """Reset the lookup structures before UPIs are indexed one by one into records (a list or JSONRecordList)"""
+        self.flat_upis = []
+        self.loaded_upis = records
+        attributes = set(self.get_scoring_weights("FX")) | set(self.get_scoring_weights("IR"))
+        # Positions of every value of each scored slot and of each currency-pair key, per product -
+        # serves pair lookups, negative lookups and lookup planning
+        slots = [FLAT_UPI_SLOTS[attribute] for attribute in FLAT_UPI_ATTRIBUTES if attribute in attributes]
+        self.selectivity = BucketedSelectivityStats(slots + [PAIR_KEY_SLOT], PRODUCT_SLOT)
+    
+    def index_upi(self, position, upi):
+        """Flatten one UPI and add it to the lookup structures"""
+        flat = self.flatten_upi(upi)
+        self.flat_upis.append(flat)
+        self.selectivity.add(position, flat)
+    
+    def flatten_upi(self, upi):
+        """Flatten a UPI into a tuple of upper-cased scoring attributes plus its currency-pair key"""
+        values = []
+        for attribute in FLAT_UPI_ATTRIBUTES:
+            value = self.get_upi_attribute_value(upi, attribute)
+            # Interned - the same few codes repeat across millions of UPIs
+            values.append(sys.intern(str(value).upper()) if value else None)
+        
+        pair_key = self.currency_pair_key(
+            values[FLAT_UPI_SLOTS['Notional Currency']] or '',
+            values[FLAT_UPI_SLOTS['Other Notional Currency']] or ''
+        )
+        return tuple(values) + (pair_key,)
+    
+    def get_flat_upi(self, upi):
+        """Flat record of a UPI record (loaded records are decoded afresh, so they are flattened again)"""
+        return self.flatten_upi(upi)
+    
+    def get_upis_for_currency_pair(self, pair_key):
+        """Loaded UPI records with an order-independent currency-pair key, in file order"""
+        return JSONRecordSubset(self.loaded_upis, self.selectivity.lookup(PAIR_KEY_SLOT, pair_key))
+    
+    def can_match_any_upi(self, trade_attrs, asset_class, trade_pair_key):
+        """Check whether any loaded UPI could give the trade a non-zero score"""
+        for attr in self.get_scoring_weights(asset_class):
+            if attr in ['Notional Currency', 'Other Notional Currency'] and asset_class == "FX":
+                if trade_pair_key is not None and self.selectivity.count(PAIR_KEY_SLOT, trade_pair_key):
+                    return True
+            elif attr in trade_attrs:
+                if self.selectivity.count(FLAT_UPI_SLOTS[attr], str(trade_attrs[attr]).upper()):
+                    return True
+        return False
+    
+    def currency_pair_key(self, ccy1, ccy2):
+        """Canonical (sorted) key for a currency pair, or None if either currency is missing"""
+        ccy1 = ccy1.upper()
+        ccy2 = ccy2.upper()
+        if not ccy1 or not ccy2:
+            return None
+        return (ccy1, ccy2) if ccy1 <= ccy2 else (ccy2, ccy1)
+    
+    def get_trade_currency_pair_key(self, trade_attrs):
+        """Canonical currency-pair key for a trade's extracted currencies"""
+        return self.currency_pair_key(
+            trade_attrs.get('TradeNotionalCurrency', ''),
+            trade_attrs.get('TradeOtherNotionalCurrency', '')
+        )
+    
+    def get_upi_currency_pair_key(self, upi):
+        """Canonical currency-pair key for a UPI - precomputed for loaded records"""
+        return self.get_flat_upi(upi)[PAIR_KEY_SLOT]
+    
     def search_upis(self, asset_class):
         """Perform UPI search"""
         print("Starting UPI search...")
-        results = []
+        # Keep only positions and scores per trade; details are joined back on access
+        new_chunk = lambda: CompactResults(top_k=0, materializer=self.materialize_result)
+        if self.max_memory:
+            # Completed results are spilled to temporary files when the budget is reached
+            results = ResultSpill(new_chunk, self.max_memory, self.spill_dir)
+            if results.over_budget():
+                print(f"Warning: loaded data already uses {get_resident_memory() / 1024 ** 2:.0f} MB, "
+                      f"over the {self.max_memory / 1024 ** 2:.0f} MB budget")
+        else:
+            results = new_chunk()
+        shard_positions = self.get_shard_positions()
+        matched_trades = 0
+        high_confidence = 0
         
-        for idx, trade in self.trade_data.iterrows():
-            best_match = None
-            best_score = 0
-            
-            # Extract trade attributes using column mappings
-            trade_attrs = self.extract_trade_attributes(trade)
-            
-            # Search through UPI data
-            for upi in self.upi_data.get('upis', []):
-                score = self.calculate_match_score(trade_attrs, upi, asset_class)
-                
-                if score > best_score:
-                    best_score = score
-                    best_match = upi
-            
-            # Prepare result
-            result = {
-                'Trade_Index': idx,
-                'Best_UPI': best_match['upiCode'] if best_match else 'No Match',
-                'Match_Score': best_score,
-                'Trade_Attributes': trade_attrs,
-                'UPI_Details': best_match if best_match else {}
-            }
+        # Restore results of trades finished by an earlier, interrupted run
+        self.checkpoint = None
+        if self.checkpoint_dir:
+            for chunk in self.start_checkpoint(asset_class):
+                for index in range(len(chunk)):
+                    results.append(chunk.trade_row(index), chunk.best_upi(index), chunk.score(index))
+                    if chunk.score(index) >= 50:
+                        matched_trades += 1
+                    if chunk.score(index) >= 80:
+                        high_confidence += 1
+        start_position = len(results)
+        pending_chunk = new_chunk()
+        
+        # Counts and latencies of the resumed trades carry over, so the summary covers the whole search
+        stats = self.checkpoint.stats if self.checkpoint else None
+        self.negative_lookup_count = stats["negative_lookups"] if stats else 0
+        self.latency = LatencyRecorder(self.slow_trade_ms, self.slow_trade_log, append_log=stats is not None)
+        if stats:
+            self.latency.merge(stats["latency"])
+        
+        # Trade row positions still to search - this shard's rows only when sharding
+        if shard_positions is None:
+            positions = range(start_position, len(self.trade_data))
+            trades = self.trade_data.iloc[start_position:]
+        else:
+            positions = shard_positions[start_position:]
+            trades = self.trade_data.iloc[positions]
+        
+        for searched, (position, (idx, trade)) in enumerate(zip(positions, trades.iterrows()), start_position + 1):
+            best_match, best_score = self.search_trade(idx, trade, asset_class)
             
-            # Add original trade data
-            for col in self.trade_data.columns:
-                result[f'Original_{col}'] = trade[col]
+            # Record trade row and best UPI position only
+            results.append(position, best_match, best_score)
+            if self.checkpoint:
+                pending_chunk.append(position, best_match, best_score)
+                if len(pending_chunk) >= self.checkpoint_every:
+                    self.checkpoint.save_chunk(pending_chunk, self.get_checkpoint_stats())
+                    pending_chunk = new_chunk()
+            if best_score >= 50:
+                matched_trades += 1
+            if best_score >= 80:
+                high_confidence += 1
             
-            results.append(result)
+            if self.max_memory and searched % MEMORY_CHECK_INTERVAL == 0:
+                results.check_memory()
+        
+        if self.checkpoint and len(pending_chunk):
+            self.checkpoint.save_chunk(pending_chunk, self.get_checkpoint_stats())
+        self.latency.close()
         
         self.results = results
         print(f"UPI search completed. Processed {len(results)} trades.")
+        if self.max_memory and results.chunk_paths:
+            print(f"  {results.spilled_count} results spilled to {len(results.chunk_paths)} files in {results.temp_dir}")
+        if self.max_memory and results.over_budget():
+            print(f"  Note: the process still uses {get_resident_memory() / 1024 ** 2:.0f} MB - the budget is a soft target "
+                  f"and most of it is held by the loaded UPI and trade data")
         
         # Print summary
-        matched_trades = sum(1 for r in results if r['Match_Score'] >= 50)
-        high_confidence = sum(1 for r in results if r['Match_Score'] >= 80)
+        self.summary = {
+            "total": len(results),
+            "matched": matched_trades,
+            "high_confidence": high_confidence,
+            "negative_lookups": self.negative_lookup_count,
+        }
+        self.print_summary(self.summary)
+        
+        return results
+    
+    def search_trade(self, idx, trade, asset_class):
+        """Find the best-scoring UPI for one trade row and record its latency
+        
+        Returns a tuple of (best UPI position or None, best score).
+        """
+        started = time.perf_counter()
         
+        # Extract trade attributes using column mappings
+        trade_attrs = self.extract_trade_attributes(trade)
+        trade_pair_key = self.get_trade_currency_pair_key(trade_attrs)
+        plan = self.build_scoring_plan(trade_attrs, asset_class)
+        
+        found = None
+        if not self.can_match_any_upi(trade_attrs, asset_class, trade_pair_key):
+            # Fast negative lookup: no attribute value occurs in any UPI, so every score is 0
+            self.negative_lookup_count += 1
+            found = (None, 0, 0, "negative lookup")
+        elif self.plan_lookups:
+            found = self.search_planned_lookups(plan, trade_pair_key)
+        if found is None:
+            found = self.search_all_upis(plan, trade_pair_key)
+        best_match, best_score, candidates, lookup_plan = found
+        
+        # Latency and candidates by product, CNH-processed trades separately
+        processed_currency = trade.get('ProcessedCurrency')
+        path = "cnh" if pd.notna(processed_currency) and processed_currency else "regular"
+        self.latency.record(time.perf_counter() - started, candidates,
+                            trade_attrs.get('Product Type'), path, trade=idx, signature=trade_attrs,
+                            plan=lookup_plan)
+        
+        return best_match, best_score
+    
+    def search_all_upis(self, plan, trade_pair_key):
+        """Score every flattened UPI; returns (best position, best score, UPIs scored, plan)"""
+        best_match = None
+        best_score = 0
+        for upi_position, flat in enumerate(self.flat_upis):
+            score = self.score_flat_upi(plan, flat, trade_pair_key)
+            
+            if score > best_score:
+                best_score = score
+                best_match = upi_position
+        return best_match, best_score, len(self.flat_upis), "scan"
+    
+    def plan_candidate_lookups(self, plan, trade_pair_key, stats=None):
+        """Order a trade's attribute lookups cheapest first
+        
+        A lookup returns the UPIs holding the trade's value of one scored
+        attribute. Its cost is the number of UPIs it returns per point of score,
+        taken from the selectivity statistics (stats: one product's, or the whole
+        set's by default), so a rare currency pair comes before a common
+        instrument type. Returns (name, slot, value, count) tuples.
+        """
+        if stats is None:
+            stats = self.selectivity
+        lookups = []
+        for order, (slot, weight, trade_value) in enumerate(plan):
+            if slot == PAIR_KEY_SLOT:
+                name, value = 'Currency Pair', trade_pair_key
+            else:
+                name, value = FLAT_UPI_ATTRIBUTES[slot], trade_value
+            count = stats.count(slot, value) if value is not None else 0
+            lookups.append((count / weight, order, name, slot, value, count))
+        
+        lookups.sort(key=lambda lookup: lookup[:2])
+        return [lookup[2:] for lookup in lookups]
+    
+    def get_trade_product_stats(self, plan):
+        """Selectivity statistics of the product a trade's plan scores, or None"""
+        for slot, _, trade_value in plan:
+            if slot == PRODUCT_SLOT:
+                return self.selectivity.get_bucket(trade_value)
+        return None
+    
+    def score_bound_without(self, plan, looked_up, trade_pair_key):
+        """Highest score of a UPI holding none of the trade values of the looked-up slots
+        
+        Follows score_flat_upi: a currency-pair match ends the scoring, so the
+        attributes after it only count for UPIs with another pair.
+        """
+        bound = 0
+        bound_with_pair = 0
+        for slot, weight, _ in plan:
+            if slot in looked_up:
+                continue
+            if slot == PAIR_KEY_SLOT:
+                if trade_pair_key is not None:
+                    bound_with_pair = bound + weight
+            else:
+                bound += weight
+        return max(bound, bound_with_pair)
+    
+    def search_planned_lookups(self, plan, trade_pair_key):
+        """Score only the UPIs returned by the planned lookups, cheapest first
+        
+        The lookups are planned on the trade's product first: its UPIs all
+        match the Product Type and no other UPI can, so when the best score
+        found beats every other product's bound the search ends there. Otherwise
+        lookups over the whole set follow. Lookups are added until the best
+        score found is higher than any UPI outside them could reach, so the
+        result is the same as scoring every UPI (ties still go to the first UPI
+        in the file). Returns (best position, best score, UPIs scored, plan), or
+        None when the lookups would return so many UPIs that scoring all of them
+        is cheaper.
+        """
+        budget = len(self.flat_upis) * LOOKUP_SCAN_FRACTION
+        flat_upis = self.flat_upis
+        scored = set()
+        names = []
+        best_match = None
+        best_score = 0
+        
+        # (statistics, bound of the UPIs they leave out, plan label) - the trade's product, then every UPI
+        stages = []
+        product_stats = self.get_trade_product_stats(plan)
+        if product_stats is not None:
+            stages.append((product_stats, self.score_bound_without(plan, {PRODUCT_SLOT}, trade_pair_key), " in product"))
+        stages.append((self.selectivity, 0, ""))
+        
+        for stats, other_bound, scope in stages:
+            looked_up = set()
+            for name, slot, value, count in self.plan_candidate_lookups(plan, trade_pair_key, stats):
+                if len(scored) + count > budget:
+                    return None
+                looked_up.add(slot)
+                names.append(name + scope)
+                
+                positions = stats.lookup(slot, value)
+                for upi_position in set(positions).difference(scored):
+                    score = self.score_flat_upi(plan, flat_upis[upi_position], trade_pair_key)
+                    if score > best_score or (score == best_score and score and upi_position < best_match):
+                        best_score = score
+                        best_match = upi_position
+                scored.update(positions)
+                
+                if best_score > max(self.score_bound_without(plan, looked_up, trade_pair_key), other_bound):
+                    return best_match, best_score, len(scored), " > ".join(names)
+        
+        return best_match, best_score, len(scored), " > ".join(names)
+    
+    def print_summary(self, summary):
+        """Print match statistics of a search (or of merged shards)"""
+        total = summary["total"]
         print(f"Summary:")
-        print(f"  Total trades: {len(results)}")
-        print(f"  Matched trades (score ≥ 50): {matched_trades}")
-        print(f"  High confidence matches (score ≥ 80): {high_confidence}")
-        print(f"  Match rate: {(matched_trades/len(results))*100:.1f}%")
+        print(f"  Total trades: {total}")
+        print(f"  Matched trades (score ≥ 50): {summary['matched']}")
+        print(f"  High confidence matches (score ≥ 80): {summary['high_confidence']}")
+        print(f"  Trades with no possible UPI (scoring skipped): {summary['negative_lookups']}")
+        print(f"  Match rate: {(summary['matched']/total)*100 if total else 0:.1f}%")
+        for line in self.latency.format_lines():
+            print(line)
+    
+    def write_metrics(self, metrics_file):
+        """Write the summary counts, latency histograms and UPI selectivity statistics to a JSON file"""
+        try:
+            with open(metrics_file, 'w', encoding='utf-8') as f:
+                metrics = {"summary": self.summary, "latency": self.latency.summary()}
+                if self.selectivity is not None:
+                    names = FLAT_UPI_ATTRIBUTES + ['Currency Pair']
+                    metrics["selectivity"] = self.selectivity.summary(names)
+                json.dump(metrics, f, indent=2)
+            print(f"Search metrics written to {metrics_file}")
+            return True
+        except Exception as e:
+            print(f"Error writing search metrics: {str(e)}")
+            return False
+    
+    def materialize_result(self, results, index):
+        """Join a compact result back to its trade row and UPI details"""
+        trade_row = results.trade_row(index)
+        return self.build_result(self.trade_data.index[trade_row], self.trade_data.iloc[trade_row],
+                                 results.best_upi(index), results.score(index))
+    
+    def build_result(self, trade_index, trade, upi_position, score):
+        """Full result of one trade: its attributes, original columns and best UPI details"""
+        best_match = self.upi_data.get('upis', [])[upi_position] if upi_position is not None else None
         
-        return results
+        result = {
+            'Trade_Index': trade_index,
+            'Best_UPI': best_match['upiCode'] if best_match else 'No Match',
+            'Match_Score': score,
+            'Trade_Attributes': self.extract_trade_attributes(trade),
+            'UPI_Details': best_match if best_match else {}
+        }
+        
+        # Add original trade data
+        for col in trade.index:
+            result[f'Original_{col}'] = trade[col]
+        
+        return result
+    
+    def get_input_fingerprint(self, asset_class, shard_count=None, shard_by=None):
+        """Fingerprint of the input files, column mapping, asset class and shard settings"""
+        settings = {"asset_class": asset_class, "column_mappings": self.column_mappings}
+        if shard_count is not None:
+            settings["shard_count"] = shard_count
+            settings["shard_by"] = shard_by
+        return fingerprint_inputs([self.upi_file_path, self.trade_file_path], settings)
+    
+    def start_checkpoint(self, asset_class):
+        """Open the checkpoint and return the result chunks to resume from (none unless resuming)"""
+        # Results are only reusable for the same inputs, mapping, asset class and shard
+        if self.shard:
+            fingerprint = self.get_input_fingerprint(asset_class, self.shard[1], f"{self.shard_by}:{self.shard[0]}")
+        else:
+            fingerprint = self.get_input_fingerprint(asset_class)
+        self.checkpoint = SearchCheckpoint(self.checkpoint_dir, fingerprint)
+        
+        if not self.resume:
+            self.checkpoint.clear()
+            return []
+        
+        chunks, _ = self.checkpoint.load()
+        return chunks
+    
+    def get_checkpoint_stats(self):
+        """Statistics of the search so far, saved with each checkpoint chunk"""
+        return {"negative_lookups": self.negative_lookup_count, "latency": self.latency}
+    
+    def get_shard_key(self, position, trade_attrs):
+        """Key that decides a trade's shard - its currency pair (for cache locality) or its row"""
+        if self.shard_by == "pair":
+            pair_key = self.get_trade_currency_pair_key(trade_attrs)
+            if pair_key is not None:
+                return "/".join(pair_key)
+        # Rows without a currency pair are spread by row position
+        return f"row:{position}"
+    
+    def get_shard_positions(self):
+        """Trade row positions of this process's shard, in file order (None when not sharding)"""
+        if not self.shard:
+            return None
+        
+        number, count = self.shard
+        positions = []
+        for position, (idx, trade) in enumerate(self.trade_data.iterrows()):
+            trade_attrs = self.extract_trade_attributes(trade) if self.shard_by == "pair" else {}
+            if shard_of(self.get_shard_key(position, trade_attrs), count) == number:
+                positions.append(position)
+        
+        print(f"Shard {number}/{count} (by {self.shard_by}): {len(positions)} of {len(self.trade_data)} trades")
+        return positions
+    
+    def write_partial_results(self, output_file, asset_class):
+        """Write this shard's results and summary to a partial result file for merging"""
+        try:
+            chunks = self.results.iter_chunks() if isinstance(self.results, ResultSpill) else [self.results]
+            header = {
+                "fingerprint": self.get_input_fingerprint(asset_class, self.shard[1], self.shard_by),
+                "asset_class": asset_class,
+                "shard": self.shard[0],
+                "shard_count": self.shard[1],
+                "shard_by": self.shard_by,
+                "summary": self.summary,
+                "latency": self.latency,
+            }
+            write_partial(output_file, header, chunks)
+            print(f"Partial results for shard {self.shard[0]}/{self.shard[1]} written to {output_file}")
+            return True
+        
+        except Exception as e:
+            print(f"Error writing partial results: {str(e)}")
+            return False
+    
+    def merge_partial_results(self, partial_files, asset_class):
+        """Combine the partial result files of every shard into one result set in trade order"""
+        try:
+            partials = [read_partial(path) for path in partial_files]
+            headers = [header for header, _ in partials]
+            check_partials(headers)
+            
+            # The partials must have been produced from the inputs loaded here
+            first = headers[0]
+            if first["asset_class"] != asset_class:
+                raise ValueError(f"Partial results are for asset class {first['asset_class']}, not {asset_class}")
+            if first["fingerprint"] != self.get_input_fingerprint(asset_class, first["shard_count"], first["shard_by"]):
+                raise ValueError("Partial results were written for different input files or column mapping")
+        
+        except Exception as e:
+            print(f"Error merging partial results: {str(e)}")
+            return False
+        
+        new_chunk = lambda: CompactResults(top_k=0, materializer=self.materialize_result)
+        results = ResultSpill(new_chunk, self.max_memory, self.spill_dir) if self.max_memory else new_chunk()
+        
+        # Each shard lists its trades in file order, so a k-way merge restores the original order
+        def shard_rows(chunks):
+            for chunk in chunks:
+                for index in range(len(chunk)):
+                    yield chunk.trade_row(index), chunk.best_upi(index), chunk.score(index)
+        
+        merged_rows = heapq.merge(*[shard_rows(chunks) for _, chunks in partials], key=lambda row: row[0])
+        for merged, row in enumerate(merged_rows, 1):
+            results.append(*row)
+            if self.max_memory and merged % MEMORY_CHECK_INTERVAL == 0:
+                results.check_memory()
+        
+        self.results = results
+        self.summary = {
+            key: sum(header["summary"][key] for header in headers)
+            for key in ["total", "matched", "high_confidence", "negative_lookups"]
+        }
+        self.latency = LatencyRecorder(first["latency"].slow_trade_ms)
+        for header in headers:
+            self.latency.merge(header["latency"])
+        print(f"Merged {len(partials)} partial result files ({len(results)} trades).")
+        self.print_summary(self.summary)
+        return True
+    
+    def clear_checkpoint(self):
+        """Remove checkpoint files once the output has been written"""
+        if self.checkpoint:
+            self.checkpoint.remove()
+            self.checkpoint = None
     
     def extract_trade_attributes(self, trade):
         """Extract trade attributes using column mappings and CNH processing"""
@@ -241,13 +796,46 @@ class UPISearchBatch:
         
         return attrs
     
-    def calculate_match_score(self, trade_attrs, upi, asset_class):
+    def calculate_match_score(self, trade_attrs, upi, asset_class, trade_pair_key=_KEY_NOT_COMPUTED):
         """Calculate match score between trade and UPI with bidirectional currency matching"""
-        score = 0
+        if trade_pair_key is _KEY_NOT_COMPUTED:
+            trade_pair_key = self.get_trade_currency_pair_key(trade_attrs)
+        
+        flat = upi if isinstance(upi, tuple) else self.get_flat_upi(upi)
+        return self.score_flat_upi(self.build_scoring_plan(trade_attrs, asset_class), flat, trade_pair_key)
+    
+    def build_scoring_plan(self, trade_attrs, asset_class):
+        """List the (slot, weight, upper-cased trade value) comparisons for one trade, in weight order"""
+        weights = self.get_scoring_weights(asset_class)
+        plan = []
         
+        for attr, weight in weights.items():
+            if attr in ['Notional Currency', 'Other Notional Currency'] and asset_class == "FX":
+                # Bidirectional currency matching for FX - one canonical key comparison for both currencies
+                if attr == 'Notional Currency':
+                    plan.append((PAIR_KEY_SLOT, weights['Notional Currency'] + weights['Other Notional Currency'], None))
+            elif attr in trade_attrs:
+                plan.append((FLAT_UPI_SLOTS[attr], weight, str(trade_attrs[attr]).upper()))
+        
+        return plan
+    
+    def score_flat_upi(self, plan, flat, trade_pair_key):
+        """Score a flattened UPI against a trade's scoring plan"""
+        score = 0
+        for slot, weight, trade_value in plan:
+            if slot == PAIR_KEY_SLOT:
+                if trade_pair_key is not None and trade_pair_key == flat[PAIR_KEY_SLOT]:
+                    score += weight
+                    break  # Only count this once for both currencies
+            elif trade_value == flat[slot]:
+                score += weight
+        return score
+    
+    def get_scoring_weights(self, asset_class):
+        """Attribute weights used by calculate_match_score"""
         if asset_class == "FX":
             # FX scoring weights - removed Currency Pair, added individual currency matching
-            weights = {
+            return {
                 'Asset Class': 20,
                 'Instrument Type': 20,
                 'Product Type': 20,
@@ -261,7 +849,7 @@ class UPISearchBatch:
             }
         else:
             # IR scoring weights
-            weights = {
+            return {
                 'Asset Class': 20,
                 'Instrument Type': 20,
                 'Product Type': 20,
@@ -273,40 +861,12 @@ class UPISearchBatch:
                 'Other Leg Term': 5,
                 'Delivery Type': 10
             }
-        
-        # Calculate score based on matches
-        for attr, weight in weights.items():
-            if attr in ['Notional Currency', 'Other Notional Currency'] and asset_class == "FX":
-                # Handle bidirectional currency matching for FX
-                if self.match_currencies_bidirectional(trade_attrs, upi):
-                    score += weights['Notional Currency'] + weights['Other Notional Currency']
-                    break  # Only count this once for both currencies
-            elif attr in trade_attrs:
-                trade_value = str(trade_attrs[attr]).upper()
-                upi_value = self.get_upi_attribute_value(upi, attr)
-                
-                if upi_value and trade_value == upi_value.upper():
-                    score += weight
-        
-        return score
     
     def match_currencies_bidirectional(self, trade_attrs, upi):
         """Check if trade currencies match UPI currencies in either order"""
-        # Get trade currencies
-        trade_ccy1 = trade_attrs.get('TradeNotionalCurrency', '').upper()
-        trade_ccy2 = trade_attrs.get('TradeOtherNotionalCurrency', '').upper()
-        
-        # Get UPI currencies
-        upi_ccy1 = self.get_upi_attribute_value(upi, 'Notional Currency').upper()
-        upi_ccy2 = self.get_upi_attribute_value(upi, 'Other Notional Currency').upper()
-        
-        # Check if currencies are available
-        if not all([trade_ccy1, trade_ccy2, upi_ccy1, upi_ccy2]):
-            return False
-        
-        # Check both orders: (trade1, trade2) == (upi1, upi2) OR (trade1, trade2) == (upi2, upi1)
-        return ((trade_ccy1 == upi_ccy1 and trade_ccy2 == upi_ccy2) or 
-                (trade_ccy1 == upi_ccy2 and trade_ccy2 == upi_ccy1))
+        # Sorted keys are equal exactly when (trade1, trade2) matches (upi1, upi2) or (upi2, upi1)
+        trade_key = self.get_trade_currency_pair_key(trade_attrs)
+        return trade_key is not None and trade_key == self.get_upi_currency_pair_key(upi)
     
     def get_upi_attribute_value(self, upi, attribute):
         """Extract attribute value from UPI record"""
@@ -349,25 +909,15 @@ class UPISearchBatch:
             print("No results to export.")
             return False
         
+        if self.max_memory:
+            return self.export_results_streaming(output_file)
+        
         try:
             # Prepare data for export
             export_data = []
             
             for result in self.results:
-                row = {
-                    'Trade_Index': result['Trade_Index'],
-                    'Best_UPI': result['Best_UPI'],
-                    'Match_Score': result['Match_Score'],
-                    'Trade_Attributes': str(result['Trade_Attributes']),
-                    'UPI_Details': str(result['UPI_Details'])
-                }
-                
-                # Add original trade data
-                for key, value in result.items():
-                    if key.startswith('Original_'):
-                        row[key] = value
-                
-                export_data.append(row)
+                export_data.append(self.build_export_row(result))
             
             # Create DataFrame and export
             df = pd.DataFrame(export_data)
@@ -379,22 +929,119 @@ class UPISearchBatch:
             print(f"Error exporting results: {str(e)}")
             return False
 
+    def build_export_row(self, result):
+        """Flatten one result into an export row"""
+        row = {
+            'Trade_Index': result['Trade_Index'],
+            'Best_UPI': result['Best_UPI'],
+            'Match_Score': result['Match_Score'],
+            'Trade_Attributes': str(result['Trade_Attributes']),
+            'UPI_Details': str(result['UPI_Details'])
+        }
+        
+        # Add original trade data
+        for key, value in result.items():
+            if key.startswith('Original_'):
+                row[key] = value
+        
+        return row
+    
+    def export_results_streaming(self, output_file):
+        """Export results row by row to Excel without building the full table in memory"""
+        try:
+            # Results are merged from the spill files one chunk at a time
+            write_excel_rows(output_file, (self.build_export_row(result) for result in self.results))
+            print(f"Results exported to {output_file}")
+            return True
+        
+        except Exception as e:
+            print(f"Error exporting results: {str(e)}")
+            return False
+    
+    def release_search_indexes(self):
+        """Drop the flat records and lookup postings once the search is done - export only needs the records"""
+        self.flat_upis = []
+        self.selectivity = None
+        gc.collect()
+    
+    def cleanup(self):
+        """Remove temporary spill files"""
+        if isinstance(self.results, ResultSpill):
+            self.results.cleanup()
+
 def main():
     parser = argparse.ArgumentParser(description='UPI Search Automation Tool - Batch Processing')
-    parser.add_argument('--upi', required=True, help='Path to UPI JSON file')
+    parser.add_argument('--upi', required=True, help='Path to UPI JSON file (may be .gz, .bz2, .xz or .zip compressed)')
     parser.add_argument('--trade', required=True, help='Path to trade Excel file')
     parser.add_argument('--asset-class', choices=['FX', 'IR'], default='FX', help='Asset class (FX or IR)')
     parser.add_argument('--output', help='Output Excel file path')
+    parser.add_argument('--max-memory', type=parse_memory_size,
+                        help='Soft memory budget such as 512M or 2G; completed results are spilled to temporary files once it is reached')
+    parser.add_argument('--spill-dir', help='Directory for spill files (default: system temp directory)')
+    parser.add_argument('--checkpoint-dir', help='Directory for periodic search checkpoints')
+    parser.add_argument('--checkpoint-every', type=int, default=DEFAULT_CHECKPOINT_INTERVAL,
+                        help=f'Trades per checkpoint (default: {DEFAULT_CHECKPOINT_INTERVAL})')
+    parser.add_argument('--resume', action='store_true', help='Resume an interrupted search from --checkpoint-dir')
+    parser.add_argument('--shard', type=parse_shard,
+                        help='Search only shard i of N (e.g. 1/4) and write a partial result file for "merge"')
+    parser.add_argument('--shard-by', choices=SHARD_KEYS, default='pair',
+                        help='Split trades by currency pair (default) or by row')
+    parser.add_argument('--trade-cache', action='store_true',
+                        help='Cache the trade workbook in a columnar sidecar file and reuse it while the workbook is unchanged')
+    parser.add_argument('--slow-trade-ms', type=float, default=DEFAULT_SLOW_TRADE_MS,
+                        help=f'Trades slower than this are written to the slow-trade log (default: {DEFAULT_SLOW_TRADE_MS:g})')
+    parser.add_argument('--slow-trade-log', help='Slow-trade log path (default: <output>.slow_trades.jsonl)')
+    parser.add_argument('--metrics-file', help='Summary and latency histogram JSON path (default: <output>.metrics.json)')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Read, normalize, score and write trade chunks in concurrent stages, overlapping the UPI file load')
+    parser.add_argument('--chunk-size', type=int, default=PIPELINE_CHUNK_SIZE,
+                        help=f'Trades per chunk with --pipeline (default: {PIPELINE_CHUNK_SIZE})')
     
     args = parser.parse_args()
+    if args.resume and not args.checkpoint_dir:
+        parser.error('--resume requires --checkpoint-dir')
+    if args.checkpoint_every < 1:
+        parser.error('--checkpoint-every must be at least 1')
+    if args.chunk_size < 1:
+        parser.error('--chunk-size must be at least 1')
+    if args.pipeline and (args.shard or args.checkpoint_dir or args.max_memory):
+        parser.error('--pipeline streams results straight to the output and cannot be combined with '
+                     '--shard, --checkpoint-dir or --max-memory')
     
     # Set default output filename if not provided
     if not args.output:
-        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        args.output = f'upi_search_results_{timestamp}.xlsx'
+        if args.shard:
+            args.output = f'upi_search_shard_{args.shard[0]}_of_{args.shard[1]}.pkl'
+        else:
+            timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+            args.output = f'upi_search_results_{timestamp}.xlsx'
+    output_base = os.path.splitext(args.output)[0]
     
     # Initialize batch processor
     processor = UPISearchBatch()
+    processor.max_memory = args.max_memory
+    processor.spill_dir = args.spill_dir
+    processor.checkpoint_dir = args.checkpoint_dir
+    processor.checkpoint_every = args.checkpoint_every
+    processor.resume = args.resume
+    processor.shard = args.shard
+    processor.shard_by = args.shard_by
+    processor.use_trade_cache = args.trade_cache
+    processor.slow_trade_ms = args.slow_trade_ms
+    processor.slow_trade_log = args.slow_trade_log or f'{output_base}.slow_trades.jsonl'
+    
+    if args.pipeline:
+        # Load, search and export in overlapping stages
+        pipeline = SearchPipeline(processor, args.asset_class, args.chunk_size)
+        exported = pipeline.run(args.upi, args.trade, args.output)
+        if processor.summary:
+            processor.write_metrics(args.metrics_file or f'{output_base}.metrics.json')
+        if exported:
+            print(f"Process completed successfully. Results saved to {args.output}")
+        else:
+            print("Failed to export results.")
+            sys.exit(1)
+        return
     
     # Load data
     if not processor.load_upi_data(args.upi):
@@ -411,13 +1058,79 @@ def main():
     
     # Search UPIs
     processor.search_upis(args.asset_class)
+    processor.write_metrics(args.metrics_file or f'{output_base}.metrics.json')
+    if args.max_memory:
+        # Free the search structures so writing the output does not add to the footprint
+        processor.release_search_indexes()
     
-    # Export results
-    if processor.export_results(args.output):
+    # Export results - a shard writes partial results for the merge step instead
+    if args.shard:
+        exported = processor.write_partial_results(args.output, args.asset_class)
+    else:
+        exported = processor.export_results(args.output)
+    processor.cleanup()
+    
+    if exported:
+        processor.clear_checkpoint()
         print(f"Process completed successfully. Results saved to {args.output}")
     else:
         print("Failed to export results.")
         sys.exit(1)
 
+def merge_main(argv):
+    """Combine the partial result files of a sharded run into the final report"""
+    parser = argparse.ArgumentParser(prog='upi_search_batch.py merge',
+                                     description='Merge the partial results of a sharded batch run into one report')
+    parser.add_argument('partials', nargs='+', help='Partial result files, one per shard')
+    parser.add_argument('--upi', required=True, help='Path to the UPI JSON file the shards searched')
+    parser.add_argument('--trade', required=True, help='Path to the trade Excel file the shards searched')
+    parser.add_argument('--asset-class', choices=['FX', 'IR'], default='FX', help='Asset class (FX or IR)')
+    parser.add_argument('--output', help='Output Excel file path')
+    parser.add_argument('--max-memory', type=parse_memory_size,
+                        help='Soft memory budget such as 512M or 2G; merged results are spilled to temporary files once it is reached')
+    parser.add_argument('--spill-dir', help='Directory for spill files (default: system temp directory)')
+    parser.add_argument('--trade-cache', action='store_true',
+                        help='Cache the trade workbook in a columnar sidecar file and reuse it while the workbook is unchanged')
+    parser.add_argument('--metrics-file', help='Summary and latency histogram JSON path (default: <output>.metrics.json)')
+    
+    args = parser.parse_args(argv)
+    
+    if not args.output:
+        timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+        args.output = f'upi_search_results_{timestamp}.xlsx'
+    
+    processor = UPISearchBatch()
+    processor.max_memory = args.max_memory
+    processor.spill_dir = args.spill_dir
+    processor.use_trade_cache = args.trade_cache
+    
+    # Load the same inputs and mapping the shards used - results are joined back to them on export
+    if not processor.load_upi_data(args.upi):
+        sys.exit(1)
+    
+    if not processor.load_trade_data(args.trade):
+        sys.exit(1)
+    
+    processor.apply_cnh_handling()
+    processor.auto_map_columns(args.asset_class)
+    
+    if not processor.merge_partial_results(args.partials, args.asset_class):
+        sys.exit(1)
+    processor.write_metrics(args.metrics_file or f'{os.path.splitext(args.output)[0]}.metrics.json')
+    if args.max_memory:
+        processor.release_search_indexes()
+    
+    exported = processor.export_results(args.output)
+    processor.cleanup()
+    
+    if exported:
+        print(f"Merge completed successfully. Results saved to {args.output}")
+    else:
+        print("Failed to export results.")
+        sys.exit(1)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == 'merge':
+        merge_main(sys.argv[2:])
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,117 @@
+import sys
+import time
+import random
+import argparse
+from upi_search_batch import UPISearchBatch
+
+# Synthetic reference data - enough variety that most scoring branches are taken
+CURRENCIES = ["USD", "EUR", "GBP", "JPY", "HKD", "CNH", "AUD", "CHF"]
+INSTRUMENT_TYPES = ["Forward", "Swap", "Option", "Spot"]
+DELIVERY_TYPES = ["Physical", "Cash"]
+PLACES = ["Hong Kong", "London", "New York"]
+
+def make_upis(count, rng):
+    """Build FX UPI records in the {"upis": [...]} format"""
+    upis = []
+    for i in range(count):
+        ccy1, ccy2 = rng.sample(CURRENCIES, 2)
+        upis.append({
+            "upiCode": f"BENCH_{i:06d}",
+            "assetClass": "ForeignExchange",
+            "instrumentType": rng.choice(INSTRUMENT_TYPES),
+            "product": "Non_Standard",
+            "underlying": {"currencyPair": f"{ccy1}/{ccy2}", "settlementCurrency": ccy2},
+            "deliveryType": rng.choice(DELIVERY_TYPES),
+            "placeOfSettlement": rng.choice(PLACES),
+        })
+    return upis
+
+def make_trades(count, rng):
+    """Build extracted FX trade attributes"""
+    trades = []
+    for i in range(count):
+        ccy1, ccy2 = rng.sample(CURRENCIES, 2)
+        trades.append({
+            'Asset Class': "foreignexchange",
+            'Instrument Type': rng.choice(INSTRUMENT_TYPES).lower(),
+            'TradeNotionalCurrency': ccy1,
+            'TradeOtherNotionalCurrency': ccy2,
+            'Settlement Currency': ccy2,
+            'Delivery Type': rng.choice(DELIVERY_TYPES),
+            'Place of Settlement': rng.choice(PLACES),
+        })
+    return trades
+
+def legacy_match_score(processor, trade_attrs, upi, asset_class):
+    """Score the way calculate_match_score did before flat records: attribute lookups per comparison"""
+    score = 0
+    trade_pair_key = processor.get_trade_currency_pair_key(trade_attrs)
+    weights = processor.get_scoring_weights(asset_class)
+
+    for attr, weight in weights.items():
+        if attr in ['Notional Currency', 'Other Notional Currency'] and asset_class == "FX":
+            upi_pair_key = processor.currency_pair_key(
+                processor.get_upi_attribute_value(upi, 'Notional Currency'),
+                processor.get_upi_attribute_value(upi, 'Other Notional Currency')
+            )
+            if trade_pair_key is not None and trade_pair_key == upi_pair_key:
+                score += weights['Notional Currency'] + weights['Other Notional Currency']
+                break
+        elif attr in trade_attrs:
+            trade_value = str(trade_attrs[attr]).upper()
+            upi_value = processor.get_upi_attribute_value(upi, attr)
+            if upi_value and trade_value == upi_value.upper():
+                score += weight
+
+    return score
+
+def run_benchmark(upi_count, trade_count, seed=0):
+    """Score every trade against every UPI both ways; return (legacy seconds, flat seconds)"""
+    rng = random.Random(seed)
+    processor = UPISearchBatch()
+    processor.upi_data = {"upis": make_upis(upi_count, rng)}
+    processor.prepare_upi_data()
+    trades = make_trades(trade_count, rng)
+    upis = processor.upi_data['upis']
+
+    # Legacy path
+    start = time.perf_counter()
+    legacy_scores = [legacy_match_score(processor, trade, upi, "FX") for trade in trades for upi in upis]
+    legacy_seconds = time.perf_counter() - start
+
+    # Flat path, as search_upis runs it: one plan per trade, precomputed records
+    start = time.perf_counter()
+    flat_scores = []
+    for trade in trades:
+        plan = processor.build_scoring_plan(trade, "FX")
+        trade_pair_key = processor.get_trade_currency_pair_key(trade)
+        for flat in processor.flat_upis:
+            flat_scores.append(processor.score_flat_upi(plan, flat, trade_pair_key))
+    flat_seconds = time.perf_counter() - start
+
+    if legacy_scores != flat_scores:
+        raise Exception("Error in benchmark: flat and legacy scores differ")
+
+    return legacy_seconds, flat_seconds
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark UPI match scoring on flat records')
+    parser.add_argument('--upis', type=int, default=2000, help='Number of synthetic UPI records')
+    parser.add_argument('--trades', type=int, default=200, help='Number of synthetic trades')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    try:
+        legacy_seconds, flat_seconds = run_benchmark(args.upis, args.trades, args.seed)
+    except Exception as e:
+        print(f"Benchmark failed: {str(e)}")
+        sys.exit(1)
+
+    comparisons = args.upis * args.trades
+    print(f"Scored {comparisons} trade/UPI pairs (scores identical)")
+    print(f"Legacy scoring: {legacy_seconds:.3f}s ({comparisons / legacy_seconds:,.0f} pairs/s)")
+    print(f"Flat scoring:   {flat_seconds:.3f}s ({comparisons / flat_seconds:,.0f} pairs/s)")
+    print(f"Speed-up:       {legacy_seconds / flat_seconds:.1f}x")
+
+if __name__ == "__main__":
+    main()
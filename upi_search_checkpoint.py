@@ -0,0 +1,124 @@
+import os
+import json
+import pickle
+import hashlib
+
+# Trades searched between two checkpoints
+DEFAULT_CHECKPOINT_INTERVAL = 1000
+
+PROGRESS_FILE = "progress.json"
+
+def fingerprint_inputs(file_paths, settings):
+    """Hash input file contents and search settings into one fingerprint"""
+    digest = hashlib.sha256()
+    for file_path in file_paths:
+        digest.update(os.path.basename(file_path).encode('utf-8'))
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    digest.update(json.dumps(settings, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+def _write_atomic(path, data):
+    """Write bytes to a file so readers never see a partial file"""
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+class SearchCheckpoint:
+    """Completed result chunks and a progress marker for one batch search
+
+    Each chunk is a pickled CompactResults covering a run of consecutive
+    trades. progress.json lists the chunks and the number of trades completed,
+    and records the fingerprint of the inputs and mapping; a checkpoint with a
+    different fingerprint is discarded instead of resumed. Each chunk may come
+    with a pickled snapshot of the run's statistics up to its last trade, which
+    is restored as stats so a resumed run reports on the whole search.
+    """
+
+    def __init__(self, directory, fingerprint):
+        self.directory = directory
+        self.fingerprint = fingerprint
+        self.chunk_files = []
+        self.completed = 0
+        self.stats_file = None
+        self.stats = None
+
+    def progress_path(self):
+        return os.path.join(self.directory, PROGRESS_FILE)
+
+    def load(self):
+        """Load the chunks of a matching checkpoint; return (chunks, trades completed)"""
+        try:
+            with open(self.progress_path(), encoding='utf-8') as f:
+                progress = json.load(f)
+        except (OSError, ValueError):
+            print("No usable checkpoint found, starting from the first trade.")
+            self.clear()
+            return [], 0
+
+        if progress.get("fingerprint") != self.fingerprint:
+            print("Checkpoint was written for different inputs or mapping, starting from the first trade.")
+            self.clear()
+            return [], 0
+
+        chunks = []
+        for chunk_file in progress["chunks"]:
+            with open(os.path.join(self.directory, chunk_file), 'rb') as f:
+                chunks.append(pickle.load(f))
+
+        self.stats_file = progress.get("stats")
+        if self.stats_file:
+            with open(os.path.join(self.directory, self.stats_file), 'rb') as f:
+                self.stats = pickle.load(f)
+
+        self.chunk_files = list(progress["chunks"])
+        self.completed = progress["completed"]
+        print(f"Resuming from checkpoint: {self.completed} trades already searched.")
+        return chunks, self.completed
+
+    def save_chunk(self, chunk, stats=None):
+        """Persist a chunk of completed results and the statistics up to it, then advance the progress marker"""
+        chunk_file = f"chunk_{self.completed:09d}.pkl"
+        _write_atomic(os.path.join(self.directory, chunk_file), pickle.dumps(chunk, protocol=pickle.HIGHEST_PROTOCOL))
+
+        self.chunk_files.append(chunk_file)
+        self.completed += len(chunk)
+
+        # Statistics go to a file per marker, so the marker never points at a newer snapshot
+        previous_stats_file = self.stats_file
+        if stats is not None:
+            self.stats_file = f"stats_{self.completed:09d}.pkl"
+            _write_atomic(os.path.join(self.directory, self.stats_file), pickle.dumps(stats, protocol=pickle.HIGHEST_PROTOCOL))
+
+        # The marker is written last, so a chunk only counts once it is fully on disk
+        progress = {"fingerprint": self.fingerprint, "completed": self.completed, "chunks": self.chunk_files,
+                    "stats": self.stats_file}
+        _write_atomic(self.progress_path(), json.dumps(progress, indent=2).encode('utf-8'))
+
+        if previous_stats_file and previous_stats_file != self.stats_file:
+            os.remove(os.path.join(self.directory, previous_stats_file))
+
+    def clear(self):
+        """Start an empty checkpoint"""
+        self.remove()
+        os.makedirs(self.directory, exist_ok=True)
+        self.chunk_files = []
+        self.completed = 0
+        self.stats_file = None
+        self.stats = None
+
+    def remove(self):
+        """Delete the checkpoint files (only the ones this class writes)"""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.startswith((PROGRESS_FILE, "chunk_", "stats_")):
+                os.remove(os.path.join(self.directory, name))
+        try:
+            os.rmdir(self.directory)
+        except OSError:
+            pass  # Directory holds other files - leave it
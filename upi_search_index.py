@@ -0,0 +1,360 @@
+from array import array
+from collections import defaultdict
+import heapq
+
+class ReferenceRateIndex:
+    """Character n-gram index over the distinct UPI reference-rate values
+
+    Answers the ReferenceRate partial-match rule of calculate_field_score
+    (trade value contained in the UPI value, or the UPI value contained in the
+    trade value) without a substring test per candidate.
+    """
+
+    # Distinct trade strings cached before the cache is reset
+    MAX_CACHED_QUERIES = 100000
+
+    def __init__(self, values, ngram_size=3):
+        self.ngram_size = ngram_size
+        self.values = set()
+        self.postings = defaultdict(set)
+        self.max_value_length = 0
+        self.cache = {}
+
+        for value in values:
+            self.add_value(value)
+
+    def normalize(self, value):
+        """Normalize a value the same way calculate_field_score does"""
+        return str(value).strip().upper()
+
+    def add_value(self, value):
+        """Index a UPI reference-rate value under all its grams of length 1..n"""
+        value = self.normalize(value)
+        if value in self.values:
+            return
+
+        self.values.add(value)
+        self.max_value_length = max(self.max_value_length, len(value))
+        for size in range(1, self.ngram_size + 1):
+            for start in range(len(value) - size + 1):
+                self.postings[value[start:start + size]].add(value)
+        self.cache.clear()
+
+    def matches(self, trade_str):
+        """Return the indexed values that contain, or are contained in, trade_str"""
+        cached = self.cache.get(trade_str)
+        if cached is not None:
+            return cached
+
+        result = set()
+
+        # UPI values contained in the trade string - look up its substrings
+        length = len(trade_str)
+        for start in range(length + 1):
+            for end in range(start, min(length, start + self.max_value_length) + 1):
+                if trade_str[start:end] in self.values:
+                    result.add(trade_str[start:end])
+
+        # UPI values containing the trade string - intersect gram postings, then verify
+        if not trade_str:
+            result.update(self.values)
+        elif length <= self.ngram_size:
+            result.update(self.postings.get(trade_str, ()))
+        else:
+            grams = {trade_str[start:start + self.ngram_size] for start in range(length - self.ngram_size + 1)}
+            posting_lists = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+            candidates = set(posting_lists[0])
+            for posting in posting_lists[1:]:
+                if not candidates:
+                    break
+                candidates &= posting
+            result.update(value for value in candidates if trade_str in value)
+
+        if len(self.cache) >= self.MAX_CACHED_QUERIES:
+            self.cache.clear()
+        result = frozenset(result)
+        self.cache[trade_str] = result
+        return result
+
+    def contains_match(self, trade_str, upi_str):
+        """Evaluate 'trade_str in upi_str or upi_str in trade_str' for normalized strings"""
+        if upi_str not in self.values:
+            # Not an indexed value - fall back to the direct test
+            return trade_str in upi_str or upi_str in trade_str
+        return upi_str in self.matches(trade_str)
+
+class UPIPartitionIndex:
+    """In-memory UPI records bucketed by (AssetClass, UseCase, InstrumentType)
+
+    Offers the same lookups as the on-disk UPIRecordStore, so routing, product
+    discovery and asset-class switches are bucket lookups instead of scans.
+    Buckets keep the original record order.
+    """
+
+    def __init__(self, records):
+        self.partitions = {}
+        self.use_case_partitions = {}
+        self.asset_class_counts = {}
+        self.records_by_upi = {}
+        # Partition -> attribute -> normalized value -> record positions, built on first ranked lookup
+        self.postings = {}
+
+        for record in records:
+            self.records_by_upi[record.get("Identifier", {}).get("UPI")] = record
+
+            header = record.get("Header", {})
+            asset_class = header.get("AssetClass")
+            use_case = header.get("UseCase")
+            instrument_type = header.get("InstrumentType")
+
+            self.partitions.setdefault((asset_class, use_case, instrument_type), []).append(record)
+            self.use_case_partitions.setdefault((asset_class, use_case), []).append(record)
+            self.asset_class_counts[asset_class] = self.asset_class_counts.get(asset_class, 0) + 1
+
+    def get_records(self, asset_class, use_case=None, instrument_type=None):
+        """Return the records of a partition (shared list - do not modify)"""
+        if use_case is None:
+            return [
+                record
+                for (bucket_asset_class, _), bucket in self.use_case_partitions.items()
+                if bucket_asset_class == asset_class
+                for record in bucket
+            ]
+        if instrument_type is None:
+            return self.use_case_partitions.get((asset_class, use_case), [])
+        return self.partitions.get((asset_class, use_case, instrument_type), [])
+
+    def get_record(self, upi):
+        """Look up a record by Identifier.UPI"""
+        return self.records_by_upi.get(upi)
+
+    def iter_records(self, asset_class, use_case=None, instrument_type=None):
+        """Iterate the records of a partition"""
+        return iter(self.get_records(asset_class, use_case, instrument_type))
+
+    def iter_ranked_records(self, asset_class, use_case, instrument_type, lookups):
+        """Iterate (position, record) pairs of a partition, records holding the looked-up values first
+
+        lookups is a list of (attribute, normalized value) in priority order:
+        records holding the first value come first, then those holding the
+        second, and so on, then the rest in their original order. Each record
+        is yielded once, with its position in the original order.
+        """
+        records = self.get_records(asset_class, use_case, instrument_type)
+        postings = self.get_postings((asset_class, use_case, instrument_type), records)
+        seen = bytearray(len(records))
+        for field_name, value in lookups:
+            for position in postings.get(field_name, {}).get(value, ()):
+                if not seen[position]:
+                    seen[position] = 1
+                    yield position, records[position]
+        for position, record in enumerate(records):
+            if not seen[position]:
+                yield position, record
+
+    def get_postings(self, partition, records):
+        """Positions of a partition's records per normalized attribute value, built on first use"""
+        postings = self.postings.get(partition)
+        if postings is None:
+            postings = self.postings[partition] = {}
+            for position, record in enumerate(records):
+                for field_name, value in record.get("Attributes", {}).items():
+                    if value is None:
+                        continue
+                    field_postings = postings.setdefault(field_name, {})
+                    normalized = str(value).strip().upper()
+                    positions = field_postings.get(normalized)
+                    if positions is None:
+                        positions = field_postings[normalized] = array('q')
+                    positions.append(position)
+        return postings
+
+    def count(self, asset_class, use_case=None, instrument_type=None):
+        """Count records in a partition"""
+        if use_case is None:
+            return self.asset_class_counts.get(asset_class, 0)
+        return len(self.get_records(asset_class, use_case, instrument_type))
+
+    def has_records(self, asset_class, use_case=None, instrument_type=None):
+        """Check whether a partition holds at least one record"""
+        return self.count(asset_class, use_case, instrument_type) > 0
+
+    def get_use_cases(self, asset_class):
+        """List the distinct UseCase values for an asset class"""
+        return sorted(
+            use_case
+            for (bucket_asset_class, use_case) in self.use_case_partitions
+            if bucket_asset_class == asset_class and use_case
+        )
+
+class AttributeValueSets:
+    """Distinct normalized attribute values of one UPI partition
+
+    Built in one pass over the partition's records. A trade whose mapped values
+    cannot score against any of these values cannot score against any record
+    of the partition, so it is reported as unmatched without scoring.
+    """
+
+    def __init__(self, records):
+        self.record_count = 0
+        self.values = {}
+        self.cache = {}
+
+        for record in records:
+            self.record_count += 1
+            for field_name, value in record.get("Attributes", {}).items():
+                if value is not None:
+                    self.values.setdefault(field_name, set()).add(str(value).strip().upper())
+
+    def get_values(self, field_name):
+        """Distinct normalized values of an attribute (empty if no record has it)"""
+        return self.values.get(field_name, ())
+
+class ExactMatchIndex:
+    """Records of one UPI partition keyed by their normalized values of a fixed set of fields
+
+    Values are normalized the way calculate_field_score compares them (stripped
+    and upper-cased). calculate_upi_score only scores the fields a record has in
+    its Attributes, so fields no record of the partition has (such as the
+    Header field InstrumentType) are left out of the key. A trade whose
+    normalized values of the remaining fields equal a key matches that record
+    on every scored field, i.e. scores 100. Keys held by several records are
+    ambiguous and not resolved. If some records have a field that others lack,
+    a record without it could also score 100 on the fields it has, so the index
+    is then unusable and every lookup misses.
+    """
+
+    def __init__(self, records, fields):
+        self.fields = fields
+        # Positions in fields of the key's fields - the fields the records have
+        self.key_positions = None
+        self.table = {}
+        self.usable = True
+
+        for record in records:
+            attributes = record.get("Attributes", {})
+            values = [attributes.get(field_name) for field_name in fields]
+            positions = tuple(position for position, value in enumerate(values) if value is not None)
+            if self.key_positions is None:
+                self.key_positions = positions
+            elif positions != self.key_positions:
+                self._disable()
+                return
+
+            key = tuple(str(values[position]).strip().upper() for position in positions)
+            # None marks a key shared by several records
+            self.table[key] = None if key in self.table else record
+
+        # No record has any of the fields - nothing scores, so nothing matches exactly
+        if not self.key_positions:
+            self._disable()
+
+    def _disable(self):
+        self.usable = False
+        self.table = {}
+        self.key_positions = ()
+
+    def lookup(self, values):
+        """The single record matching the normalized values (one per field) exactly, or None"""
+        if not self.usable:
+            return None
+        return self.table.get(tuple(values[position] for position in self.key_positions))
+
+class SelectivityStats:
+    """Frequency of every value of a set of fields over flat records, with the positions holding it
+
+    Records are added one by one as sequences indexed by field. The positions
+    of a value are both its frequency and the exact candidate set a lookup on
+    it returns, so a planner can compare lookups by their real cost.
+    """
+
+    def __init__(self, fields):
+        # field -> value -> positions of the records holding it, in the order added
+        self.postings = {field: {} for field in fields}
+        self.record_count = 0
+
+    def add(self, position, values):
+        for field, postings in self.postings.items():
+            value = values[field]
+            if value is None:
+                continue
+            positions = postings.get(value)
+            if positions is None:
+                positions = postings[value] = array('q')
+            positions.append(position)
+        self.record_count += 1
+
+    def lookup(self, field, value):
+        """Positions of the records holding a value of a field (empty if none)"""
+        return self.postings.get(field, {}).get(value, ())
+
+    def count(self, field, value):
+        """Number of records holding a value of a field"""
+        return len(self.lookup(field, value))
+
+    def distinct_count(self, field):
+        return len(self.postings.get(field, ()))
+
+    def summary(self, names, top=5):
+        """Distinct-value count and most frequent values per field, keyed by names[field]"""
+        summary = {"records": self.record_count, "fields": {}}
+        for field, postings in self.postings.items():
+            frequencies = sorted(((len(positions), value) for value, positions in postings.items()),
+                                 key=lambda item: (-item[0], str(item[1])))
+            summary["fields"][names[field]] = {
+                "distinct": len(postings),
+                "records": sum(count for count, _ in frequencies),
+                # Tuple values (currency-pair keys) are shown as "CCY1/CCY2"
+                "top": [[value if isinstance(value, str) else "/".join(value), count]
+                        for count, value in frequencies[:top]],
+            }
+        return summary
+
+class BucketedSelectivityStats:
+    """SelectivityStats kept separately per bucket - the value of one field, such as the product
+
+    A whole-set frequency misleads a planner when one bucket dominates: a
+    currency pair can be rare among FX products and common among rates. Each
+    bucket has its own postings; whole-set lookups merge them in position order.
+    """
+
+    def __init__(self, fields, bucket_field):
+        self.fields = list(fields)
+        self.bucket_field = bucket_field
+        # bucket value -> SelectivityStats of the records holding it
+        self.buckets = {}
+        self.record_count = 0
+
+    def add(self, position, values):
+        bucket = values[self.bucket_field]
+        stats = self.buckets.get(bucket)
+        if stats is None:
+            stats = self.buckets[bucket] = SelectivityStats(self.fields)
+        stats.add(position, values)
+        self.record_count += 1
+
+    def get_bucket(self, bucket):
+        """SelectivityStats of one bucket, or None if no record falls in it"""
+        return self.buckets.get(bucket)
+
+    def lookup(self, field, value):
+        """Positions of the records of every bucket holding a value of a field, in position order"""
+        postings = [positions for positions in (stats.lookup(field, value) for stats in self.buckets.values()) if positions]
+        if len(postings) <= 1:
+            return postings[0] if postings else ()
+        return array('q', heapq.merge(*postings))
+
+    def count(self, field, value):
+        return sum(stats.count(field, value) for stats in self.buckets.values())
+
+    def distinct_count(self, field):
+        return len(set().union(*(stats.postings.get(field, ()) for stats in self.buckets.values())))
+
+    def summary(self, names, top=5):
+        """Record count and the SelectivityStats summary of each bucket, largest first"""
+        buckets = sorted(self.buckets.items(), key=lambda item: (-item[1].record_count, str(item[0])))
+        return {
+            "records": self.record_count,
+            "bucket_field": names[self.bucket_field],
+            "buckets": {"" if bucket is None else bucket: stats.summary(names, top) for bucket, stats in buckets},
+        }
@@ -0,0 +1,231 @@
+import json
+import math
+
+# Growth factor between histogram buckets - latency percentiles are within about 2%
+BUCKET_GROWTH = 1.02
+
+# Bucket of zero values in a log-bucketed histogram
+_ZERO_BUCKET = -10 ** 9
+
+# Default latency above which a trade is written to the slow-trade log
+DEFAULT_SLOW_TRADE_MS = 500.0
+
+# Slow trades kept in memory for writing out later (the log file has all of them)
+MAX_SLOW_TRADES_KEPT = 1000
+
+PERCENTILES = [50, 90, 99]
+
+# Most frequent candidate lookup plans shown in the console summary
+PLANS_SHOWN = 5
+
+class Histogram:
+    """Histogram of non-negative values with percentiles, mean and exact max
+
+    Values are counted in logarithmic buckets, so memory stays bounded however
+    many trades are recorded. With exact=True every distinct value is its own
+    bucket (used for integer candidate counts).
+    """
+
+    def __init__(self, exact=False):
+        self.exact = exact
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0
+
+    def _bucket(self, value):
+        if self.exact:
+            return value
+        if value <= 0:
+            return _ZERO_BUCKET
+        return math.floor(math.log(value, BUCKET_GROWTH))
+
+    def _bucket_value(self, bucket):
+        if self.exact:
+            return bucket
+        if bucket == _ZERO_BUCKET:
+            return 0
+        # Upper edge of the bucket, so percentiles are never understated
+        return min(BUCKET_GROWTH ** (bucket + 1), self.max)
+
+    def add(self, value):
+        bucket = self._bucket(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        """Add the counts of another histogram of the same kind"""
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        """Nearest-rank percentile"""
+        if not self.count:
+            return 0
+        rank = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return self._bucket_value(bucket)
+        return self.max
+
+    def to_dict(self, digits=3):
+        summary = {"count": self.count, "mean": round(self.total / self.count, digits) if self.count else 0}
+        for percent in PERCENTILES:
+            summary[f"p{percent}"] = round(self.percentile(percent), digits)
+        summary["max"] = round(self.max, digits)
+        return summary
+
+class LatencyRecorder:
+    """Per-trade latency and candidate-count histograms, split by product and search path
+
+    The search path is "regular" or one of the CNH paths. Trades slower than
+    slow_trade_ms are appended to a JSON-lines slow-trade log together with
+    their signature (the trade values they were searched with). Trades recorded
+    with a candidate lookup plan are also counted per plan, and trades whose
+    search stopped at the time limit with a partial result are counted.
+    """
+
+    def __init__(self, slow_trade_ms=None, slow_log_path=None, append_log=False):
+        self.slow_trade_ms = slow_trade_ms
+        self.slow_log_path = slow_log_path
+        # A resumed search adds to the log of the interrupted run
+        self.append_log = append_log
+        self.slow_log = None
+        self.slow_count = 0
+        self.slow_trades = []
+        # (product, path) -> (latency histogram in ms, candidate count histogram)
+        self.groups = {}
+        # Candidate lookup plan -> trades searched with it
+        self.plans = {}
+        # Trades whose scoring stopped at the per-trade time limit
+        self.deadline_hits = 0
+
+    def record(self, seconds, candidates, product, path, trade=None, signature=None, plan=None, partial=False):
+        """Record one searched trade"""
+        key = (product or "Unknown", path)
+        histograms = self.groups.get(key)
+        if histograms is None:
+            histograms = self.groups[key] = (Histogram(), Histogram(exact=True))
+
+        latency_ms = seconds * 1000
+        histograms[0].add(latency_ms)
+        histograms[1].add(candidates)
+        if plan is not None:
+            self.plans[plan] = self.plans.get(plan, 0) + 1
+        if partial:
+            self.deadline_hits += 1
+
+        if self.slow_trade_ms is not None and latency_ms >= self.slow_trade_ms:
+            self.log_slow_trade({
+                "trade": trade,
+                "product": key[0],
+                "path": path,
+                "latency_ms": round(latency_ms, 3),
+                "candidates": candidates,
+                "plan": plan,
+                "partial": partial,
+                "signature": signature or {},
+            })
+
+    def log_slow_trade(self, entry):
+        self.slow_count += 1
+        if len(self.slow_trades) < MAX_SLOW_TRADES_KEPT:
+            self.slow_trades.append(entry)
+        if self.slow_log_path is None:
+            return
+        if self.slow_log is None:
+            self.slow_log = open(self.slow_log_path, 'a' if self.append_log else 'w', encoding='utf-8')
+        self.slow_log.write(json.dumps(entry, default=str) + "\n")
+        self.slow_log.flush()
+
+    def merge(self, other):
+        """Add the histograms and slow-trade count of another recorder (e.g. another shard)"""
+        for key, (latency, candidates) in other.groups.items():
+            if key not in self.groups:
+                self.groups[key] = (Histogram(), Histogram(exact=True))
+            self.groups[key][0].merge(latency)
+            self.groups[key][1].merge(candidates)
+        for plan, count in other.plans.items():
+            self.plans[plan] = self.plans.get(plan, 0) + count
+        self.deadline_hits += other.deadline_hits
+        self.slow_count += other.slow_count
+        self.slow_trades.extend(other.slow_trades[:MAX_SLOW_TRADES_KEPT - len(self.slow_trades)])
+
+    def overall(self):
+        latency, candidates = Histogram(), Histogram(exact=True)
+        for group_latency, group_candidates in self.groups.values():
+            latency.merge(group_latency)
+            candidates.merge(group_candidates)
+        return latency, candidates
+
+    def plan_counts(self):
+        """(plan, trades) pairs, most used first"""
+        return sorted(self.plans.items(), key=lambda item: (-item[1], item[0]))
+
+    def summary(self):
+        """Machine-readable summary of every histogram"""
+        latency, candidates = self.overall()
+        return {
+            "trades": latency.count,
+            "latency_ms": latency.to_dict(),
+            "candidates": candidates.to_dict(digits=1),
+            "groups": [
+                {"product": product, "path": path,
+                 "latency_ms": group_latency.to_dict(), "candidates": group_candidates.to_dict(digits=1)}
+                for (product, path), (group_latency, group_candidates) in sorted(self.groups.items())
+            ],
+            "plans": [{"plan": plan, "trades": count} for plan, count in self.plan_counts()],
+            "deadline_hits": self.deadline_hits,
+            "slow_trades": {"threshold_ms": self.slow_trade_ms, "count": self.slow_count, "log": self.slow_log_path},
+        }
+
+    def format_lines(self):
+        """Human-readable summary lines for a console summary"""
+        def line(label, latency, candidates):
+            return (f"  {label:<40} {latency.count:>8}  p50 {latency.percentile(50):8.2f}  "
+                    f"p90 {latency.percentile(90):8.2f}  p99 {latency.percentile(99):8.2f}  "
+                    f"max {latency.max:8.2f} ms  candidates p99 {candidates.percentile(99)} max {candidates.max}")
+
+        lines = ["Latency per trade:", line("All trades", *self.overall())]
+        for (product, path), histograms in sorted(self.groups.items()):
+            lines.append(line(f"{product} ({path})", *histograms))
+        if self.plans:
+            lines.append(f"Candidate lookup plans ({len(self.plans)} used):")
+            for plan, count in self.plan_counts()[:PLANS_SHOWN]:
+                lines.append(f"  {count:>8}  {plan}")
+        if self.deadline_hits:
+            lines.append(f"  Trades stopped at the time limit (partial results): {self.deadline_hits}")
+        if self.slow_trade_ms is not None:
+            where = f", logged to {self.slow_log_path}" if self.slow_log_path and self.slow_count else ""
+            lines.append(f"  Slow trades (≥ {self.slow_trade_ms:g} ms): {self.slow_count}{where}")
+        return lines
+
+    def write_json(self, path):
+        """Write the summary to a JSON file"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def write_slow_trades(self, path):
+        """Write the slow trades kept in memory as JSON lines"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for entry in self.slow_trades:
+                f.write(json.dumps(entry, default=str) + "\n")
+
+    def close(self):
+        """Close the slow-trade log"""
+        if self.slow_log is not None:
+            self.slow_log.close()
+            self.slow_log = None
+
+    def __getstate__(self):
+        # The open log file stays with this process
+        state = self.__dict__.copy()
+        state["slow_log"] = None
+        return state
@@ -0,0 +1,309 @@
+import queue
+import threading
+import time
+import multiprocessing
+from upi_trade_cache import iter_trade_workbook
+from upi_search_metrics import LatencyRecorder
+
+# Trades per chunk flowing through the pipeline
+PIPELINE_CHUNK_SIZE = 500
+
+# Chunks buffered between two stages - bounds the memory of a pipelined run
+PIPELINE_QUEUE_CHUNKS = 4
+
+# Seconds a blocked stage waits before checking whether another stage failed
+QUEUE_POLL_SECONDS = 0.2
+
+# Queue markers: end of the trade stream, and a failed run whose output must not be saved
+_END = None
+_ABORT = "abort"
+
+class PipelineStopped(Exception):
+    """Raised in a stage when another stage has failed"""
+
+def read_pipeline_chunks(trade_file_path, use_cache, chunk_size, chunk_queue):
+    """Reader process: stream the trade workbook into the queue in DataFrame chunks
+
+    Ends with ("done", rows read, busy seconds) or ("error", message).
+    """
+    counts = {"rows": 0, "waited": 0.0}
+    started = time.perf_counter()
+    try:
+        for chunk in iter_trade_workbook(trade_file_path, chunk_size, use_cache):
+            counts["rows"] += len(chunk)
+            waiting = time.perf_counter()
+            chunk_queue.put(chunk)
+            counts["waited"] += time.perf_counter() - waiting
+        chunk_queue.put(("done", counts["rows"], time.perf_counter() - started - counts["waited"]))
+    except Exception as e:
+        chunk_queue.put(("error", str(e)))
+
+def write_pipeline_rows(output_file, row_queue, status_queue):
+    """Writer process: stream export rows from the queue into the Excel file
+
+    Reports ("done", rows written, busy seconds) or ("error", message) on status_queue.
+    """
+    from upi_search_batch import write_excel_rows
+
+    counts = {"rows": 0, "waited": 0.0}
+    started = time.perf_counter()
+
+    def rows():
+        while True:
+            waiting = time.perf_counter()
+            chunk = row_queue.get()
+            counts["waited"] += time.perf_counter() - waiting
+            if chunk is _END:
+                return
+            if chunk == _ABORT:
+                raise PipelineStopped("Search failed")
+            counts["rows"] += len(chunk)
+            yield from chunk
+
+    try:
+        row_iter = rows()
+        first = next(row_iter, None)
+        if first is not None:
+            write_excel_rows(output_file, _prepend(first, row_iter))
+        status_queue.put(("done", counts["rows"], time.perf_counter() - started - counts["waited"]))
+    except PipelineStopped:
+        status_queue.put(("error", "stopped"))
+    except Exception as e:
+        status_queue.put(("error", str(e)))
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
+class SearchPipeline:
+    """Batch search run as concurrent stages connected by bounded queues
+
+    read trades -> normalize (CNH) -> score -> write
+
+    The trade workbook is streamed by a separate process in chunks of
+    chunk_size trades, so reading overlaps the UPI file load and the scoring;
+    the Excel output is written by its own process. Each queue holds at most
+    PIPELINE_QUEUE_CHUNKS chunks, so a slow stage holds back the ones before it
+    instead of buffering the whole file.
+    """
+
+    def __init__(self, processor, asset_class, chunk_size=PIPELINE_CHUNK_SIZE, queue_chunks=PIPELINE_QUEUE_CHUNKS):
+        self.processor = processor
+        self.asset_class = asset_class
+        self.chunk_size = chunk_size
+        self.queue_chunks = queue_chunks
+        self.failed = threading.Event()
+        self.errors = []
+        # Busy seconds per stage, excluding time spent waiting on queues
+        self.stage_seconds = {}
+        self.cnh_trades_count = 0
+
+    def run(self, upi_file_path, trade_file_path, output_file):
+        """Search every trade and write the Excel report; return True on success"""
+        processor = self.processor
+        started = time.perf_counter()
+        context = multiprocessing.get_context()
+
+        normalize_queue = queue.Queue(maxsize=self.queue_chunks)
+        score_queue = queue.Queue(maxsize=self.queue_chunks)
+        chunk_queue = context.Queue(maxsize=self.queue_chunks)
+        row_queue = context.Queue(maxsize=self.queue_chunks)
+        status_queue = context.Queue()
+
+        # Processes are started before any stage thread - they fork from a single-threaded parent
+        reader = context.Process(target=read_pipeline_chunks, daemon=True,
+                                 args=(trade_file_path, processor.use_trade_cache, self.chunk_size, chunk_queue))
+        reader.start()
+        writer = context.Process(target=write_pipeline_rows, args=(output_file, row_queue, status_queue), daemon=True)
+        writer.start()
+
+        stages = [
+            threading.Thread(target=self.run_stage, args=("read", self.read_stage, reader, chunk_queue, trade_file_path, normalize_queue), daemon=True),
+            threading.Thread(target=self.run_stage, args=("normalize", self.normalize_stage, normalize_queue, score_queue), daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+
+        try:
+            # The UPI file loads on this thread while the trade workbook is streamed
+            load_started = time.perf_counter()
+            if not processor.load_upi_data(upi_file_path):
+                raise PipelineStopped("UPI data not loaded")
+            self.stage_seconds["load UPI"] = time.perf_counter() - load_started
+
+            self.run_stage("score", self.score_stage, score_queue, row_queue, writer)
+            if self.failed.is_set():
+                raise PipelineStopped()
+            self.put(row_queue, _END, writer)
+            written = self.wait_for_writer(status_queue, writer)
+        except PipelineStopped:
+            self.failed.set()
+            written = None
+        except Exception as e:
+            self.errors.append(str(e))
+            self.failed.set()
+            written = None
+        finally:
+            if self.failed.is_set():
+                # Rows still queued for a stopped writer are dropped, and no partial workbook is saved
+                row_queue.cancel_join_thread()
+                if writer.is_alive():
+                    try:
+                        row_queue.put_nowait(_ABORT)
+                    except queue.Full:
+                        writer.terminate()
+                # A reader blocked on a full queue is stopped rather than drained
+                if reader.is_alive():
+                    reader.terminate()
+            for stage in stages:
+                stage.join()
+            writer.join()
+            reader.join()
+
+        for error in self.errors:
+            print(f"Error in pipelined search: {error}")
+        if self.failed.is_set() or written is None:
+            return False
+
+        processor.print_cnh_summary(self.cnh_trades_count)
+        print(f"UPI search completed. Processed {processor.summary['total']} trades.")
+        processor.print_summary(processor.summary)
+        self.print_stage_times(time.perf_counter() - started)
+
+        if not written:
+            print("No results to export.")
+            return False
+        print(f"Results exported to {output_file}")
+        return True
+
+    def run_stage(self, name, stage, *args):
+        """Run one stage, recording its busy time; a failure stops every other stage"""
+        try:
+            stage(name, *args)
+        except PipelineStopped:
+            self.failed.set()
+        except Exception as e:
+            self.errors.append(f"{name} stage: {str(e)}")
+            self.failed.set()
+
+    def add_busy_time(self, name, started):
+        self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + time.perf_counter() - started
+
+    def put(self, target_queue, item, consumer=None):
+        """Put on a bounded queue, giving up if another stage (or the consumer process) has stopped"""
+        while True:
+            if self.failed.is_set():
+                raise PipelineStopped()
+            if consumer is not None and not consumer.is_alive():
+                raise Exception("Writer process stopped unexpectedly")
+            try:
+                target_queue.put(item, timeout=QUEUE_POLL_SECONDS)
+                return
+            except queue.Full:
+                pass
+
+    def get(self, source_queue, producer=None):
+        """Get from a queue, giving up if another stage (or the producer process) has stopped"""
+        while True:
+            if self.failed.is_set():
+                raise PipelineStopped()
+            try:
+                return source_queue.get(timeout=QUEUE_POLL_SECONDS)
+            except queue.Empty:
+                if producer is not None and not producer.is_alive():
+                    # Items put before it exited may still be in transit
+                    try:
+                        return source_queue.get(timeout=QUEUE_POLL_SECONDS)
+                    except queue.Empty:
+                        raise Exception("Reader process stopped unexpectedly")
+
+    def read_stage(self, name, reader, chunk_queue, trade_file_path, output_queue):
+        """Pass the chunks streamed by the reader process on to normalization"""
+        while True:
+            chunk = self.get(chunk_queue, reader)
+            if isinstance(chunk, tuple):
+                break
+            self.put(output_queue, chunk)
+
+        if chunk[0] == "error":
+            raise Exception(chunk[1])
+        self.processor.trade_file_path = trade_file_path
+        print(f"Loaded {chunk[1]} trade records")
+        self.stage_seconds[name] = chunk[2]
+        self.put(output_queue, _END)
+
+    def normalize_stage(self, name, input_queue, output_queue):
+        """Apply the CNH handling to each chunk"""
+        while True:
+            chunk = self.get(input_queue)
+            if chunk is _END:
+                break
+            started = time.perf_counter()
+            chunk = chunk.copy()
+            self.cnh_trades_count += self.processor.normalize_cnh_trades(chunk)
+            self.add_busy_time(name, started)
+            self.put(output_queue, chunk)
+        self.put(output_queue, _END)
+
+    def score_stage(self, name, input_queue, row_queue, writer):
+        """Search each trade of a chunk and hand the chunk's export rows to the writer"""
+        processor = self.processor
+        processor.results = None
+        processor.negative_lookup_count = 0
+        processor.latency = LatencyRecorder(processor.slow_trade_ms, processor.slow_trade_log)
+        summary = {"total": 0, "matched": 0, "high_confidence": 0, "negative_lookups": 0}
+        mapped = False
+
+        try:
+            while True:
+                chunk = self.get(input_queue)
+                if chunk is _END:
+                    break
+                started = time.perf_counter()
+
+                # The mapping needs the processed columns, so it is made from the first normalized chunk
+                if not mapped:
+                    processor.auto_map_columns(self.asset_class, chunk.columns)
+                    mapped = True
+
+                rows = []
+                for idx, trade in chunk.iterrows():
+                    best_match, best_score = processor.search_trade(idx, trade, self.asset_class)
+                    rows.append(processor.build_export_row(processor.build_result(idx, trade, best_match, best_score)))
+                    summary["total"] += 1
+                    if best_score >= 50:
+                        summary["matched"] += 1
+                    if best_score >= 80:
+                        summary["high_confidence"] += 1
+
+                self.add_busy_time(name, started)
+                self.put(row_queue, rows, writer)
+        finally:
+            processor.latency.close()
+
+        summary["negative_lookups"] = processor.negative_lookup_count
+        processor.summary = summary
+
+    def wait_for_writer(self, status_queue, writer):
+        """Wait for the writer process to save the workbook; return the rows written"""
+        while True:
+            try:
+                status = status_queue.get(timeout=QUEUE_POLL_SECONDS)
+                break
+            except queue.Empty:
+                if not writer.is_alive():
+                    raise Exception("Writer process stopped unexpectedly")
+
+        if status[0] == "error":
+            self.errors.append(f"write stage: {status[1]}")
+            self.failed.set()
+            return None
+        self.stage_seconds["write"] = status[2]
+        return status[1]
+
+    def print_stage_times(self, total_seconds):
+        """Print each stage's busy time - the run takes about as long as the slowest one"""
+        print(f"Pipeline finished in {total_seconds:.2f}s. Busy time per stage:")
+        for name in ["load UPI", "read", "normalize", "score", "write"]:
+            if name in self.stage_seconds:
+                print(f"  {name:<10} {self.stage_seconds[name]:8.2f}s")
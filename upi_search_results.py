@@ -0,0 +1,149 @@
+from array import array
+
+class CompactResults:
+    """Array-backed UPI search results for runs with very many trades
+
+    Each result is held as a handful of integers: trade row position, best UPI
+    id, score, message code, candidate count, partial flag and the top-K
+    candidate ids and scores. UPI keys and messages are interned, so repeated values cost one
+    table entry. Trade and UPI details are joined back only when a result is
+    materialized (indexing or iterating), through the materializer callback.
+    """
+
+    NO_UPI = -1
+
+    def __init__(self, top_k=5, materializer=None):
+        self.top_k = top_k
+        self.materializer = materializer
+
+        # One entry per result
+        self.trade_rows = array('q')
+        self.best_upis = array('q')
+        self.scores = array('q')
+        self.message_codes = array('q')
+        self.candidate_counts = array('q')
+        # 1 where scoring stopped at the time limit before every candidate was scored
+        self.partial_flags = array('b')
+
+        # top_k entries per result, padded with NO_UPI
+        self.candidate_upis = array('q')
+        self.candidate_scores = array('q')
+
+        # Interned UPI keys and messages
+        self.upi_keys = []
+        self.upi_key_ids = {}
+        self.messages = []
+        self.message_ids = {}
+
+    def _intern_upi(self, upi_key):
+        if upi_key is None:
+            return self.NO_UPI
+        upi_id = self.upi_key_ids.get(upi_key)
+        if upi_id is None:
+            upi_id = len(self.upi_keys)
+            self.upi_keys.append(upi_key)
+            self.upi_key_ids[upi_key] = upi_id
+        return upi_id
+
+    def _intern_message(self, message):
+        message_id = self.message_ids.get(message)
+        if message_id is None:
+            message_id = len(self.messages)
+            self.messages.append(message)
+            self.message_ids[message] = message_id
+        return message_id
+
+    def append(self, trade_row, best_upi_key, score, message="", candidates=(), candidate_count=None, partial=False):
+        """Add one result
+
+        candidates is a sequence of (upi key, score) pairs, best first; only
+        the first top_k are kept. candidate_count defaults to len(candidates).
+        partial marks a best-so-far result of a search cut short.
+        """
+        candidates = list(candidates)
+
+        self.trade_rows.append(trade_row)
+        self.best_upis.append(self._intern_upi(best_upi_key))
+        self.scores.append(int(score))
+        self.message_codes.append(self._intern_message(message))
+        self.candidate_counts.append(len(candidates) if candidate_count is None else candidate_count)
+        self.partial_flags.append(1 if partial else 0)
+
+        for position in range(self.top_k):
+            if position < len(candidates):
+                upi_key, candidate_score = candidates[position]
+                self.candidate_upis.append(self._intern_upi(upi_key))
+                self.candidate_scores.append(int(candidate_score))
+            else:
+                self.candidate_upis.append(self.NO_UPI)
+                self.candidate_scores.append(0)
+
+    def trade_row(self, index):
+        """Trade row position of a result"""
+        return self.trade_rows[index]
+
+    def best_upi(self, index):
+        """UPI key of the best match, or None"""
+        upi_id = self.best_upis[index]
+        return None if upi_id == self.NO_UPI else self.upi_keys[upi_id]
+
+    def score(self, index):
+        """Match score of a result"""
+        return self.scores[index]
+
+    def message(self, index):
+        """Status message of a result"""
+        return self.messages[self.message_codes[index]]
+
+    def candidate_count(self, index):
+        """Total number of candidate UPIs found for a result"""
+        return self.candidate_counts[index]
+
+    def partial(self, index):
+        """Check whether a result is the best so far of a search stopped at the time limit"""
+        return bool(self.partial_flags[index])
+
+    def candidates(self, index):
+        """Top-K (upi key, score) candidates of a result, best first"""
+        start = index * self.top_k
+        candidates = []
+        for position in range(start, start + self.top_k):
+            upi_id = self.candidate_upis[position]
+            if upi_id == self.NO_UPI:
+                break
+            candidates.append((self.upi_keys[upi_id], self.candidate_scores[position]))
+        return candidates
+
+    def matched_count(self):
+        """Number of results with a best-matching UPI"""
+        return sum(1 for upi_id in self.best_upis if upi_id != self.NO_UPI)
+
+    def __getstate__(self):
+        # The materializer is bound to the caller - it is re-attached after loading
+        state = self.__dict__.copy()
+        state["materializer"] = None
+        return state
+
+    def __len__(self):
+        return len(self.trade_rows)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("result index out of range")
+        if self.materializer is None:
+            return {
+                "TradeRow": self.trade_row(index),
+                "BestUPI": self.best_upi(index),
+                "Score": self.score(index),
+                "Message": self.message(index),
+                "CandidateCount": self.candidate_count(index),
+                "Partial": self.partial(index),
+                "Candidates": self.candidates(index),
+            }
+        return self.materializer(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
@@ -0,0 +1,58 @@
+import re
+import zlib
+import pickle
+
+# Ways to split trades between shards
+SHARD_KEYS = ["pair", "row"]
+
+PARTIAL_FORMAT_VERSION = 1
+
+def parse_shard(value):
+    """Parse a shard spec such as 2/4 into (shard number, shard count); shards are numbered from 1"""
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", str(value))
+    if not match:
+        raise ValueError(f"Invalid shard: {value} (expected i/N, e.g. 1/4)")
+    number, count = int(match.group(1)), int(match.group(2))
+    if count < 1 or not 1 <= number <= count:
+        raise ValueError(f"Invalid shard: {value} (i must be between 1 and N)")
+    return number, count
+
+def shard_of(key, shard_count):
+    """Shard number (from 1) of a key - crc32, so every machine and process agrees"""
+    return zlib.crc32(str(key).encode('utf-8')) % shard_count + 1
+
+def write_partial(path, header, chunks):
+    """Write a shard's partial result file: a header dict followed by its result chunks"""
+    chunks = list(chunks)
+    header = dict(header, version=PARTIAL_FORMAT_VERSION, chunk_count=len(chunks))
+    with open(path, 'wb') as f:
+        pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+        for chunk in chunks:
+            pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def read_partial(path):
+    """Read a partial result file; return (header, chunks)"""
+    with open(path, 'rb') as f:
+        header = pickle.load(f)
+        if not isinstance(header, dict) or header.get("version") != PARTIAL_FORMAT_VERSION:
+            raise ValueError(f"{path} is not a partial result file")
+        chunks = [pickle.load(f) for _ in range(header["chunk_count"])]
+    return header, chunks
+
+def check_partials(headers):
+    """Check that partial headers come from one sharded run and cover every shard once"""
+    if not headers:
+        raise ValueError("No partial result files given")
+
+    first = headers[0]
+    for header in headers[1:]:
+        if header["fingerprint"] != first["fingerprint"]:
+            raise ValueError("Partial results were written for different inputs, mapping or shard settings")
+
+    shard_count = first["shard_count"]
+    numbers = sorted(header["shard"] for header in headers)
+    if numbers != list(range(1, shard_count + 1)):
+        missing = sorted(set(range(1, shard_count + 1)) - set(numbers))
+        duplicated = sorted(set(n for n in numbers if numbers.count(n) > 1))
+        raise ValueError(f"Partial results do not cover {shard_count} shards exactly once "
+                         f"(missing: {missing or 'none'}, duplicated: {duplicated or 'none'})")
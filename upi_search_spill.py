@@ -0,0 +1,113 @@
+import os
+import re
+import pickle
+import shutil
+import tempfile
+
+# Trades searched between two memory checks
+MEMORY_CHECK_INTERVAL = 1000
+
+# Results the live chunk must hold before it may be spilled
+SPILL_MIN_RESULTS = 100000
+
+_MEMORY_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+def parse_memory_size(value):
+    """Parse a memory size such as 512M, 2G, 1.5GB or a plain byte count"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)I?B?\s*", str(value).upper())
+    if not match:
+        raise ValueError(f"Invalid memory size: {value}")
+    return int(float(match.group(1)) * _MEMORY_UNITS[match.group(2)])
+
+def get_resident_memory():
+    """Current resident set size of this process in bytes (0 if unknown)"""
+    # Linux: current RSS from /proc
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+
+    # Other Unix: peak RSS is the best available figure
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return 0
+
+class ResultSpill:
+    """Search results kept as a chain of CompactResults chunks
+
+    When the process reaches the memory budget, the live chunk is pickled to a
+    temporary file and a new chunk is started. Length and iteration cover the
+    spilled chunks in order followed by the live one, loading one spilled chunk
+    at a time, so the final output is produced by merging the spill files.
+
+    The budget is a soft target: spilling frees result memory only, so the
+    process may stay over it. A chunk is therefore spilled only once it holds
+    min_chunk results, which keeps the spill files few and large.
+    """
+
+    def __init__(self, new_chunk, max_memory, spill_dir=None, min_chunk=SPILL_MIN_RESULTS):
+        self.new_chunk = new_chunk
+        self.max_memory = max_memory
+        self.min_chunk = max(1, min_chunk)
+        self.spill_dir = spill_dir
+        self.temp_dir = None
+        self.chunk_paths = []
+        self.spilled_count = 0
+        self.current = new_chunk()
+
+    def append(self, *args, **kwargs):
+        """Add one result to the live chunk"""
+        self.current.append(*args, **kwargs)
+
+    def over_budget(self):
+        """Check whether the resident footprint has reached the budget"""
+        return get_resident_memory() >= self.max_memory
+
+    def check_memory(self):
+        """Spill the live chunk if it is large enough and the budget is reached; return True if it was spilled"""
+        if len(self.current) >= self.min_chunk and self.over_budget():
+            self.spill()
+            return True
+        return False
+
+    def spill(self):
+        """Write the live chunk to a temporary file and start a new one"""
+        if self.temp_dir is None:
+            self.temp_dir = tempfile.mkdtemp(prefix="upi_spill_", dir=self.spill_dir)
+
+        path = os.path.join(self.temp_dir, f"results_{len(self.chunk_paths):06d}.pkl")
+        with open(path, 'wb') as f:
+            pickle.dump(self.current, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self.chunk_paths.append(path)
+        self.spilled_count += len(self.current)
+        self.current = self.new_chunk()
+
+    def iter_chunks(self):
+        """Yield the spilled chunks in order, then the live chunk"""
+        for path in self.chunk_paths:
+            with open(path, 'rb') as f:
+                chunk = pickle.load(f)
+            chunk.materializer = self.current.materializer
+            yield chunk
+        yield self.current
+
+    def cleanup(self):
+        """Remove the spill files"""
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.temp_dir = None
+            self.chunk_paths = []
+
+    def __len__(self):
+        return self.spilled_count + len(self.current)
+
+    def __iter__(self):
+        for chunk in self.iter_chunks():
+            for result in chunk:
+                yield result
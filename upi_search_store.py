@@ -0,0 +1,332 @@
+import json
+import os
+import sqlite3
+from upi_records import resolve_records_paths, open_input_file, is_compressed_file, LoadCancelled, RejectLog
+from upi_schema import get_record_validator
+
+class UPIRecordStore:
+    """On-disk SQLite store for DSB RECORDS data that does not fit in memory"""
+
+    # Attributes read by the scoring engine - stored as indexed columns
+    ATTRIBUTE_COLUMNS = [
+        "NotionalCurrency",
+        "OtherNotionalCurrency",
+        "SettlementCurrency",
+        "ReferenceRate",
+        "ReferenceRateTermValue",
+        "ReferenceRateTermUnit",
+        "OtherLegReferenceRate",
+        "OtherLegReferenceRateTermValue",
+        "OtherLegReferenceRateTermUnit",
+        "NotionalSchedule",
+        "DeliveryType",
+        "OptionType",
+        "OptionExerciseStyle",
+        "ValuationMethodorTrigger",
+        "UnderlyingAssetType",
+        "ReturnorPayoutTrigger",
+        "PlaceofSettlement",
+    ]
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # The store may be built on a loader thread and queried from the UI thread
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        # Lines rejected by the last ingest
+        self.rejects = RejectLog()
+        # Attribute column -> normalized value -> stored spellings, read on first ranked lookup
+        self.spellings = {}
+        self._create_schema()
+
+    def _create_schema(self):
+        """Create the records and metadata tables if they do not exist"""
+        attribute_columns = ", ".join(f'"{column}" TEXT' for column in self.ATTRIBUTE_COLUMNS)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS upi_records ("
+            "upi TEXT PRIMARY KEY, "
+            "asset_class TEXT, "
+            "instrument_type TEXT, "
+            "use_case TEXT, "
+            "level TEXT, "
+            "status TEXT, "
+            f"{attribute_columns}, "
+            "raw_json TEXT NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self.connection.commit()
+
+    def _create_indexes(self):
+        """Create lookup indexes - done after bulk ingest so inserts stay fast"""
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_upi_partition "
+            "ON upi_records (asset_class, use_case, instrument_type)"
+        )
+        for column in self.ATTRIBUTE_COLUMNS:
+            self.connection.execute(
+                f'CREATE INDEX IF NOT EXISTS "idx_upi_{column}" ON upi_records ("{column}")'
+            )
+        self.connection.commit()
+
+    def _source_signature(self, source_path, schema_dir=None):
+        """Identify the source files by path, size and modification time (and the schemas checked against)"""
+        signature = []
+        for path in resolve_records_paths(source_path):
+            stat = os.stat(path)
+            signature.append([os.path.abspath(path), stat.st_size, stat.st_mtime])
+        if schema_dir:
+            signature.append(["schemas", os.path.abspath(schema_dir)])
+        return json.dumps(signature)
+
+    def is_current(self, source_path, schema_dir=None):
+        """Check whether the store already holds an ingest of this exact source file"""
+        try:
+            row = self.connection.execute(
+                "SELECT value FROM store_meta WHERE key = 'source'"
+            ).fetchone()
+            return row is not None and row[0] == self._source_signature(source_path, schema_dir)
+        except Exception:
+            return False
+
+    def ingest_records_file(self, file_path, validator=None, batch_size=5000, progress=None, cancel_event=None,
+                            schema_dir=None):
+        """Stream a RECORDS file (JSON line format) into the store
+
+        The path may also be a directory or glob pattern of RECORDS files.
+        With a schema_dir, records are also checked against the compiled record
+        templates there. Rejected lines are counted by reason in self.rejects.
+        progress, if given, is called after every batch with a dict of bytes,
+        total_bytes, parsed and rejected (bytes are decoded characters, and
+        total_bytes is None when a file is compressed). Setting cancel_event
+        stops the ingest with LoadCancelled and leaves the store unchanged.
+        Returns a tuple of (records stored, lines rejected).
+        """
+        try:
+            schema_validator = get_record_validator(schema_dir) if schema_dir else None
+
+            # Start from an empty table so a re-ingest never mixes two files
+            self.connection.execute("DELETE FROM store_meta")
+            self.connection.execute("DELETE FROM upi_records")
+
+            columns = ["upi", "asset_class", "instrument_type", "use_case", "level", "status"]
+            columns += self.ATTRIBUTE_COLUMNS + ["raw_json"]
+            insert_sql = (
+                "INSERT OR REPLACE INTO upi_records ("
+                + ", ".join(f'"{column}"' for column in columns)
+                + ") VALUES (" + ", ".join("?" for _ in columns) + ")"
+            )
+
+            stored = 0
+            rejects = self.rejects = RejectLog()
+            self.spellings = {}
+            batch = []
+
+            paths = resolve_records_paths(file_path)
+            total_bytes = None
+            if not any(is_compressed_file(path) for path in paths):
+                total_bytes = sum(os.path.getsize(path) for path in paths)
+            read_bytes = 0
+
+            for path in paths:
+                with open_input_file(path) as f:
+                    for line_num, line in enumerate(f, 1):
+                        read_bytes += len(line)
+                        line = line.strip()
+
+                        # Skip empty lines and comments
+                        if not line or line.startswith('#'):
+                            continue
+
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            rejects.add("invalid JSON", path, f"line {line_num}")
+                            continue
+
+                        if validator is not None and not validator(record):
+                            rejects.add("not a UPI record", path, f"line {line_num}")
+                            continue
+
+                        if schema_validator is not None:
+                            problem = schema_validator.check(record)
+                            if problem is not None:
+                                rejects.add(problem, path, f"line {line_num}")
+                                continue
+
+                        batch.append(self._record_to_row(record, line))
+                        if len(batch) >= batch_size:
+                            self.connection.executemany(insert_sql, batch)
+                            stored += len(batch)
+                            batch = []
+
+                            if cancel_event is not None and cancel_event.is_set():
+                                raise LoadCancelled("Load cancelled")
+                            if progress is not None:
+                                progress({"bytes": read_bytes, "total_bytes": total_bytes,
+                                          "parsed": stored, "rejected": rejects.count})
+
+            if batch:
+                self.connection.executemany(insert_sql, batch)
+                stored += len(batch)
+
+            self.connection.execute(
+                "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('source', ?)",
+                (self._source_signature(file_path, schema_dir),)
+            )
+            self.connection.commit()
+            self._create_indexes()
+
+            return stored, rejects.count
+
+        except LoadCancelled:
+            self.connection.rollback()
+            raise
+
+        except Exception as e:
+            self.connection.rollback()
+            raise Exception(f"Error ingesting RECORDS file into store: {str(e)}")
+
+    def _record_to_row(self, record, raw_json):
+        """Convert a RECORDS entry into a row for the upi_records table"""
+        header = record.get("Header", {})
+        identifier = record.get("Identifier", {})
+        attributes = record.get("Attributes", {})
+
+        row = [
+            identifier.get("UPI"),
+            header.get("AssetClass"),
+            header.get("InstrumentType"),
+            header.get("UseCase"),
+            header.get("Level"),
+            identifier.get("Status"),
+        ]
+        for column in self.ATTRIBUTE_COLUMNS:
+            value = attributes.get(column)
+            row.append(None if value is None else str(value))
+        row.append(raw_json)
+        return row
+
+    def _partition_filter(self, asset_class, use_case=None, instrument_type=None):
+        """Build the WHERE clause for a (AssetClass, UseCase, InstrumentType) lookup"""
+        clauses = ["asset_class = ?"]
+        params = [asset_class]
+        if use_case is not None:
+            clauses.append("use_case = ?")
+            params.append(use_case)
+        if instrument_type is not None:
+            clauses.append("instrument_type = ?")
+            params.append(instrument_type)
+        return " AND ".join(clauses), params
+
+    def count(self, asset_class, use_case=None, instrument_type=None):
+        """Count records in a partition"""
+        where, params = self._partition_filter(asset_class, use_case, instrument_type)
+        row = self.connection.execute(
+            f"SELECT COUNT(*) FROM upi_records WHERE {where}", params
+        ).fetchone()
+        return row[0]
+
+    def has_records(self, asset_class, use_case=None, instrument_type=None):
+        """Check whether a partition holds at least one record"""
+        where, params = self._partition_filter(asset_class, use_case, instrument_type)
+        row = self.connection.execute(
+            f"SELECT 1 FROM upi_records WHERE {where} LIMIT 1", params
+        ).fetchone()
+        return row is not None
+
+    def iter_records(self, asset_class, use_case=None, instrument_type=None, batch_size=1000):
+        """Yield decoded records from a partition, holding at most one batch in memory"""
+        where, params = self._partition_filter(asset_class, use_case, instrument_type)
+        cursor = self.connection.execute(
+            f"SELECT raw_json FROM upi_records WHERE {where} ORDER BY rowid", params
+        )
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for (raw_json,) in rows:
+                yield json.loads(raw_json)
+
+    def iter_ranked_records(self, asset_class, use_case, instrument_type, lookups, batch_size=1000):
+        """Yield (rowid, record) pairs of a partition, records holding the looked-up values first
+
+        Same order as UPIPartitionIndex.iter_ranked_records: lookups is a list of
+        (attribute, normalized value) in priority order, each answered through
+        the attribute column's index; the remaining records follow in stored
+        order. Attributes without a stored column are skipped. The rowid gives
+        each record's place in the stored order.
+        """
+        where, params = self._partition_filter(asset_class, use_case, instrument_type)
+        seen = set()
+        for column, value in lookups:
+            if column not in self.ATTRIBUTE_COLUMNS:
+                continue
+            spellings = self._get_spellings(column).get(value)
+            if not spellings:
+                continue
+            cursor = self.connection.execute(
+                f'SELECT rowid, raw_json FROM upi_records WHERE {where} AND "{column}" IN '
+                f'({", ".join("?" for _ in spellings)}) ORDER BY rowid', params + spellings
+            )
+            yield from self._iter_unseen(cursor, seen, batch_size)
+
+        cursor = self.connection.execute(
+            f"SELECT rowid, raw_json FROM upi_records WHERE {where} ORDER BY rowid", params
+        )
+        yield from self._iter_unseen(cursor, seen, batch_size, remember=False)
+
+    def _iter_unseen(self, cursor, seen, batch_size, remember=True):
+        """Decode the (rowid, raw_json) rows of a cursor whose rowid is not in seen (adding them to it) into (rowid, record)"""
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for rowid, raw_json in rows:
+                if rowid not in seen:
+                    if remember:
+                        seen.add(rowid)
+                    yield rowid, json.loads(raw_json)
+
+    def _get_spellings(self, column):
+        """Stored spellings of each normalized value of an attribute column"""
+        spellings = self.spellings.get(column)
+        if spellings is None:
+            spellings = self.spellings[column] = {}
+            rows = self.connection.execute(
+                f'SELECT DISTINCT "{column}" FROM upi_records WHERE "{column}" IS NOT NULL'
+            ).fetchall()
+            for (value,) in rows:
+                spellings.setdefault(value.strip().upper(), []).append(value)
+        return spellings
+
+    def get_record(self, upi):
+        """Look up a record by Identifier.UPI"""
+        row = self.connection.execute(
+            "SELECT raw_json FROM upi_records WHERE upi = ?", (upi,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_use_cases(self, asset_class):
+        """List the distinct UseCase values stored for an asset class"""
+        rows = self.connection.execute(
+            "SELECT DISTINCT use_case FROM upi_records WHERE asset_class = ? AND use_case IS NOT NULL",
+            (asset_class,)
+        ).fetchall()
+        return sorted(row[0] for row in rows if row[0])
+
+    def distinct_values(self, columns):
+        """Collect the distinct normalized values stored in a set of attribute columns"""
+        values = set()
+        for column in columns:
+            if column not in self.ATTRIBUTE_COLUMNS:
+                raise ValueError(f"Not a stored attribute column: {column}")
+            rows = self.connection.execute(
+                f'SELECT DISTINCT "{column}" FROM upi_records WHERE "{column}" IS NOT NULL'
+            ).fetchall()
+            values.update(row[0].strip().upper() for row in rows)
+        return values
+
+    def close(self):
+        """Close the underlying database connection"""
+        self.connection.close()
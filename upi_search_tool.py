@@ -7,6 +7,37 @@ import re
 from tkinter import scrolledtext
 import traceback
 import time
+import hashlib
+import tempfile
+import threading
+import queue
+from upi_search_store import UPIRecordStore
+from upi_records import ingest_records, is_valid_upi_record, LoadCancelled
+from upi_schema import DEFAULT_SCHEMA_DIR
+from upi_search_index import ReferenceRateIndex, UPIPartitionIndex, AttributeValueSets, ExactMatchIndex
+from upi_search_results import CompactResults
+from upi_trade_cache import read_trade_workbook
+from upi_search_metrics import LatencyRecorder, DEFAULT_SLOW_TRADE_MS
+from upi_reload import UPIDataset, UPISourceWatcher, source_signature
+
+# Rows rendered in the results table at a time
+RESULTS_PAGE_SIZE = 500
+
+# Milliseconds between checks for background file-loading progress
+LOAD_POLL_INTERVAL = 100
+
+# Milliseconds between checks for a reloaded UPI dataset while no search is running
+RELOAD_POLL_INTERVAL = 1000
+
+# Milliseconds of searching between two returns to the Tk event loop
+SEARCH_SLICE_MS = 50
+
+# Identifier.Status values of UPIs that are still in use
+ACTIVE_UPI_STATUSES = ("New", "Updated")
+
+# Results view filter and sort choices
+RESULT_STATUS_FILTERS = ["All", "Matched", "No Match", "Multiple Candidates"]
+RESULT_SORT_ORDERS = ["Trade Order", "Score (High to Low)", "Score (Low to High)"]
 
 class UPISearchTool:
     def __init__(self, root):
@@ -16,13 +47,58 @@ class UPISearchTool:
         
         # Initialize variables
         self.upi_data = None
+        self.upi_partitions = None
+        self.upi_store = None
+        self.loaded_upi_source = None
+        self.upi_dataset = None
+        self.upi_watcher = None
+        self.reference_rate_index = None
+        self.partition_value_sets = {}
+        self.exact_match_indexes = {}
+        self.negative_lookup_count = 0
+        self.exact_match_count = 0
+        self.existing_upi_column = None
+        self.confirmed_upi_count = 0
+        self.rejected_upi_count = 0
+        # Milliseconds a trade may spend scoring before its best match so far is returned (None: no limit)
+        self.trade_time_limit_ms = None
+        self.deadline_hit_count = 0
+        self.latency = LatencyRecorder(DEFAULT_SLOW_TRADE_MS)
         self.trade_data = None
+        self.load_pending = set()
+        self.load_events = None
+        self.load_cancel = None
+        self.search_running = False
+        self.search_trades = None
+        self.search_mapping = {}
+        self.search_default_route = None
         self.upi_file_path = tk.StringVar()
         self.trade_file_path = tk.StringVar()
         self.asset_class = tk.StringVar(value="FX")
+        self.use_disk_store = tk.BooleanVar(value=False)
+        self.use_trade_cache = tk.BooleanVar(value=True)
+        self.validate_schemas = tk.BooleanVar(value=True)
+        self.watch_upi_source = tk.BooleanVar(value=False)
+        self.score_alternatives = tk.BooleanVar(value=False)
+        self.validate_upi_column = tk.StringVar(value="N/A")
+        self.trade_time_limit = tk.StringVar(value="")
         self.product_type = tk.StringVar()
+        self.auto_route = tk.BooleanVar(value=False)
+        self.route_asset_class_column = tk.StringVar(value="N/A")
+        self.route_product_column = tk.StringVar(value="N/A")
+        self.trade_routes = []
+        self.route_cache = {}
+        self.route_mapping_fields = {}
+        self.result_routes = []
+        self.result_versions = []
+        # UPI datasets that results were matched against, by version
+        self.result_datasets = {}
+        self.unrouted_count = 0
         self.mapping_dict = {}
         self.results = []
+        self.results_view = []
+        self.results_page = 0
+        self.trade_id_column = None
         self.available_products = []
         
         # Load UPI schemas for attribute definitions
@@ -31,6 +107,9 @@ class UPISearchTool:
         
         # Create UI
         self.create_ui()
+        
+        # Pick up UPI data rebuilt after a change to the watched RECORDS file
+        self.root.after(RELOAD_POLL_INTERVAL, self.poll_upi_reload)
     
     def _load_upi_schemas(self):
         """Load UPI schema files to get attribute definitions and allowable values"""
@@ -66,11 +145,18 @@ class UPISearchTool:
     def get_upi_attribute_details(self, field_name):
         """Get attribute details (description, enum values) from UPI schema"""
         try:
-            asset_class = "Foreign_Exchange" if self.asset_class.get() == "FX" else "Rates"
-            product = self.product_type.get()
+            if self.auto_route.get():
+                routes = self.get_routed_products()
+            else:
+                routes = [(self.asset_class.get(), self.product_type.get())]
             
-            schema_key = (asset_class, product)
-            schema = self.upi_schemas.get(schema_key)
+            # First routed product whose schema defines the field
+            schema = None
+            for route_asset_class, product in routes:
+                asset_class = "Foreign_Exchange" if route_asset_class == "FX" else "Rates"
+                schema = self.upi_schemas.get((asset_class, product))
+                if schema and field_name in schema.get("properties", {}).get("Attributes", {}).get("properties", {}):
+                    break
             
             if not schema:
                 return {"description": "", "enum": [], "elaboration": {}}
@@ -140,8 +226,10 @@ class UPISearchTool:
         ttk.Button(upi_frame, text="Browse", command=self.browse_upi_file).grid(row=0, column=2, padx=5, pady=5)
         
         # Add note about RECORDS format
-        ttk.Label(upi_frame, text="Note: Supports RECORDS files downloaded from DSB website (JSON line format)", 
+        ttk.Label(upi_frame, text="Note: Supports RECORDS files downloaded from DSB website (JSON line format), plain or .gz/.bz2/.xz/.zip compressed", 
                  font=("Arial", 8), foreground="gray").grid(row=1, column=0, columnspan=3, padx=5, pady=2, sticky='w')
+        ttk.Label(upi_frame, text="A folder or wildcard pattern (e.g. C:\\DSB\\*.RECORDS) loads and merges several files in parallel", 
+                 font=("Arial", 8), foreground="gray").grid(row=2, column=0, columnspan=3, padx=5, pady=2, sticky='w')
         
         # Trade Data Upload
         trade_frame = ttk.LabelFrame(self.tab1, text="Trade Data (Excel)")
@@ -158,12 +246,43 @@ class UPISearchTool:
         ttk.Radiobutton(asset_frame, text="FX (Foreign Exchange)", variable=self.asset_class, value="FX").grid(row=0, column=0, padx=5, pady=5, sticky='w')
         ttk.Radiobutton(asset_frame, text="IR (Interest Rate)", variable=self.asset_class, value="IR").grid(row=0, column=1, padx=5, pady=5, sticky='w')
         
+        # Storage backend selection
+        storage_frame = ttk.LabelFrame(self.tab1, text="Storage")
+        storage_frame.pack(fill='x', expand=True, padx=10, pady=10)
+        
+        ttk.Checkbutton(storage_frame, text="Use on-disk UPI store (SQLite) for RECORDS files larger than memory",
+                        variable=self.use_disk_store).grid(row=0, column=0, padx=5, pady=5, sticky='w')
+        ttk.Label(storage_frame, text="Note: The store is built next to the RECORDS file on first load and reused while the file is unchanged",
+                 font=("Arial", 8), foreground="gray").grid(row=1, column=0, padx=5, pady=2, sticky='w')
+        ttk.Checkbutton(storage_frame, text="Cache the trade workbook for faster reloads",
+                        variable=self.use_trade_cache).grid(row=2, column=0, padx=5, pady=5, sticky='w')
+        ttk.Label(storage_frame, text="Note: A columnar copy is saved next to the workbook and used while the workbook is unchanged",
+                 font=("Arial", 8), foreground="gray").grid(row=3, column=0, padx=5, pady=2, sticky='w')
+        ttk.Checkbutton(storage_frame, text="Validate UPI records against the bundled DSB record templates",
+                        variable=self.validate_schemas).grid(row=4, column=0, padx=5, pady=5, sticky='w')
+        ttk.Checkbutton(storage_frame, text="Reload UPI data automatically when the RECORDS file changes",
+                        variable=self.watch_upi_source).grid(row=5, column=0, padx=5, pady=5, sticky='w')
+        ttk.Label(storage_frame, text="Note: The new data is indexed in the background and swapped in between trades; results show the UPI data version they were matched against",
+                 font=("Arial", 8), foreground="gray").grid(row=6, column=0, padx=5, pady=2, sticky='w')
+        
         # Load Data Button
-        ttk.Button(self.tab1, text="Load Data", command=self.load_data).pack(pady=20)
+        self.load_button = ttk.Button(self.tab1, text="Load Data", command=self.load_data)
+        self.load_button.pack(pady=20)
+        
+        # Loading progress (shown while the files load in the background)
+        self.load_progress_frame = ttk.Frame(self.tab1)
+        self.load_progress_bar = ttk.Progressbar(self.load_progress_frame, mode='determinate', maximum=100)
+        self.load_progress_bar.pack(fill='x', padx=20, pady=5)
+        self.upi_load_progress = tk.StringVar()
+        ttk.Label(self.load_progress_frame, textvariable=self.upi_load_progress).pack(pady=2)
+        self.trade_load_progress = tk.StringVar()
+        ttk.Label(self.load_progress_frame, textvariable=self.trade_load_progress).pack(pady=2)
+        ttk.Button(self.load_progress_frame, text="Cancel", command=self.cancel_load).pack(pady=5)
         
         # Status display
         self.status_upload = tk.StringVar()
-        ttk.Label(self.tab1, textvariable=self.status_upload).pack(pady=5)
+        self.status_label_upload = ttk.Label(self.tab1, textvariable=self.status_upload)
+        self.status_label_upload.pack(pady=5)
     
     def create_product_selection_tab(self):
         # Product selection frame
@@ -177,6 +296,19 @@ class UPISearchTool:
         self.product_label = ttk.Label(product_frame, text="Product Type:")
         self.product_dropdown = ttk.Combobox(product_frame, textvariable=self.product_type, width=40, state="readonly")
         
+        # Auto-routing for trade files mixing asset classes and products
+        self.route_frame = ttk.LabelFrame(self.tab2, text="Mixed Trade Files")
+        ttk.Checkbutton(self.route_frame, text="Auto-route each trade to its product (ignores the product selected above)",
+                        variable=self.auto_route).grid(row=0, column=0, columnspan=2, padx=5, pady=5, sticky='w')
+        ttk.Label(self.route_frame, text="Product Column:").grid(row=1, column=0, padx=5, pady=5, sticky='w')
+        self.route_product_dropdown = ttk.Combobox(self.route_frame, textvariable=self.route_product_column, width=30, state="readonly")
+        self.route_product_dropdown.grid(row=1, column=1, padx=5, pady=5, sticky='w')
+        ttk.Label(self.route_frame, text="Asset Class Column:").grid(row=2, column=0, padx=5, pady=5, sticky='w')
+        self.route_asset_class_dropdown = ttk.Combobox(self.route_frame, textvariable=self.route_asset_class_column, width=30, state="readonly")
+        self.route_asset_class_dropdown.grid(row=2, column=1, padx=5, pady=5, sticky='w')
+        ttk.Label(self.route_frame, text="Note: Product values are matched to UPI products (e.g. NDF, Vanilla_Option, Basis); without an asset class column the asset class selected on the first tab is used",
+                 font=("Arial", 8), foreground="gray").grid(row=3, column=0, columnspan=2, padx=5, pady=2, sticky='w')
+        
         # Continue button
         self.continue_button = ttk.Button(self.tab2, text="Continue to Column Mapping", command=self.proceed_to_mapping)
         
@@ -193,6 +325,20 @@ class UPISearchTool:
         
         # Map Button (initially hidden)
         self.map_button = ttk.Button(self.tab3, text="Map Columns & Search UPIs", command=self.search_upis)
+        self.alternatives_check = ttk.Checkbutton(
+            self.tab3, text="Score alternative candidates for exact matches (slower; fills the Alternative UPI columns)",
+            variable=self.score_alternatives)
+        
+        # Trades that already carry a UPI are validated instead of searched
+        self.validate_upi_frame = ttk.Frame(self.tab3)
+        ttk.Label(self.validate_upi_frame, text="Existing UPI column (confirm it instead of searching):").pack(side='left', padx=5)
+        self.validate_upi_dropdown = ttk.Combobox(self.validate_upi_frame, textvariable=self.validate_upi_column, width=25)
+        self.validate_upi_dropdown.pack(side='left', padx=5)
+        
+        # Bounded response time: scoring stops at the limit with the best match found so far
+        self.time_limit_frame = ttk.Frame(self.tab3)
+        ttk.Label(self.time_limit_frame, text="Time limit per trade in ms (blank for none; results are then partial):").pack(side='left', padx=5)
+        ttk.Entry(self.time_limit_frame, textvariable=self.trade_time_limit, width=10).pack(side='left', padx=5)
         
         # Progress bar for UPI search
         self.progress_frame = ttk.Frame(self.tab3)
@@ -209,19 +355,72 @@ class UPISearchTool:
         results_frame = ttk.Frame(self.tab4)
         results_frame.pack(fill='both', expand=True, padx=10, pady=10)
         
-        # Create a scrolled text widget for displaying results
-        self.results_text = scrolledtext.ScrolledText(results_frame, wrap=tk.WORD, width=100, height=35)
+        # Summary of the search
+        self.results_summary = tk.StringVar(value="Results will be displayed here after mapping and searching.")
+        ttk.Label(results_frame, textvariable=self.results_summary, justify=tk.LEFT).pack(anchor='w', padx=5, pady=5)
+        
+        # Filter and sort controls
+        controls_frame = ttk.Frame(results_frame)
+        controls_frame.pack(fill='x', padx=5, pady=5)
+        
+        ttk.Label(controls_frame, text="Status:").pack(side=tk.LEFT)
+        self.results_status_filter = tk.StringVar(value="All")
+        status_combo = ttk.Combobox(controls_frame, textvariable=self.results_status_filter,
+                                    values=RESULT_STATUS_FILTERS, width=22, state="readonly")
+        status_combo.pack(side=tk.LEFT, padx=5)
+        status_combo.bind("<<ComboboxSelected>>", lambda event: self.apply_results_view())
+        
+        ttk.Label(controls_frame, text="Min Score:").pack(side=tk.LEFT, padx=(15, 0))
+        self.results_min_score = tk.StringVar(value="0")
+        min_score_spinbox = ttk.Spinbox(controls_frame, from_=0, to=100, increment=10, width=5,
+                                        textvariable=self.results_min_score, command=self.apply_results_view)
+        min_score_spinbox.pack(side=tk.LEFT, padx=5)
+        min_score_spinbox.bind("<Return>", lambda event: self.apply_results_view())
+        
+        ttk.Label(controls_frame, text="Sort by:").pack(side=tk.LEFT, padx=(15, 0))
+        self.results_sort = tk.StringVar(value="Trade Order")
+        sort_combo = ttk.Combobox(controls_frame, textvariable=self.results_sort,
+                                  values=RESULT_SORT_ORDERS, width=22, state="readonly")
+        sort_combo.pack(side=tk.LEFT, padx=5)
+        sort_combo.bind("<<ComboboxSelected>>", lambda event: self.apply_results_view())
+        
+        # Results table - only the rows of the current page are inserted
+        table_frame = ttk.Frame(results_frame)
+        table_frame.pack(fill='both', expand=True, padx=5, pady=5)
+        
+        columns = ("trade", "trade_id", "score", "upi", "candidates", "status")
+        self.results_tree = ttk.Treeview(table_frame, columns=columns, show='headings', height=15, selectmode='browse')
+        for column, heading, width in [("trade", "Trade", 70), ("trade_id", "Trade ID", 150), ("score", "Score", 70),
+                                       ("upi", "Best UPI", 150), ("candidates", "Candidates", 90), ("status", "Status", 500)]:
+            self.results_tree.heading(column, text=heading)
+            self.results_tree.column(column, width=width, anchor='w')
+        
+        tree_scrollbar = ttk.Scrollbar(table_frame, orient="vertical", command=self.results_tree.yview)
+        self.results_tree.configure(yscrollcommand=tree_scrollbar.set)
+        self.results_tree.pack(side=tk.LEFT, fill='both', expand=True)
+        tree_scrollbar.pack(side=tk.RIGHT, fill='y')
+        self.results_tree.bind("<<TreeviewSelect>>", self.show_selected_result)
+        
+        # Paging controls
+        paging_frame = ttk.Frame(results_frame)
+        paging_frame.pack(fill='x', padx=5)
+        ttk.Button(paging_frame, text="< Previous", command=lambda: self.change_results_page(-1)).pack(side=tk.LEFT)
+        self.results_page_label = tk.StringVar(value="")
+        ttk.Label(paging_frame, textvariable=self.results_page_label).pack(side=tk.LEFT, padx=10)
+        ttk.Button(paging_frame, text="Next >", command=lambda: self.change_results_page(1)).pack(side=tk.LEFT)
+        
+        # Details of the selected trade, built on demand
+        ttk.Label(results_frame, text="Trade Details (select a row above):").pack(anchor='w', padx=5, pady=(10, 0))
+        self.results_text = scrolledtext.ScrolledText(results_frame, wrap=tk.WORD, width=100, height=15)
         self.results_text.pack(fill='both', expand=True, padx=5, pady=5)
         
         # Export button
         self.export_button = ttk.Button(self.tab4, text="Export Results to Excel", command=self.export_results)
-        
-        # Initially display message
-        self.results_text.insert(tk.END, "Results will be displayed here after mapping and searching.")
     
     def browse_upi_file(self):
         filename = filedialog.askopenfilename(
-            filetypes=[("RECORDS files", "*.RECORDS"), ("Text files", "*.txt"), ("All files", "*.*")]
+            filetypes=[("RECORDS files", "*.RECORDS"), ("Text files", "*.txt"),
+                       ("Compressed files", "*.gz *.bz2 *.xz *.zip"), ("All files", "*.*")]
         )
         if filename:
             self.upi_file_path.set(filename)
@@ -231,113 +430,416 @@ class UPISearchTool:
         if filename:
             self.trade_file_path.set(filename)
     
-    def parse_records_file(self, file_path):
-        """Parse RECORDS file format from DSB - JSON line format"""
+    def parse_records_file(self, file_path, progress=None, cancel_event=None, schema_dir=None):
+        """Parse RECORDS file format from DSB - JSON line format
+        
+        The path may also be a directory or glob pattern of RECORDS files; large
+        or multiple files are decoded across a process pool and deduplicated by UPI.
+        All asset classes are kept, so switching between FX and IR needs no re-parse.
+        With a schema_dir, records are also validated against the record templates there.
+        """
         try:
-            upi_records = []
+            upi_records, stats = ingest_records(file_path, progress=progress, cancel_event=cancel_event,
+                                                schema_dir=schema_dir)
             
-            with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            # Process each line as a JSON object
-            for line_num, line in enumerate(lines, 1):
-                line = line.strip()
-                
-                # Skip empty lines and comments
-                if not line or line.startswith('#'):
-                    continue
-                
-                try:
-                    # Parse each line as JSON
-                    record = json.loads(line)
-                    
-                    # Validate that it's a UPI record with required structure
-                    if not self.is_valid_upi_record(record):
-                        continue
-                    
-                    # Filter by asset class
-                    asset_class_filter = "Foreign_Exchange" if self.asset_class.get() == "FX" else "Rates"
-                    header = record.get("Header", {})
-                    
-                    if header.get("AssetClass") == asset_class_filter:
-                        upi_records.append(record)
-                        
-                except json.JSONDecodeError as e:
-                    print(f"Error parsing JSON on line {line_num}: {e}")
-                    continue
-                except Exception as e:
-                    print(f"Error processing line {line_num}: {e}")
-                    continue
+            if stats["rejected"] or stats["duplicates"]:
+                print(f"RECORDS ingest: {stats['rejected']} invalid lines skipped, "
+                      f"{stats['duplicates']} duplicate UPIs merged")
+                for line in stats["rejects"].format_lines():
+                    print(line)
             
             if not upi_records:
-                raise ValueError(f"No valid UPI records found for asset class: {self.asset_class.get()}")
+                raise ValueError("No valid UPI records found")
             
             return upi_records
             
+        except LoadCancelled:
+            raise
         except Exception as e:
             raise Exception(f"Error parsing RECORDS file: {str(e)}")
     
     def is_valid_upi_record(self, record):
         """Validate that the record has the expected UPI structure"""
-        try:
-            # Check for required top-level keys
-            required_keys = ["Header", "Identifier", "Derived", "Attributes"]
-            if not all(key in record for key in required_keys):
-                return False
-            
-            # Check Header structure
-            header = record.get("Header", {})
-            if not all(key in header for key in ["AssetClass", "InstrumentType", "UseCase", "Level"]):
-                return False
-            
-            # Check Identifier structure
-            identifier = record.get("Identifier", {})
-            if not identifier.get("UPI"):
-                return False
-            
-            return True
-            
-        except Exception:
-            return False
+        return is_valid_upi_record(record)
     
     def load_data(self):
+        """Load the UPI RECORDS file and the trade workbook on background threads
+        
+        Both files load concurrently. Workers hand progress and results back to
+        the Tk thread through a queue that is polled with after(), so the window
+        stays responsive and the load can be cancelled. The product tab unlocks
+        as soon as the UPI products are known, even while trades still load.
+        """
         try:
+            if self.load_pending or self.search_running:
+                return  # A load or search is already running
+            
             # Check if files are selected
             if not self.upi_file_path.get() or not self.trade_file_path.get():
                 messagebox.showerror("Error", "Please select both UPI RECORDS file and Trade Excel file")
                 return
             
-            # Show loading status
-            self.status_upload.set("Loading UPI data...")
-            self.root.update_idletasks()
-            
-            # Load UPI data from RECORDS file
-            self.upi_data = self.parse_records_file(self.upi_file_path.get())
-            
-            # Update status
-            self.status_upload.set("Loading trade data...")
-            self.root.update_idletasks()
-            
-            # Load trade data
-            self.trade_data = pd.read_excel(self.trade_file_path.get())
-            
-            # Extract available products based on asset class
-            self.extract_available_products()
-            
-            # Update status
-            upi_count = len(self.upi_data)
-            self.status_upload.set(f"Files loaded successfully. UPI records: {upi_count} | Trade records: {len(self.trade_data)}")
+            # Every load gets its own queue and cancel flag - events of a cancelled load are never read
+            self.load_events = queue.Queue()
+            self.load_cancel = threading.Event()
+            self.load_pending = {"trade"}
+            self.trade_data = None
+            self.available_products = []
             
-            # Setup product selection
-            self.setup_product_selection()
+            # The RECORDS file is parsed once for all asset classes; reloading the same file
+            # (e.g. after switching between FX and IR) reuses the loaded partitions.
+            upi_source = (self.upi_file_path.get(), self.use_disk_store.get(), self.validate_schemas.get())
+            if upi_source != self.loaded_upi_source:
+                self.loaded_upi_source = None
+                self.stop_upi_watcher()
+                self.load_pending.add("upi")
+                # Versions count up for the whole session, so results of earlier loads stay distinct
+                version = self.upi_dataset.version + 1 if self.upi_dataset is not None else 1
+                self.start_load_worker(self.load_upi_worker, upi_source, version)
+            self.start_load_worker(self.load_trade_worker, self.trade_file_path.get(), self.use_trade_cache.get())
+            
+            # Lock the later tabs and show progress until the files are in
+            self.set_tabs_state([1, 2, 3], 'disabled')
+            self.load_button.config(state='disabled')
+            self.load_progress_bar['value'] = 0
+            self.upi_load_progress.set("UPI data: loading..." if "upi" in self.load_pending else "UPI data: already loaded")
+            self.trade_load_progress.set("Trade data: reading workbook...")
+            self.load_progress_frame.pack(fill='x', pady=5, before=self.status_label_upload)
+            self.status_upload.set("Loading files...")
+            
+            if "upi" not in self.load_pending:
+                self.on_upi_loaded()
+            self.root.after(LOAD_POLL_INTERVAL, self.poll_load_events, self.load_events)
             
-            # Switch to product selection tab
-            notebook = self.tab2.master
-            notebook.select(1)  # Select the second tab (index 1)
+        except Exception as e:
+            self.finish_load(f"Error: {str(e)}")
+            messagebox.showerror("Error", f"Error loading files: {str(e)}")
+    
+    def start_load_worker(self, target, *args):
+        """Run a loader on a daemon thread that reports to the current load's queue"""
+        worker = threading.Thread(target=target, args=args + (self.load_events, self.load_cancel), daemon=True)
+        worker.start()
+        return worker
+    
+    def load_upi_worker(self, upi_source, version, events, cancel_event):
+        """Loader thread: parse the RECORDS file (or open the on-disk store) and build its indexes
+        
+        Runs off the Tk thread, so it only posts events - it never touches widgets.
+        """
+        try:
+            dataset = self.build_upi_dataset(upi_source, progress=lambda stats: events.put(("upi_progress", stats)),
+                                             cancel_event=cancel_event,
+                                             status=lambda text: events.put(("upi_status", text)),
+                                             version=version)
+            events.put(("upi_loaded", dataset))
+            
+        except LoadCancelled:
+            events.put(("cancelled", "upi"))
+        except Exception as e:
+            events.put(("error", e))
+    
+    def build_upi_dataset(self, upi_source, progress=None, cancel_event=None, status=None, version=1):
+        """Load a UPI source into a new UPIDataset (on a loader or watcher thread)
+        
+        Versions after the first are reloads: with the on-disk store they get a
+        store of their own in the temp directory, so the store of the version
+        still in use is never rewritten under it.
+        """
+        file_path, use_disk_store, validate_schemas = upi_source
+        schema_dir = DEFAULT_SCHEMA_DIR if validate_schemas else None
+        signature = source_signature(file_path)
+        db_path = None
+        
+        # Load UPI data from RECORDS file - either into memory or into the on-disk store
+        if use_disk_store:
+            upi_data = None
+            upi_partitions = None
+            if version > 1:
+                source_key = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:16]
+                db_path = os.path.join(tempfile.gettempdir(), f"upi_reload_{source_key}_v{version}.upi.sqlite")
+                if os.path.exists(db_path):
+                    os.remove(db_path)
+            try:
+                upi_store = self.open_upi_store(file_path, progress, cancel_event, status=status,
+                                                schema_dir=schema_dir, db_path=db_path)
+            except Exception:
+                if db_path is not None and os.path.exists(db_path):
+                    os.remove(db_path)
+                raise
+        else:
+            upi_store = None
+            upi_data = self.parse_records_file(file_path, progress, cancel_event, schema_dir)
+            upi_partitions = UPIPartitionIndex(upi_data)
+        
+        # Index the distinct reference-rate values for partial matching
+        reference_rate_index = self.create_reference_rate_index(upi_data, upi_store)
+        dataset = UPIDataset(upi_source, upi_data, upi_partitions, upi_store, reference_rate_index, signature)
+        dataset.version = version
+        dataset.temporary_store = db_path is not None
+        return dataset
+    
+    def load_trade_worker(self, file_path, use_cache, events, cancel_event):
+        """Loader thread: read the trade workbook (through its sidecar cache when current)"""
+        try:
+            trade_data = read_trade_workbook(file_path, use_cache)
+            events.put(("trade_loaded", trade_data))
+        except Exception as e:
+            events.put(("error", e))
+    
+    def poll_load_events(self, events):
+        """Apply the progress and results posted by the loader threads (runs on the Tk thread)"""
+        if events is not self.load_events:
+            return  # The load was cancelled or replaced
+        
+        try:
+            while events is self.load_events:
+                try:
+                    kind, payload = events.get_nowait()
+                except queue.Empty:
+                    break
+                
+                if kind == "upi_progress":
+                    self.show_upi_progress(payload)
+                elif kind == "upi_status":
+                    self.upi_load_progress.set(payload)
+                elif kind == "upi_loaded":
+                    self.apply_upi_dataset(payload)
+                    self.on_upi_loaded()
+                elif kind == "trade_loaded":
+                    self.on_trade_loaded(payload)
+                elif kind == "cancelled":
+                    self.finish_load("Loading cancelled.")
+                elif kind == "error":
+                    raise payload
             
         except Exception as e:
+            self.finish_load(f"Error: {str(e)}")
             messagebox.showerror("Error", f"Error loading files: {str(e)}")
-            self.status_upload.set(f"Error: {str(e)}")
+            return
+        
+        if events is self.load_events:
+            if self.load_pending:
+                self.root.after(LOAD_POLL_INTERVAL, self.poll_load_events, events)
+            else:
+                self.complete_load()
+    
+    def show_upi_progress(self, stats):
+        """Show bytes read and records parsed/rejected by the RECORDS loader"""
+        text = f"UPI data: {stats['bytes'] / 1024 ** 2:,.1f} MB"
+        if stats["total_bytes"]:
+            text += f" of {stats['total_bytes'] / 1024 ** 2:,.1f} MB"
+            self.load_progress_bar['value'] = min(100, stats["bytes"] * 100 / stats["total_bytes"])
+        text += f" read, {stats['parsed']:,} records parsed, {stats['rejected']:,} rejected"
+        self.upi_load_progress.set(text)
+    
+    def apply_upi_dataset(self, dataset):
+        """Install a loaded (or reloaded) UPI dataset - always on the Tk thread, between trades
+        
+        The previous dataset is closed unless current results still refer to it.
+        """
+        previous = self.upi_dataset
+        if previous is not None and previous is not dataset and previous not in self.result_datasets.values():
+            previous.close()
+        self.upi_dataset = dataset
+        self.upi_data = dataset.upi_data
+        self.upi_partitions = dataset.upi_partitions
+        self.upi_store = dataset.upi_store
+        self.reference_rate_index = dataset.reference_rate_index
+        self.partition_value_sets = {}
+        self.exact_match_indexes = {}
+        self.loaded_upi_source = dataset.source
+    
+    def poll_upi_reload(self):
+        """Follow the reload option and swap in reloaded UPI data while no search is running
+        
+        A search swaps between its trades instead (see install_reloaded_upi_data).
+        """
+        try:
+            self.update_upi_watcher()
+            if not self.load_pending and not self.search_running and self.install_reloaded_upi_data() \
+                    and self.available_products:
+                self.extract_available_products()
+                self.setup_product_selection()
+        except Exception as e:
+            self.status_upload.set(f"Error reloading UPI data: {str(e)}")
+        self.root.after(RELOAD_POLL_INTERVAL, self.poll_upi_reload)
+    
+    def update_upi_watcher(self):
+        """Watch the loaded RECORDS source while the reload option is ticked"""
+        dataset = self.upi_dataset
+        if not self.watch_upi_source.get() or dataset is None:
+            self.stop_upi_watcher()
+            return
+        if self.upi_watcher is not None:
+            return
+        
+        build = lambda version, cancel_event: self.build_upi_dataset(dataset.source, cancel_event=cancel_event,
+                                                                     version=version)
+        self.upi_watcher = UPISourceWatcher(dataset.source[0], dataset.signature, build,
+                                            first_version=dataset.version + 1)
+        self.upi_watcher.start()
+    
+    def stop_upi_watcher(self):
+        if self.upi_watcher is not None:
+            self.upi_watcher.stop()
+            self.upi_watcher = None
+    
+    def install_reloaded_upi_data(self):
+        """Swap in UPI data rebuilt after a change to the watched file; True when swapped
+        
+        Runs on the Tk thread between trades: the trade being matched finishes
+        on the old version and the next one uses the new version.
+        """
+        if self.upi_watcher is None:
+            return False
+        dataset = self.upi_watcher.take_reload()
+        if dataset is None:
+            return False
+        
+        self.apply_upi_dataset(dataset)
+        self.status_upload.set(f"UPI data reloaded after the RECORDS file changed: version {dataset.label()}, "
+                               f"{self.count_upi_records():,} {self.asset_class.get()} records")
+        return True
+    
+    def release_result_datasets(self):
+        """Close the UPI datasets kept only for the results being cleared"""
+        for dataset in self.result_datasets.values():
+            if dataset is not self.upi_dataset:
+                dataset.close()
+        self.result_datasets = {}
+        self.result_versions = []
+    
+    def on_upi_loaded(self):
+        """UPI data is in: list the products and unlock the product tab"""
+        self.load_pending.discard("upi")
+        
+        asset_class_filter = "Foreign_Exchange" if self.asset_class.get() == "FX" else "Rates"
+        if not self.get_upi_source().has_records(asset_class_filter):
+            raise ValueError(f"No valid UPI records found for asset class: {self.asset_class.get()}")
+        
+        self.load_progress_bar['value'] = 100
+        self.upi_load_progress.set(f"UPI data: {self.count_upi_records():,} {self.asset_class.get()} records loaded")
+        
+        # Extract available products based on asset class
+        self.extract_available_products()
+        self.setup_product_selection()
+        self.set_tabs_state([1], 'normal')
+    
+    def on_trade_loaded(self, trade_data):
+        """Trade data is in: offer its columns for auto-routing"""
+        self.load_pending.discard("trade")
+        self.trade_data = trade_data
+        self.trade_load_progress.set(f"Trade data: {len(trade_data):,} records loaded")
+        
+        if self.available_products:
+            self.setup_route_columns()
+    
+    def complete_load(self):
+        """Both files are loaded"""
+        upi_count = self.count_upi_records()
+        self.finish_load(f"Files loaded successfully. UPI records: {upi_count} | Trade records: {len(self.trade_data)}")
+        
+        # Switch to product selection tab
+        notebook = self.tab2.master
+        notebook.select(1)  # Select the second tab (index 1)
+    
+    def cancel_load(self):
+        """Stop the running load; loader threads finish on their own and their results are dropped"""
+        if self.load_cancel is not None:
+            self.load_cancel.set()
+        self.finish_load("Loading cancelled.")
+    
+    def finish_load(self, status):
+        """End the current load (finished, failed or cancelled) and restore the upload tab"""
+        if self.load_cancel is not None and self.load_pending:
+            self.load_cancel.set()
+        self.load_events = None
+        self.load_pending = set()
+        
+        self.load_progress_frame.pack_forget()
+        self.load_button.config(state='normal')
+        self.set_tabs_state([1, 2, 3], 'normal')
+        self.status_upload.set(status)
+    
+    def set_tabs_state(self, tab_indexes, state):
+        """Enable or disable notebook tabs by index"""
+        notebook = self.tab1.master
+        for tab_index in tab_indexes:
+            notebook.tab(tab_index, state=state)
+    
+    def open_upi_store(self, file_path, progress=None, cancel_event=None, status=None, schema_dir=None, db_path=None):
+        """Open the on-disk UPI store for a RECORDS file, ingesting it if the store is stale
+        
+        db_path overrides where the store is kept (used for reloads).
+        """
+        store = None
+        try:
+            if db_path is None and os.path.isfile(file_path):
+                db_path = os.path.splitext(file_path)[0] + ".upi.sqlite"
+            elif db_path is None:
+                # Folders and wildcard patterns get a store in the temp directory
+                source_key = hashlib.sha1(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:16]
+                db_path = os.path.join(tempfile.gettempdir(), f"upi_store_{source_key}.upi.sqlite")
+            store = UPIRecordStore(db_path)
+            
+            if not store.is_current(file_path, schema_dir):
+                if status is not None:
+                    status("Building on-disk UPI store (first load of this file)...")
+                stored, _ = store.ingest_records_file(file_path, validator=self.is_valid_upi_record,
+                                                      progress=progress, cancel_event=cancel_event, schema_dir=schema_dir)
+                for line in store.rejects.format_lines():
+                    print(line)
+                if not stored:
+                    store.close()
+                    raise ValueError("No valid UPI records found")
+            
+            return store
+            
+        except LoadCancelled:
+            if store is not None:
+                store.close()
+            raise
+        except Exception as e:
+            raise Exception(f"Error opening UPI store: {str(e)}")
+    
+    def build_reference_rate_index(self):
+        """Build the n-gram index over distinct UPI reference-rate attribute values"""
+        self.reference_rate_index = self.create_reference_rate_index(self.upi_data, self.upi_store)
+    
+    def create_reference_rate_index(self, upi_data, upi_store):
+        """N-gram index over the distinct reference-rate values of an in-memory dataset or store"""
+        rate_fields = [
+            "ReferenceRate", "ReferenceRateTermValue", "ReferenceRateTermUnit",
+            "OtherLegReferenceRate", "OtherLegReferenceRateTermValue", "OtherLegReferenceRateTermUnit",
+        ]
+        
+        if upi_store is not None:
+            values = upi_store.distinct_values(rate_fields)
+        else:
+            values = set()
+            for upi in upi_data:
+                attributes = upi.get("Attributes", {})
+                for field_name in rate_fields:
+                    value = attributes.get(field_name)
+                    if value is not None:
+                        values.add(str(value).strip().upper())
+        
+        return ReferenceRateIndex(values)
+    
+    def get_upi_source(self):
+        """Return the loaded UPI records source - the on-disk store or the in-memory partitions
+        
+        Both offer count, has_records, iter_records and get_use_cases lookups
+        by (AssetClass, UseCase, InstrumentType).
+        """
+        if self.upi_store is not None:
+            return self.upi_store
+        return self.upi_partitions
+    
+    def count_upi_records(self):
+        """Count the loaded UPI records for the selected asset class"""
+        asset_class_filter = "Foreign_Exchange" if self.asset_class.get() == "FX" else "Rates"
+        return self.get_upi_source().count(asset_class_filter)
     
     def extract_available_products(self):
         """Extract available product types from the loaded UPI data based on asset class"""
@@ -346,16 +848,7 @@ class UPISearchTool:
         try:
             # Extract products based on asset class
             asset_class_filter = "Foreign_Exchange" if self.asset_class.get() == "FX" else "Rates"
-            
-            products = set()
-            for upi in self.upi_data:
-                header = upi.get("Header", {})
-                if header.get("AssetClass") == asset_class_filter:
-                    use_case = header.get("UseCase")
-                    if use_case:
-                        products.add(use_case)
-            
-            self.available_products = sorted(list(products))
+            self.available_products = self.get_upi_source().get_use_cases(asset_class_filter)
             
         except Exception as e:
             messagebox.showerror("Error", f"Error extracting products: {str(e)}")
@@ -369,6 +862,10 @@ class UPISearchTool:
             self.product_dropdown.pack(pady=5)
             self.continue_button.pack(pady=20)
             
+            # Trade columns are offered for routing once the trade file is loaded
+            if self.trade_data is not None:
+                self.setup_route_columns()
+            
             # Auto-select first product if only one available
             if len(self.available_products) == 1:
                 self.product_type.set(self.available_products[0])
@@ -377,9 +874,33 @@ class UPISearchTool:
         else:
             self.status_product.set("No products found for the selected asset class")
     
+    def setup_route_columns(self):
+        """Routing column choices for mixed trade files"""
+        columns = list(self.trade_data.columns) + ["N/A"]
+        self.route_product_dropdown['values'] = columns
+        self.route_asset_class_dropdown['values'] = columns
+        self.route_product_column.set(next((col for col in columns if "product" in str(col).lower()), "N/A"))
+        self.route_asset_class_column.set(next((col for col in columns if "asset" in str(col).lower()), "N/A"))
+        self.route_frame.pack(fill='x', padx=10, pady=10, before=self.continue_button)
+    
     def proceed_to_mapping(self):
         """Proceed to column mapping after product selection"""
-        if not self.product_type.get():
+        if self.trade_data is None:
+            messagebox.showinfo("Loading", "The trade file is still loading - please wait until it has finished")
+            return
+        
+        if self.auto_route.get():
+            if self.route_product_column.get() in ("", "N/A"):
+                messagebox.showerror("Error", "Please select the product column for auto-routing")
+                return
+            
+            # Route every trade once; the mapping covers the fields of all routed products
+            self.route_cache = {}
+            self.trade_routes = [self.route_trade(trade) for _, trade in self.trade_data.iterrows()]
+            if not any(product for _, product in self.trade_routes):
+                messagebox.showerror("Error", "No trade could be routed to a product found in the UPI data")
+                return
+        elif not self.product_type.get():
             messagebox.showerror("Error", "Please select a product type")
             return
         
@@ -415,7 +936,7 @@ class UPISearchTool:
         # Create header
         ttk.Label(scrollable_frame, text=f"Map your Excel columns to UPI search attributes", 
                  font=("Arial", 12, "bold")).grid(row=0, column=0, columnspan=5, pady=10)
-        ttk.Label(scrollable_frame, text=f"Asset Class: {self.asset_class.get()} | Product: {self.product_type.get()}", 
+        ttk.Label(scrollable_frame, text=self.describe_products(), 
                  font=("Arial", 10)).grid(row=1, column=0, columnspan=5, pady=5)
         
         # Column headers
@@ -518,8 +1039,17 @@ class UPISearchTool:
         canvas.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
         
+        # Existing UPI column choices - validation is opt-in, so nothing is preselected
+        columns = list(self.trade_data.columns) + ["N/A"]
+        self.validate_upi_dropdown['values'] = columns
+        if self.validate_upi_column.get() not in columns:
+            self.validate_upi_column.set("N/A")
+        
         # Show map button
         self.map_button.pack(pady=10)
+        self.alternatives_check.pack(pady=2)
+        self.validate_upi_frame.pack(pady=2)
+        self.time_limit_frame.pack(pady=2)
     
     def update_input_method(self, field_name):
         """Update the input widget based on selected method"""
@@ -544,14 +1074,88 @@ class UPISearchTool:
     
     def get_mapping_fields(self):
         """Get mapping fields based on asset class and product type"""
-        asset_class = self.asset_class.get()
-        product = self.product_type.get()
+        if self.auto_route.get():
+            return self.get_routed_mapping_fields()
         
+        return self.get_product_mapping_fields(self.asset_class.get(), self.product_type.get())
+    
+    def get_product_mapping_fields(self, asset_class, product):
+        """Get mapping fields for one asset class and product"""
         if asset_class == "FX":
             return self.get_fx_mapping_fields(product)
         else:  # IR
             return self.get_ir_mapping_fields(product)
     
+    def get_routed_products(self):
+        """Distinct (asset class, product) routes of the trades, in order of first appearance"""
+        return list(dict.fromkeys(route for route in self.trade_routes if route[1]))
+    
+    def get_routed_mapping_fields(self):
+        """Union of the mapping fields of every routed product (required if any product requires it)"""
+        fields = {}
+        for asset_class, product in self.get_routed_products():
+            for label, field_name, required in self.get_product_mapping_fields(asset_class, product):
+                if field_name in fields:
+                    fields[field_name] = (fields[field_name][0], field_name, fields[field_name][2] or required)
+                else:
+                    fields[field_name] = (label, field_name, required)
+        return list(fields.values())
+    
+    def get_route_mapping(self, route, mapping):
+        """Restrict the full mapping to the fields of one routed product"""
+        field_names = self.route_mapping_fields.get(route)
+        if field_names is None:
+            field_names = [field_name for _, field_name, _ in self.get_product_mapping_fields(*route)]
+            self.route_mapping_fields[route] = field_names
+        return {field_name: mapping[field_name] for field_name in field_names if field_name in mapping}
+    
+    def describe_products(self):
+        """Asset class and product text for headers"""
+        if self.auto_route.get():
+            routes = ", ".join(f"{asset_class} {product}" for asset_class, product in self.get_routed_products())
+            return f"Auto-routed: {routes}"
+        return f"Asset Class: {self.asset_class.get()} | Product: {self.product_type.get()}"
+    
+    def normalize_route_value(self, value):
+        """Upper-case a routing value and drop spaces, underscores and hyphens"""
+        return re.sub(r"[\s_\-]", "", str(value)).upper()
+    
+    def route_trade(self, trade):
+        """Find the (asset class, product) a trade belongs to from its routing columns
+        
+        The product is None when the trade's product is not found in the UPI data.
+        """
+        asset_class = self.asset_class.get()
+        asset_column = self.route_asset_class_column.get()
+        if asset_column not in ("", "N/A") and asset_column in trade and pd.notna(trade[asset_column]):
+            asset_value = self.normalize_route_value(trade[asset_column])
+            if asset_value in ("FX", "FOREIGNEXCHANGE"):
+                asset_class = "FX"
+            elif asset_value in ("IR", "RATES", "INTERESTRATE", "INTERESTRATES"):
+                asset_class = "IR"
+            else:
+                return (asset_class, None)
+        
+        product_column = self.route_product_column.get()
+        if product_column not in trade or pd.isna(trade[product_column]):
+            return (asset_class, None)
+        product_value = self.normalize_route_value(trade[product_column])
+        
+        cache_key = (asset_class, product_value)
+        if cache_key not in self.route_cache:
+            asset_class_filter = "Foreign_Exchange" if asset_class == "FX" else "Rates"
+            products = self.get_upi_source().get_use_cases(asset_class_filter)
+            normalized = {self.normalize_route_value(product): product for product in products}
+            
+            # Exact product name first, then the longest product name contained in the value
+            product = normalized.get(product_value)
+            if product is None:
+                contained = [name for name in normalized if name and name in product_value]
+                product = normalized[max(contained, key=len)] if contained else None
+            self.route_cache[cache_key] = (asset_class, product)
+        
+        return self.route_cache[cache_key]
+    
     def get_fx_mapping_fields(self, product):
         """Get FX mapping fields based on product type"""
         # Common FX fields - ADDED InstrumentType for CNH handling
@@ -607,13 +1211,7 @@ class UPISearchTool:
     
     def has_option_non_standard_upis(self):
         """Check if we have Option Non_Standard UPIs available"""
-        for upi in self.upi_data:
-            header = upi.get("Header", {})
-            if (header.get("AssetClass") == "Foreign_Exchange" and 
-                header.get("InstrumentType") == "Option" and 
-                header.get("UseCase") == "Non_Standard"):
-                return True
-        return False
+        return self.get_upi_source().has_records("Foreign_Exchange", "Non_Standard", "Option")
     
     def get_ir_mapping_fields(self, product):
         """Get IR mapping fields based on product type"""
@@ -700,10 +1298,33 @@ class UPISearchTool:
         return None
     
     def search_upis(self):
+        """Start a search of every trade; results stream into the results tab as slices of trades finish"""
+        if self.search_running:
+            return
+        
         try:
             # Clear previous results
-            self.results = []
-            self.results_text.delete(1.0, tk.END)
+            self.results = CompactResults(top_k=5, materializer=self.materialize_result)
+            self.negative_lookup_count = 0
+            self.exact_match_count = 0
+            self.confirmed_upi_count = 0
+            self.rejected_upi_count = 0
+            self.deadline_hit_count = 0
+            self.trade_time_limit_ms = self.parse_time_limit(self.trade_time_limit.get())
+            existing_upi_column = self.validate_upi_column.get()
+            self.existing_upi_column = existing_upi_column if existing_upi_column in self.trade_data.columns else None
+            self.latency = LatencyRecorder(DEFAULT_SLOW_TRADE_MS)
+            self.unrouted_count = 0
+            self.result_routes = []
+            self.release_result_datasets()
+            self.clear_results_view()
+            
+            # Route every trade to its product (or use the selected product for all)
+            default_route = (self.asset_class.get(), self.product_type.get())
+            if self.auto_route.get():
+                self.route_cache = {}
+                self.route_mapping_fields = {}
+                self.trade_routes = [self.route_trade(trade) for _, trade in self.trade_data.iterrows()]
             
             # Show progress bar
             self.progress_frame.pack(pady=10)
@@ -722,53 +1343,192 @@ class UPISearchTool:
                 }
             
             # Initialize progress
-            total_trades = len(self.trade_data)
-            self.progress_bar['maximum'] = total_trades
+            self.progress_bar['maximum'] = len(self.trade_data)
             self.progress_bar['value'] = 0
             
-            # Process each trade with progress updates
-            for index, trade in self.trade_data.iterrows():
-                # Update progress
-                current_trade = index + 1
-                self.progress_bar['value'] = current_trade
-                self.progress_label.config(text=f"Processing trade {current_trade} of {total_trades}...")
-                self.status_mapping.set(f"Searching UPIs... {current_trade}/{total_trades}")
-                
-                # Force GUI update to show progress
-                self.root.update_idletasks()
-                
-                # Find matching UPI for this trade
-                result = self.find_matching_upi(trade, mapping)
-                self.results.append(result)
-                
-                # Small delay to make progress visible (remove for production)
-                time.sleep(0.01)
-            
-            # Hide progress bar
-            self.progress_frame.pack_forget()
+            # Switch to results tab so results show up as they are produced
+            notebook = self.tab4.master
+            notebook.select(3)  # Select the fourth tab (index 3)
             
-            # Display results
-            self.display_results()
+            # Trades are searched in time slices between Tk events, so the results table
+            # can be scrolled, filtered and sorted while the search runs; the settings tabs
+            # are locked until it ends
+            self.search_running = True
+            self.set_tabs_state([0, 1, 2], 'disabled')
+            self.search_mapping = mapping
+            self.search_default_route = default_route
+            self.search_trades = enumerate(self.trade_data.iterrows())
+            self.run_search_slice()
             
-            # Show export button
-            self.export_button.pack(pady=10)
+        except Exception as e:
+            self.fail_search(e)
+    
+    def run_search_slice(self):
+        """Search trades for up to SEARCH_SLICE_MS, then hand the Tk thread back to the event loop"""
+        if not self.search_running:
+            return
+        
+        try:
+            total_trades = len(self.trade_data)
+            slice_end = time.perf_counter() + SEARCH_SLICE_MS / 1000
+            position = None
+            for position, (index, trade) in self.search_trades:
+                self.search_trade(position, trade)
+                if time.perf_counter() >= slice_end:
+                    break
+            else:
+                self.finish_search()
+                return
             
-            # Update status
-            matched_count = sum(1 for r in self.results if r["MatchedUPI"] is not None)
-            self.status_mapping.set(f"UPI search completed. {matched_count}/{len(self.results)} trades matched.")
-            
-            # Switch to results tab
-            notebook = self.tab4.master
-            notebook.select(3)  # Select the fourth tab (index 3)
+            # Update progress once per slice
+            current_trade = position + 1
+            self.progress_bar['value'] = current_trade
+            self.progress_label.config(text=f"Processing trade {current_trade} of {total_trades}...")
+            self.status_mapping.set(f"Searching UPIs... {current_trade}/{total_trades}")
+            self.results_summary.set(f"Searching UPIs... {current_trade}/{total_trades}")
+            self.root.after(1, self.run_search_slice)
             
         except Exception as e:
-            # Hide progress bar on error
-            self.progress_frame.pack_forget()
-            messagebox.showerror("Error", f"Error searching UPIs: {str(e)}\n{traceback.format_exc()}")
-            self.status_mapping.set(f"Error: {str(e)}")
+            self.fail_search(e)
+    
+    def search_trade(self, position, trade):
+        """Match one trade and store its result (on the Tk thread, between events)"""
+        # UPI data reloaded in the background is swapped in before the next trade
+        self.install_reloaded_upi_data()
+        
+        # Find matching UPI for this trade
+        if self.auto_route.get():
+            route = self.trade_routes[position]
+            if route[1] is None:
+                self.unrouted_count += 1
+                result = {"TradeDetails": trade.to_dict(), "MatchedUPI": None, "Score": 0, "AllMatches": [],
+                          "Message": f"Trade could not be routed: product not found in UPI data for {route[0]}"}
+            else:
+                result = self.find_matching_upi(trade, self.get_route_mapping(route, self.search_mapping), *route)
+        else:
+            route = self.search_default_route
+            result = self.find_matching_upi(trade, self.search_mapping)
+        self.store_result(position, result)
+        self.result_routes.append(route)
+        self.record_result_dataset()
+        self.stream_result(len(self.results) - 1)
+    
+    def finish_search(self):
+        """All trades are searched: show the summary and offer the export"""
+        self.search_running = False
+        self.set_tabs_state([0, 1, 2], 'normal')
+        
+        # Hide progress bar
+        self.progress_frame.pack_forget()
+        
+        # Display results
+        self.display_results()
+        
+        # Show export button
+        self.export_button.pack(pady=10)
+        
+        # Update status
+        matched_count = self.results.matched_count()
+        latency, _ = self.latency.overall()
+        self.status_mapping.set(
+            f"UPI search completed. {matched_count}/{len(self.results)} trades matched. "
+            f"{self.negative_lookup_count} trades had no possible UPI and skipped scoring."
+            + (f" {self.exact_match_count} exact matches resolved without scoring." if not self.score_alternatives.get() else "")
+            + (f" {self.confirmed_upi_count} existing UPIs confirmed, {self.rejected_upi_count} failed the check and were searched."
+               if self.existing_upi_column else "")
+            + (f" {self.unrouted_count} trades could not be routed to a product." if self.auto_route.get() else "")
+            + (f" {self.deadline_hit_count} trades reached the {self.trade_time_limit_ms:g} ms time limit (partial results)."
+               if self.trade_time_limit_ms else "")
+            + f" Latency p50 {latency.percentile(50):.1f} ms, p99 {latency.percentile(99):.1f} ms;"
+            f" {self.latency.slow_count} slow trades (≥ {DEFAULT_SLOW_TRADE_MS:g} ms)."
+        )
+    
+    def fail_search(self, error):
+        """Stop the search after an error"""
+        self.search_running = False
+        self.set_tabs_state([0, 1, 2], 'normal')
+        # Hide progress bar on error
+        self.progress_frame.pack_forget()
+        messagebox.showerror("Error", f"Error searching UPIs: {str(error)}\n{traceback.format_exc()}")
+        self.status_mapping.set(f"Error: {str(error)}")
+    
+    def parse_time_limit(self, text):
+        """Per-trade time limit in ms from the entry field; None when blank"""
+        text = text.strip()
+        if not text:
+            return None
+        try:
+            limit = float(text)
+        except ValueError:
+            limit = 0
+        if not limit > 0:
+            raise ValueError(f"Time limit per trade must be a positive number of milliseconds, not '{text}'")
+        return limit
+    
+    def store_result(self, trade_row, result):
+        """Keep a find_matching_upi result as compact columns (UPI codes, scores, message)"""
+        matched_upi = result["MatchedUPI"]
+        all_matches = result.get("AllMatches", [])
+        
+        self.results.append(
+            trade_row,
+            matched_upi.get("Identifier", {}).get("UPI") if matched_upi else None,
+            result["Score"],
+            result["Message"],
+            [(match["upi"].get("Identifier", {}).get("UPI"), match["score"]) for match in all_matches[:self.results.top_k]],
+            candidate_count=len(all_matches),
+            partial=result.get("Partial", False)
+        )
+    
+    def record_result_dataset(self):
+        """Remember which UPI data version the latest result was matched against"""
+        dataset = self.upi_dataset
+        if dataset is None:
+            return
+        self.result_versions.append(dataset.version)
+        self.result_datasets[dataset.version] = dataset
+    
+    def materialize_result(self, results, index):
+        """Join a compact result back to its trade row and UPI records for display or export
+        
+        UPI records are read from the UPI data version the trade was matched against.
+        """
+        dataset = self.result_datasets[self.result_versions[index]] if index < len(self.result_versions) else None
+        upi_source = dataset.get_upi_source() if dataset is not None else self.get_upi_source()
+        best_upi = results.best_upi(index)
+        
+        return {
+            "TradeDetails": self.trade_data.iloc[results.trade_row(index)].to_dict(),
+            "MatchedUPI": upi_source.get_record(best_upi) if best_upi is not None else None,
+            "Score": results.score(index),
+            "Message": results.message(index),
+            "AllMatches": [
+                {"upi": upi_source.get_record(upi_code), "score": score}
+                for upi_code, score in results.candidates(index)
+            ],
+            "CandidateCount": results.candidate_count(index),
+            "Partial": results.partial(index),
+            "AssetClass": self.result_routes[index][0],
+            "ProductType": self.result_routes[index][1] or "",
+            "UPIVersion": dataset.label() if dataset is not None else "",
+        }
     
-    def find_matching_upi(self, trade, mapping):
-        result = {"TradeDetails": trade.to_dict(), "MatchedUPI": None, "Score": 0, "Message": "", "AllMatches": []}
+    def find_matching_upi(self, trade, mapping, asset_class=None, product=None):
+        """Score a trade against its candidate UPIs
+        
+        asset_class ("FX"/"IR") and product default to the selections in the UI;
+        auto-routing passes each trade's own. With trade_time_limit_ms set, the
+        candidates holding the trade's highest-weighted values are scored first,
+        and scoring stops once the limit is reached: the best matches found so
+        far are returned with "Partial" set and the message says so.
+        """
+        result = {"TradeDetails": trade.to_dict(), "MatchedUPI": None, "Score": 0, "Message": "", "AllMatches": [], "Partial": False}
+        started = time.perf_counter()
+        trade_values = {}
+        search_path = "regular"
+        candidate_count = 0
+        existing_upi_note = ""
+        partial = False
         
         try:
             # Get trade values for CNH detection
@@ -778,25 +1538,81 @@ class UPISearchTool:
             is_cnh_trade = self.is_cnh_trade(trade_values)
             
             # Filter UPIs by asset class and apply CNH special handling
-            asset_class_filter = "Foreign_Exchange" if self.asset_class.get() == "FX" else "Rates"
-            relevant_upis = self.filter_upis_with_cnh_handling(asset_class_filter, trade_values, is_cnh_trade)
-            
-            if not relevant_upis:
-                result["Message"] = f"No UPI records found for {asset_class_filter} with the specified criteria"
+            asset_class = asset_class or self.asset_class.get()
+            asset_class_filter = "Foreign_Exchange" if asset_class == "FX" else "Rates"
+            partition = self.get_candidate_partition(asset_class_filter, trade_values, is_cnh_trade, product)
+            if is_cnh_trade and asset_class_filter == "Foreign_Exchange":
+                search_path = "cnh" if partition[1] == "Non_Standard" else "cnh_fallback"
+            
+            # Validation mode: a UPI the trade already carries is confirmed by a direct lookup,
+            # and the trade is only searched when the check fails
+            existing_upi = self.get_existing_upi(trade)
+            if existing_upi is not None:
+                record, score, problem = self.check_existing_upi(trade, mapping, existing_upi, partition)
+                if problem is None:
+                    self.confirmed_upi_count += 1
+                    search_path = "validated"
+                    candidate_count = 1
+                    result["MatchedUPI"] = record
+                    result["Score"] = score
+                    result["AllMatches"] = [{"upi": record, "score": score}]
+                    result["Message"] = f"Existing UPI confirmed: match score {score}% on mapped fields"
+                    return result
+                self.rejected_upi_count += 1
+                existing_upi_note = f"Existing UPI {existing_upi} {problem}; searched instead."
+            
+            # Fast negative lookup: no mapped value can score against any record of the partition
+            if not self.can_match_partition(trade, mapping, partition):
+                self.negative_lookup_count += 1
+                result["Message"] = "No UPI matches found based on provided trade attributes"
                 return result
             
-            # Perform matching and collect all scores
-            all_matches = []
-            for upi in relevant_upis:
-                score = self.calculate_upi_score(trade, mapping, upi)
+            # Exact-match fast path: a trade equal to one UPI on every scored field resolves
+            # without scoring the partition, unless alternative candidates are wanted
+            if not self.score_alternatives.get():
+                exact_match = self.find_exact_match(trade, mapping, partition)
+                if exact_match is not None:
+                    self.exact_match_count += 1
+                    candidate_count = 1
+                    cnh_note = " (CNH special handling applied)" if is_cnh_trade else ""
+                    result["MatchedUPI"] = exact_match
+                    result["Score"] = 100
+                    result["AllMatches"] = [{"upi": exact_match, "score": 100}]
+                    result["Message"] = f"UPI found with exact match on all mapped fields: 100%{cnh_note}"
+                    return result
+            
+            scored_values = self.get_scored_trade_values(trade, mapping)
+            deadline = None
+            if self.trade_time_limit_ms:
+                # Likely best candidates first, so a result cut short by the time limit is still useful
+                deadline = started + self.trade_time_limit_ms / 1000
+                lookups = sorted(scored_values, key=lambda item: -self.get_field_weight(item[0]))
+                relevant_upis = self.get_upi_source().iter_ranked_records(*partition, lookups)
+            else:
+                relevant_upis = enumerate(self.get_upi_source().iter_records(*partition))
+            
+            reference_matches = self.get_reference_rate_matches(trade, mapping)
+            
+            # Perform matching and collect all scores with each record's place in the original order
+            # (candidates may be streamed from the on-disk store, so count while scoring)
+            scored = []
+            for order, upi in relevant_upis:
+                if deadline is not None and candidate_count and time.perf_counter() >= deadline:
+                    partial = True
+                    break
+                candidate_count += 1
+                score = self.calculate_upi_score(trade, mapping, upi, reference_matches, scored_values)
                 if score > 0:  # Only include UPIs with some match
-                    all_matches.append({
-                        "upi": upi,
-                        "score": score
-                    })
+                    scored.append((order, score, upi))
+            
+            if candidate_count == 0:
+                result["Message"] = f"No UPI records found for {asset_class_filter} with the specified criteria"
+                return result
             
-            # Sort by score (highest first)
-            all_matches.sort(key=lambda x: x["score"], reverse=True)
+            # Sort by score (highest first); equal scores keep the original record order,
+            # so ranked scoring breaks ties the same way as a full pass
+            scored.sort(key=lambda item: (-item[1], item[0]))
+            all_matches = [{"upi": upi, "score": score} for _, score, upi in scored]
             result["AllMatches"] = all_matches
             
             # Set result based on best match
@@ -824,8 +1640,60 @@ class UPISearchTool:
         except Exception as e:
             result["Message"] = f"Error during UPI search: {str(e)}"
         
+        finally:
+            if partial:
+                self.deadline_hit_count += 1
+                result["Partial"] = True
+                result["Message"] = (f"Partial result: time limit of {self.trade_time_limit_ms:g} ms reached after "
+                                     f"scoring {candidate_count} candidates. {result['Message']}")
+            if existing_upi_note:
+                result["Message"] = f"{existing_upi_note} {result['Message']}"
+            
+            # Latency and candidates by product and search path, slow trades with their values
+            self.latency.record(time.perf_counter() - started, candidate_count, product or self.product_type.get(),
+                                search_path, trade=trade.name, signature=trade_values, partial=partial)
+        
         return result
     
+    def get_existing_upi(self, trade):
+        """The UPI a trade already carries in the selected existing-UPI column, or None"""
+        if self.existing_upi_column is None:
+            return None
+        value = trade.get(self.existing_upi_column)
+        if pd.isna(value) or not str(value).strip():
+            return None
+        return str(value).strip()
+    
+    def check_existing_upi(self, trade, mapping, upi_code, partition):
+        """Check a trade's own UPI: it must exist, be active, be of the trade's product and agree with it
+        
+        The record is found with one Identifier.UPI lookup (a dict in memory, the
+        primary key on disk). Agreement uses the calculate_field_score rules: every
+        mapped field the UPI carries must score above zero.
+        Returns (record, score, problem) - problem is None when the UPI is confirmed.
+        """
+        record = self.get_upi_source().get_record(upi_code)
+        if record is None:
+            return None, 0, "not found in the UPI data"
+        
+        status = record.get("Identifier", {}).get("Status")
+        if status not in ACTIVE_UPI_STATUSES:
+            return record, 0, f"is not active (status {status})"
+        
+        header = record.get("Header", {})
+        asset_class_filter, use_case, instrument_type = partition
+        if header.get("AssetClass") != asset_class_filter or (use_case and header.get("UseCase") != use_case) \
+                or (instrument_type and header.get("InstrumentType") != instrument_type):
+            return record, 0, f"is a {header.get('UseCase')} {header.get('InstrumentType')}, not a {use_case or asset_class_filter}"
+        
+        attributes = record.get("Attributes", {})
+        for field_name, trade_str in self.get_scored_trade_values(trade, mapping):
+            upi_value = attributes.get(field_name)
+            if upi_value is not None and not self.calculate_field_score(field_name, trade_str, upi_value):
+                return record, 0, f"disagrees on {field_name} ({trade_str} vs {str(upi_value).strip().upper()})"
+        
+        return record, self.calculate_upi_score(trade, mapping, record), None
+    
     def extract_trade_values(self, trade, mapping):
         """Extract trade values based on mapping"""
         trade_values = {}
@@ -857,84 +1725,177 @@ class UPISearchTool:
         return notional_ccy in cnh_currencies or other_notional_ccy in cnh_currencies
     
     def filter_upis_with_cnh_handling(self, asset_class_filter, trade_values, is_cnh_trade):
-        """Filter UPIs with CNH special handling logic"""
-        relevant_upis = []
+        """Filter UPIs with CNH special handling logic
+        
+        Candidates come from (AssetClass, UseCase, InstrumentType) partition
+        lookups - in memory or as indexed queries against the on-disk store.
+        """
+        partition = self.get_candidate_partition(asset_class_filter, trade_values, is_cnh_trade)
+        return self.get_upi_source().iter_records(*partition)
+    
+    def get_candidate_partition(self, asset_class_filter, trade_values, is_cnh_trade, product=None):
+        """Pick the (AssetClass, UseCase, InstrumentType) partition a trade is scored against"""
+        upi_source = self.get_upi_source()
+        product_filter = product or self.product_type.get()
         
         if is_cnh_trade and asset_class_filter == "Foreign_Exchange":
             # CNH Special Handling: Look for Non_Standard UPIs first
             instrument_type = trade_values.get("InstrumentType", "").strip()
             
             # First priority: Non_Standard UPIs matching the instrument type
-            non_standard_upis = []
-            for upi in self.upi_data:
-                header = upi.get("Header", {})
-                if (header.get("AssetClass") == asset_class_filter and 
-                    header.get("UseCase") == "Non_Standard" and
-                    header.get("InstrumentType") == instrument_type):
-                    non_standard_upis.append(upi)
-            
-            if non_standard_upis:
-                relevant_upis.extend(non_standard_upis)
-            else:
-                # Fallback: If no Non_Standard UPIs, use regular product-specific UPIs
-                product_filter = self.product_type.get()
-                for upi in self.upi_data:
-                    header = upi.get("Header", {})
-                    if (header.get("AssetClass") == asset_class_filter and 
-                        header.get("UseCase") == product_filter):
-                        relevant_upis.append(upi)
-        else:
-            # Regular handling: Use product-specific UPIs
-            product_filter = self.product_type.get()
-            for upi in self.upi_data:
-                header = upi.get("Header", {})
-                if (header.get("AssetClass") == asset_class_filter and 
-                    header.get("UseCase") == product_filter):
-                    relevant_upis.append(upi)
-        
-        return relevant_upis
-    
-    def calculate_upi_score(self, trade, mapping, upi):
-        """Calculate matching score between trade and UPI"""
-        score = 0
-        max_score = 0
+            if upi_source.has_records(asset_class_filter, "Non_Standard", instrument_type):
+                return (asset_class_filter, "Non_Standard", instrument_type)
+            
+            # Fallback: If no Non_Standard UPIs, use regular product-specific UPIs
         
-        # Get UPI attributes
-        attributes = upi.get("Attributes", {})
+        # Regular handling: Use product-specific UPIs
+        return (asset_class_filter, product_filter, None)
+    
+    def get_partition_value_sets(self, partition):
+        """Distinct attribute values of a partition, collected on first use"""
+        value_sets = self.partition_value_sets.get(partition)
+        if value_sets is None:
+            value_sets = AttributeValueSets(self.get_upi_source().iter_records(*partition))
+            self.partition_value_sets[partition] = value_sets
+        return value_sets
+    
+    def can_match_partition(self, trade, mapping, partition):
+        """Check whether any mapped trade value could score against a record of the partition"""
+        value_sets = self.get_partition_value_sets(partition)
+        if value_sets.record_count == 0:
+            return True  # Let the search report the empty partition
+        
+        # Same trade values as calculate_upi_score
+        for field_name, trade_str in self.get_scored_trade_values(trade, mapping):
+            upi_values = value_sets.get_values(field_name)
+            if not upi_values:
+                continue
+            
+            cache_key = (field_name, trade_str)
+            can_score = value_sets.cache.get(cache_key)
+            if can_score is None:
+                can_score = self.field_can_score(field_name, trade_str, upi_values)
+                value_sets.cache[cache_key] = can_score
+            if can_score:
+                return True
         
-        # Score each mapped field
+        return False
+    
+    def get_scored_trade_values(self, trade, mapping):
+        """(field, normalized trade value) pairs of the mapped fields a trade is scored on
+        
+        The one extractor behind scoring, the negative lookup and the exact match,
+        so the three always see the same values.
+        """
+        trade_values = []
         for field_name, mapping_info in mapping.items():
             method = mapping_info["method"]
             value = mapping_info["value"]
             
             if method == "manual":
-                # Use manual input value
                 if not value or value.strip() == "":
                     continue
                 trade_value = value.strip()
             else:  # column mapping
-                column_name = value
-                if column_name == "N/A" or column_name not in trade:
+                if value == "N/A" or value not in trade:
                     continue
-                
-                trade_value = trade[column_name]
+                trade_value = trade[value]
                 if pd.isna(trade_value) or trade_value == "":
                     continue
             
+            trade_values.append((field_name, str(trade_value).strip().upper()))
+        return trade_values
+    
+    def find_exact_match(self, trade, mapping, partition):
+        """The one UPI of the partition equal to the trade on every mapped field, or None"""
+        trade_values = self.get_scored_trade_values(trade, mapping)
+        if not trade_values:
+            return None
+        
+        # One index per partition and set of mapped fields, built on first use
+        fields = tuple(field_name for field_name, _ in trade_values)
+        index = self.exact_match_indexes.get((partition, fields))
+        if index is None:
+            index = ExactMatchIndex(self.get_upi_source().iter_records(*partition), fields)
+            self.exact_match_indexes[(partition, fields)] = index
+        
+        return index.lookup(tuple(trade_str for _, trade_str in trade_values))
+    
+    def field_can_score(self, field_name, trade_str, upi_values):
+        """Check whether calculate_field_score is non-zero for trade_str and any of the UPI values"""
+        # Exact match (also covers the currency code and instrument type rules)
+        if trade_str in upi_values:
+            return True
+        
+        if field_name in ["DeliveryType"]:
+            if "CASH" in trade_str and any("CASH" in upi_str for upi_str in upi_values):
+                return True
+            if "PHYS" in trade_str and any("PHYS" in upi_str for upi_str in upi_values):
+                return True
+        
+        if "ReferenceRate" in field_name:
+            if self.reference_rate_index is not None:
+                # Values indexed as matching the trade string, then any the index does not hold
+                if not self.reference_rate_index.matches(trade_str).isdisjoint(upi_values):
+                    return True
+                indexed = self.reference_rate_index.values
+                upi_values = [upi_str for upi_str in upi_values if upi_str not in indexed]
+            if any(trade_str in upi_str or upi_str in trade_str for upi_str in upi_values):
+                return True
+        
+        if field_name == "PlaceofSettlement":
+            if ("CHINA" in trade_str or "HONG KONG" in trade_str) and any(
+                "CHINA" in upi_str or "HONG KONG" in upi_str for upi_str in upi_values
+            ):
+                return True
+        
+        return False
+    
+    def get_reference_rate_matches(self, trade, mapping):
+        """Indexed reference-rate values matching each mapped ReferenceRate field of a trade
+        
+        Looked up once per trade, so scoring a candidate is a set lookup instead
+        of a substring test. None when no index is loaded.
+        """
+        if self.reference_rate_index is None:
+            return None
+        return {
+            field_name: self.reference_rate_index.matches(trade_str)
+            for field_name, trade_str in self.get_scored_trade_values(trade, mapping)
+            if "ReferenceRate" in field_name
+        }
+    
+    def calculate_upi_score(self, trade, mapping, upi, reference_matches=None, trade_values=None):
+        """Calculate matching score between trade and UPI
+        
+        reference_matches (from get_reference_rate_matches) answers the
+        ReferenceRate partial-match rule for the trade's values. trade_values
+        (from get_scored_trade_values) saves extracting them again per candidate.
+        """
+        score = 0
+        max_score = 0
+        
+        # Get UPI attributes
+        attributes = upi.get("Attributes", {})
+        
+        # Score each mapped field
+        if trade_values is None:
+            trade_values = self.get_scored_trade_values(trade, mapping)
+        for field_name, trade_str in trade_values:
             # Get UPI value for this field
             upi_value = attributes.get(field_name)
             if upi_value is None:
                 continue
             
             # Calculate field score
-            field_score = self.calculate_field_score(field_name, trade_value, upi_value)
+            field_score = self.calculate_field_score(field_name, trade_str, upi_value, reference_matches)
             score += field_score
             max_score += self.get_field_weight(field_name)
         
         # Return percentage score
         return int((score / max_score * 100)) if max_score > 0 else 0
     
-    def calculate_field_score(self, field_name, trade_value, upi_value):
+    def calculate_field_score(self, field_name, trade_value, upi_value, reference_matches=None):
         """Calculate score for a specific field match"""
         weight = self.get_field_weight(field_name)
         
@@ -956,9 +1917,14 @@ class UPISearchTool:
             if len(trade_str) == 3 and len(upi_str) == 3 and trade_str == upi_str:
                 return weight
         
-        # Reference rate partial matches
+        # Reference rate partial matches (containment answered by the n-gram index when loaded)
         if "ReferenceRate" in field_name:
-            if trade_str in upi_str or upi_str in trade_str:
+            matched = reference_matches.get(field_name) if reference_matches else None
+            if matched is not None and upi_str in self.reference_rate_index.values:
+                # Indexed value - matched once for the whole trade
+                if upi_str in matched:
+                    return weight * 0.7
+            elif trade_str in upi_str or upi_str in trade_str:
                 return weight * 0.7
         
         # Instrument type matches
@@ -999,80 +1965,189 @@ class UPISearchTool:
         return weights.get(field_name, 5)
     
     def display_results(self):
+        """Show the search summary and the first page of the results table"""
+        # Summary statistics (straight from the compact result columns)
+        matched_count = self.results.matched_count()
+        avg_score = sum(self.results.scores) / len(self.results) if self.results else 0
+        multiple_matches_count = sum(1 for count in self.results.candidate_counts if count > 1)
+        
+        self.results_summary.set(
+            f"{self.describe_products()} | "
+            f"Total Trades Processed: {len(self.results)}\n"
+            f"Matches Found: {matched_count}/{len(self.results)} | "
+            f"Average Match Score: {avg_score:.1f}% | "
+            f"Trades with Multiple Candidate UPIs: {multiple_matches_count}"
+        )
+        
+        self.apply_results_view()
+    
+    def clear_results_view(self):
+        """Empty the results table and details before a new search"""
+        self.results_view = []
+        self.results_page = 0
+        self.trade_id_column = next((col for col in self.trade_data.columns if "id" in str(col).lower()), None)
+        self.results_tree.delete(*self.results_tree.get_children())
         self.results_text.delete(1.0, tk.END)
+        self.update_results_page_label()
+    
+    def get_results_min_score(self):
+        """Minimum score from the filter box (0 if not a number)"""
+        try:
+            return float(self.results_min_score.get())
+        except (TypeError, ValueError):
+            return 0
+    
+    def result_passes_filter(self, index, status_filter, min_score):
+        """Check a result against the status and score filters using the compact columns"""
+        if self.results.scores[index] < min_score:
+            return False
+        if status_filter == "Matched":
+            return self.results.best_upis[index] != CompactResults.NO_UPI
+        if status_filter == "No Match":
+            return self.results.best_upis[index] == CompactResults.NO_UPI
+        if status_filter == "Multiple Candidates":
+            return self.results.candidate_counts[index] > 1
+        return True
+    
+    def apply_results_view(self):
+        """Rebuild the filtered and sorted list of result positions, then show its first page"""
+        status_filter = self.results_status_filter.get()
+        min_score = self.get_results_min_score()
+        
+        view = [index for index in range(len(self.results)) if self.result_passes_filter(index, status_filter, min_score)]
+        
+        sort_order = self.results_sort.get()
+        if sort_order == "Score (High to Low)":
+            view.sort(key=self.results.scores.__getitem__, reverse=True)
+        elif sort_order == "Score (Low to High)":
+            view.sort(key=self.results.scores.__getitem__)
+        
+        self.results_view = view
+        self.results_page = 0
+        self.render_results_page()
+    
+    def stream_result(self, index):
+        """Add a newly stored result to the table if the current view takes it"""
+        # Sorted views are rebuilt when the search finishes
+        if self.results_sort.get() != "Trade Order":
+            return
+        if not self.result_passes_filter(index, self.results_status_filter.get(), self.get_results_min_score()):
+            return
         
-        # Write header
-        self.results_text.insert(tk.END, "UPI Search Results\n")
-        self.results_text.insert(tk.END, "=" * 100 + "\n\n")
-        self.results_text.insert(tk.END, f"Asset Class: {self.asset_class.get()} | Product: {self.product_type.get()}\n")
-        self.results_text.insert(tk.END, f"Total Trades Processed: {len(self.results)}\n\n")
-        
-        # Summary statistics
-        matched_count = sum(1 for r in self.results if r["MatchedUPI"] is not None)
-        avg_score = sum(r["Score"] for r in self.results) / len(self.results) if self.results else 0
-        multiple_matches_count = sum(1 for r in self.results if len(r.get("AllMatches", [])) > 1)
-        
-        self.results_text.insert(tk.END, f"Matches Found: {matched_count}/{len(self.results)}\n")
-        self.results_text.insert(tk.END, f"Average Match Score: {avg_score:.1f}%\n")
-        self.results_text.insert(tk.END, f"Trades with Multiple Candidate UPIs: {multiple_matches_count}\n")
-        self.results_text.insert(tk.END, "=" * 100 + "\n\n")
-        
-        # Display results for each trade
-        for i, result in enumerate(self.results):
-            trade_details = result["TradeDetails"]
-            matched_upi = result["MatchedUPI"]
-            score = result["Score"]
-            message = result["Message"]
-            all_matches = result.get("AllMatches", [])
-            
-            # Trade details
-            self.results_text.insert(tk.END, f"Trade {i+1}:\n")
-            
-            # Get trade ID if available
-            trade_id = next((trade_details[col] for col in trade_details if "id" in col.lower()), f"Trade {i+1}")
-            self.results_text.insert(tk.END, f"Trade ID: {trade_id}\n")
-            
-            # Display key trade details (only non-empty values)
-            self.results_text.insert(tk.END, "Key Trade Details:\n")
-            for key, value in trade_details.items():
-                if value and pd.notna(value) and str(value).strip():
+        self.results_view.append(index)
+        if (len(self.results_view) - 1) // RESULTS_PAGE_SIZE == self.results_page:
+            self.insert_result_row(index)
+        self.update_results_page_label()
+    
+    def get_results_page_count(self):
+        """Number of pages in the current view"""
+        return max(1, (len(self.results_view) + RESULTS_PAGE_SIZE - 1) // RESULTS_PAGE_SIZE)
+    
+    def update_results_page_label(self):
+        self.results_page_label.set(
+            f"Page {self.results_page + 1} of {self.get_results_page_count()} ({len(self.results_view)} trades shown)"
+        )
+    
+    def change_results_page(self, step):
+        """Move to the previous or next page of results"""
+        page = min(max(self.results_page + step, 0), self.get_results_page_count() - 1)
+        if page != self.results_page:
+            self.results_page = page
+            self.render_results_page()
+    
+    def render_results_page(self):
+        """Insert only the rows of the current page into the table"""
+        self.results_tree.delete(*self.results_tree.get_children())
+        
+        start = self.results_page * RESULTS_PAGE_SIZE
+        for index in self.results_view[start:start + RESULTS_PAGE_SIZE]:
+            self.insert_result_row(index)
+        
+        self.update_results_page_label()
+    
+    def insert_result_row(self, index):
+        """Insert one result row, keyed by its result position"""
+        trade_row = self.results.trade_row(index)
+        if self.trade_id_column is not None:
+            trade_id = self.trade_data[self.trade_id_column].iat[trade_row]
+        else:
+            trade_id = f"Trade {index + 1}"
+        
+        self.results_tree.insert('', tk.END, iid=str(index), values=(
+            index + 1,
+            trade_id,
+            f"{self.results.score(index)}%",
+            self.results.best_upi(index) or "",
+            self.results.candidate_count(index),
+            self.results.message(index),
+        ))
+    
+    def show_selected_result(self, event=None):
+        """Show the full details of the selected trade"""
+        selection = self.results_tree.selection()
+        if not selection:
+            return
+        
+        index = int(selection[0])
+        self.results_text.delete(1.0, tk.END)
+        self.write_result_details(index, self.results[index])
+    
+    def write_result_details(self, i, result):
+        """Write trade details, candidates and UPI attributes of one result"""
+        trade_details = result["TradeDetails"]
+        matched_upi = result["MatchedUPI"]
+        score = result["Score"]
+        message = result["Message"]
+        all_matches = result.get("AllMatches", [])
+        candidate_count = result["CandidateCount"]
+        
+        # Trade details
+        self.results_text.insert(tk.END, f"Trade {i+1}:\n")
+        
+        # Get trade ID if available
+        trade_id = next((trade_details[col] for col in trade_details if "id" in col.lower()), f"Trade {i+1}")
+        self.results_text.insert(tk.END, f"Trade ID: {trade_id}\n")
+        
+        # Display key trade details (only non-empty values)
+        self.results_text.insert(tk.END, "Key Trade Details:\n")
+        for key, value in trade_details.items():
+            if value and pd.notna(value) and str(value).strip():
+                self.results_text.insert(tk.END, f"  - {key}: {value}\n")
+        
+        # UPI match result
+        self.results_text.insert(tk.END, f"Match Score: {score}%\n")
+        self.results_text.insert(tk.END, f"Status: {message}\n")
+        if result["UPIVersion"]:
+            self.results_text.insert(tk.END, f"UPI Data Version: {result['UPIVersion']}\n")
+        
+        # Show multiple matches if available
+        if candidate_count > 1:
+            self.results_text.insert(tk.END, f"Alternative UPI Candidates ({candidate_count} total):\n")
+            for j, match in enumerate(all_matches[:3]):  # Show top 3 matches
+                upi_code = match["upi"].get("Identifier", {}).get("UPI", "N/A")
+                match_score = match["score"]
+                self.results_text.insert(tk.END, f"  {j+1}. UPI: {upi_code} (Score: {match_score}%)\n")
+            if candidate_count > 3:
+                self.results_text.insert(tk.END, f"  ... and {candidate_count - 3} more candidates\n")
+        
+        if matched_upi:
+            identifier = matched_upi.get("Identifier", {})
+            attributes = matched_upi.get("Attributes", {})
+            derived = matched_upi.get("Derived", {})
+            
+            self.results_text.insert(tk.END, f"Selected UPI Code: {identifier.get('UPI', 'N/A')}\n")
+            self.results_text.insert(tk.END, "UPI Details:\n")
+            
+            # Display key UPI attributes
+            for key, value in attributes.items():
+                if value:
                     self.results_text.insert(tk.END, f"  - {key}: {value}\n")
             
-            # UPI match result
-            self.results_text.insert(tk.END, f"Match Score: {score}%\n")
-            self.results_text.insert(tk.END, f"Status: {message}\n")
-            
-            # Show multiple matches if available
-            if len(all_matches) > 1:
-                self.results_text.insert(tk.END, f"Alternative UPI Candidates ({len(all_matches)} total):\n")
-                for j, match in enumerate(all_matches[:3]):  # Show top 3 matches
-                    upi_code = match["upi"].get("Identifier", {}).get("UPI", "N/A")
-                    match_score = match["score"]
-                    self.results_text.insert(tk.END, f"  {j+1}. UPI: {upi_code} (Score: {match_score}%)\n")
-                if len(all_matches) > 3:
-                    self.results_text.insert(tk.END, f"  ... and {len(all_matches) - 3} more candidates\n")
-            
-            if matched_upi:
-                identifier = matched_upi.get("Identifier", {})
-                attributes = matched_upi.get("Attributes", {})
-                derived = matched_upi.get("Derived", {})
-                
-                self.results_text.insert(tk.END, f"Selected UPI Code: {identifier.get('UPI', 'N/A')}\n")
-                self.results_text.insert(tk.END, "UPI Details:\n")
-                
-                # Display key UPI attributes
-                for key, value in attributes.items():
-                    if value:
-                        self.results_text.insert(tk.END, f"  - {key}: {value}\n")
-                
-                # Display some derived attributes
-                if derived.get("ShortName"):
-                    self.results_text.insert(tk.END, f"  - Short Name: {derived.get('ShortName')}\n")
-                if derived.get("UnderlierName"):
-                    self.results_text.insert(tk.END, f"  - Underlier Name: {derived.get('UnderlierName')}\n")
-            
-            # Separator between trades
-            self.results_text.insert(tk.END, "\n" + "-" * 100 + "\n\n")
+            # Display some derived attributes
+            if derived.get("ShortName"):
+                self.results_text.insert(tk.END, f"  - Short Name: {derived.get('ShortName')}\n")
+            if derived.get("UnderlierName"):
+                self.results_text.insert(tk.END, f"  - Underlier Name: {derived.get('UnderlierName')}\n")
     
     def export_results(self):
         if not self.results:
@@ -1106,9 +2181,11 @@ class UPISearchTool:
                 # Add UPI match details
                 row["Match_Score"] = result["Score"]
                 row["Match_Message"] = result["Message"]
-                row["Asset_Class"] = self.asset_class.get()
-                row["Product_Type"] = self.product_type.get()
-                row["Total_Candidate_UPIs"] = len(all_matches)
+                row["Asset_Class"] = result["AssetClass"]
+                row["Product_Type"] = result["ProductType"]
+                row["Total_Candidate_UPIs"] = result["CandidateCount"]
+                row["Partial_Result"] = result["Partial"]
+                row["UPI_Data_Version"] = result["UPIVersion"]
                 
                 if matched_upi:
                     identifier = matched_upi.get("Identifier", {})
@@ -1141,7 +2218,13 @@ class UPISearchTool:
             df = pd.DataFrame(export_data)
             df.to_excel(file_path, index=False)
             
-            messagebox.showinfo("Export Results", f"Results exported successfully to {file_path}")
+            # Latency histograms and slow trades of the search, next to the workbook
+            export_base = os.path.splitext(file_path)[0]
+            self.latency.write_json(f"{export_base}.metrics.json")
+            self.latency.write_slow_trades(f"{export_base}.slow_trades.jsonl")
+            
+            messagebox.showinfo("Export Results", f"Results exported successfully to {file_path}\n"
+                                f"Search metrics: {export_base}.metrics.json")
         
         except Exception as e:
             messagebox.showerror("Export Error", f"Error exporting results: {str(e)}")
@@ -0,0 +1,234 @@
+import os
+import json
+import pickle
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Schema metadata key holding the source signature of an Arrow sidecar
+SOURCE_METADATA_KEY = b"upi_trade_source"
+
+def trade_cache_paths(workbook_path):
+    """Sidecar paths of a workbook: the Arrow IPC file and the pickle fallback"""
+    base = os.path.splitext(workbook_path)[0]
+    return base + ".trades.arrow", base + ".trades.pkl"
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def workbook_signature(workbook_path, stat=None):
+    """Identify a workbook by size, modification time and content hash"""
+    stat = stat or os.stat(workbook_path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": _file_sha256(workbook_path)}
+
+def _signature_matches(cached, workbook_path):
+    """Compare a cached signature with the workbook - the hash is only computed when size and mtime agree"""
+    if not isinstance(cached, dict):
+        return False
+    stat = os.stat(workbook_path)
+    if cached.get("size") != stat.st_size or cached.get("mtime") != stat.st_mtime:
+        return False
+    return cached == workbook_signature(workbook_path, stat)
+
+def _restore_missing_values(df):
+    # Arrow hands empty cells of text columns back as None; read_excel gives NaN
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].where(df[column].notna(), np.nan)
+    return df
+
+def _read_arrow_sidecar(cache_path, workbook_path):
+    import pyarrow as pa
+
+    # The file is memory-mapped, so only the columns' buffers are paged in
+    with pa.memory_map(cache_path, 'r') as source:
+        reader = pa.ipc.open_file(source)
+        metadata = reader.schema.metadata or {}
+        if SOURCE_METADATA_KEY not in metadata:
+            return None
+        if not _signature_matches(json.loads(metadata[SOURCE_METADATA_KEY]), workbook_path):
+            return None
+        df = reader.read_all().to_pandas()
+    return _restore_missing_values(df)
+
+def _read_pickle_sidecar(cache_path, workbook_path):
+    with open(cache_path, 'rb') as f:
+        # Signature first, so a stale sidecar is rejected without loading its data
+        if not _signature_matches(pickle.load(f), workbook_path):
+            return None
+        return pickle.load(f)
+
+def _write_arrow_sidecar(cache_path, df, signature):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    metadata = dict(table.schema.metadata or {})
+    metadata[SOURCE_METADATA_KEY] = json.dumps(signature).encode('utf-8')
+    table = table.replace_schema_metadata(metadata)
+
+    temp_path = cache_path + ".tmp"
+    with pa.OSFile(temp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temp_path, cache_path)
+
+def _write_pickle_sidecar(cache_path, df, signature):
+    temp_path = cache_path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        pickle.dump(signature, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, cache_path)
+
+def read_cached_trades(workbook_path):
+    """Trade data from a current sidecar of the workbook, or None"""
+    arrow_path, pickle_path = trade_cache_paths(workbook_path)
+    for cache_path, reader in [(arrow_path, _read_arrow_sidecar), (pickle_path, _read_pickle_sidecar)]:
+        if not os.path.exists(cache_path):
+            continue
+        try:
+            df = reader(cache_path, workbook_path)
+            if df is not None:
+                return df
+        except Exception as e:
+            print(f"Ignoring unreadable trade cache {cache_path}: {str(e)}")
+    return None
+
+def write_trade_cache(workbook_path, df):
+    """Write the trade data to a sidecar next to the workbook; return the sidecar path or None
+
+    Arrow IPC is used when pyarrow is installed and every column converts;
+    otherwise the DataFrame is pickled. Any sidecar left from an older
+    version of the workbook is removed.
+    """
+    arrow_path, pickle_path = trade_cache_paths(workbook_path)
+    signature = workbook_signature(workbook_path)
+
+    written = None
+    try:
+        import pyarrow  # noqa: F401 - optional, enables the memory-mapped Arrow sidecar
+        _write_arrow_sidecar(arrow_path, df, signature)
+        written = arrow_path
+    except ImportError:
+        pass
+    except Exception as e:
+        # e.g. a column mixing numbers and text, which Arrow cannot type
+        print(f"Arrow trade cache not written ({str(e)}), using pickle instead")
+
+    try:
+        if written is None:
+            _write_pickle_sidecar(pickle_path, df, signature)
+            written = pickle_path
+    except OSError as e:
+        print(f"Trade cache not written: {str(e)}")
+        return None
+
+    # Only one sidecar per workbook
+    for cache_path in [arrow_path, pickle_path]:
+        if cache_path != written and os.path.exists(cache_path):
+            os.remove(cache_path)
+    return written
+
+def read_trade_workbook(workbook_path, use_cache=True):
+    """Read a trade workbook, through its columnar sidecar cache when it is current
+
+    The first load reads the workbook with pandas and writes the sidecar; later
+    loads of the unchanged workbook (same size, mtime and hash) read the sidecar.
+    """
+    if not use_cache:
+        return pd.read_excel(workbook_path)
+
+    df = read_cached_trades(workbook_path)
+    if df is not None:
+        print(f"Loaded trade data from cache for {os.path.basename(workbook_path)}")
+        return df
+
+    df = pd.read_excel(workbook_path)
+    write_trade_cache(workbook_path, df)
+    return df
+
+def _convert_cell(cell):
+    # As read_excel's openpyxl reader: empty cells are "", error cells NaN, whole numbers int
+    if cell.value is None:
+        return ""
+    if cell.data_type == 'e':
+        return np.nan
+    if cell.data_type == 'n':
+        value = int(cell.value)
+        return value if value == cell.value else float(cell.value)
+    return cell.value
+
+def _parse_rows(header, rows, start):
+    from pandas.io.parsers import TextParser
+
+    # pandas' own parser, so blanks and "NA"-style markers become NaN as with read_excel
+    width = len(header)
+    data = [header] + [row + [""] * (width - len(row)) for row in rows]
+    df = TextParser(data, header=0, skip_blank_lines=False).read()
+    df.index = pd.RangeIndex(start, start + len(df))
+    return df
+
+def iter_workbook_chunks(workbook_path, chunk_size):
+    """Read the first sheet of a workbook as DataFrames of chunk_size rows, while it is being read
+
+    Cells are converted and parsed as read_excel does, but column types are
+    inferred per chunk: a whole-number column with empty cells in some chunks
+    only is read as integers in the other chunks.
+    """
+    from openpyxl import load_workbook
+
+    book = load_workbook(workbook_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = book.worksheets[0]
+        sheet.reset_dimensions()
+        header = None
+        rows = []
+        blank_rows = []
+        start = 0
+        for cells in sheet.rows:
+            row = [_convert_cell(cell) for cell in cells]
+            while row and row[-1] == "":
+                row.pop()
+            if header is None:
+                if row:
+                    header = row
+                continue
+            if not row:
+                # Empty rows are only kept when more data follows, as read_excel trims trailing ones
+                blank_rows.append(row)
+                continue
+            rows.extend(blank_rows)
+            blank_rows = []
+            rows.append(row)
+            if len(rows) >= chunk_size:
+                yield _parse_rows(header, rows[:chunk_size], start)
+                start += chunk_size
+                rows = rows[chunk_size:]
+        if rows:
+            yield _parse_rows(header, rows, start)
+    finally:
+        book.close()
+
+def iter_trade_workbook(workbook_path, chunk_size, use_cache=True):
+    """Trade data of a workbook in chunks - sliced from a current sidecar, or streamed from the workbook
+
+    A streamed workbook's sidecar is written once its last chunk has been read.
+    """
+    if use_cache:
+        df = read_cached_trades(workbook_path)
+        if df is not None:
+            print(f"Loaded trade data from cache for {os.path.basename(workbook_path)}")
+            for chunk_start in range(0, len(df), chunk_size):
+                yield df.iloc[chunk_start:chunk_start + chunk_size]
+            return
+
+    chunks = []
+    for chunk in iter_workbook_chunks(workbook_path, chunk_size):
+        if use_cache:
+            chunks.append(chunk)
+        yield chunk
+    if chunks:
+        write_trade_cache(workbook_path, pd.concat(chunks))